@@ -1,12 +1,23 @@
 # app/api/routes.py
 from __future__ import annotations
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
-from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Iterator, Optional
+import asyncio
+import hmac
+import json
 import uuid
 
-from app.core.orchestrator import Orchestrator
+from app.core.orchestrator import Orchestrator, ingest_pdf
+from app.core.session_manager import (
+    sessions,
+    new_session_id,
+    valid_session_id,
+    SESSION_COOKIE,
+    SESSION_HEADER,
+)
+from app.core import metrics
 from app.core.email_service import (
     send_manager_email,
     build_lead_subject,
@@ -14,10 +25,40 @@ from app.core.email_service import (
     MANAGER_EMAIL,
 )
 from app.core.pdf_service import extract_pdf_text, extract_topics_heuristic
-from app.core.web_service import extract_main_text
+from app.core.web_service import extract_main_text_async
+from app.core.async_io import run_in_process, run_in_thread
+from app.core.knowledge_base import get_kb, content_sha, KB_ADMIN_TOKEN
+from app.core.jobs import ingest_jobs, INGEST_BACKGROUND, QueueFull
+from app.core.compare_service import LABELS, COMPARE_MAX_PRODUCTS
 
 router = APIRouter()
-orch = Orchestrator()
+
+
+def session_id(request: Request) -> str:
+    """Per-visitor session id (set by the middleware in app.main)."""
+    sid = getattr(request.state, "session_id", None) \
+        or request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    return sid if valid_session_id(sid) else new_session_id()
+
+
+def session_orch(sid: str = Depends(session_id)) -> Iterator[Orchestrator]:
+    """The session's Orchestrator, kept in memory until the handler returns.
+
+    Yield dependencies exit before a StreamingResponse body runs, so streaming
+    routes take session_id and hold the session inside the body instead.
+    """
+    with sessions.use(sid) as orch:
+        yield orch
+
+
+def is_admin(request: Request) -> bool:
+    token = request.headers.get("X-Admin-Token") or ""
+    return bool(KB_ADMIN_TOKEN) and hmac.compare_digest(token.encode(), KB_ADMIN_TOKEN.encode())
+
+
+def require_admin(request: Request):
+    if not is_admin(request):
+        raise HTTPException(status_code=403, detail="Admin token required")
 
 
 def ok(data) -> JSONResponse:
@@ -31,28 +72,87 @@ async def init_topic(
     url: Optional[str] = Form(None),
     rag_enabled: Optional[bool] = Form(True),
     ocr_mode: str = Form("auto"),
+    doc_ids: Optional[str] = Form(None),
+    wait: Optional[bool] = Form(None),
     pdf: UploadFile | None = File(None),
+    orch: Orchestrator = Depends(session_orch),
 ):
     try:
         pdf_bytes = await pdf.read() if pdf else None
+        # PDFs ingest in a background job unless the client asks to wait
+        background = INGEST_BACKGROUND if wait is None else not wait
         result = await orch.init_topic(
             pdf_bytes=pdf_bytes,
             url=url,
             product_name=product_name,
             rag_enabled=rag_enabled,
             ocr_mode=ocr_mode,
+            filename=pdf.filename if pdf else None,
+            doc_ids=[d.strip() for d in (doc_ids or "").split(",") if d.strip()],
+            background=background,
         )
         # Back-compat meta for your sidebar
         meta = {"source": result["topic"].get("meta", {}).get("source", "manual")}
         if pdf and pdf.filename:
             meta.update({"filename": pdf.filename})
-        return ok({"primary": result["topic"]["primary"], "meta": meta})
+        meta["doc_ids"] = result["topic"].get("meta", {}).get("doc_ids", [])
+        return ok({
+            "primary": result["topic"]["primary"],
+            "meta": meta,
+            "index_status": result["index_status"],
+            "job_id": result.get("job_id"),
+        })
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Progress of a background ingestion job: stage, pages_done / pages_total, eta_seconds."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return ok(job.to_dict())
+
+
+# ---------- Topic documents (incremental index updates) ----------
+@router.post("/api/topic/documents")
+async def topic_add_documents(
+    doc_ids: Optional[str] = Form(None),
+    ocr_mode: str = Form("auto"),
+    pdf: UploadFile | None = File(None),
+    orch: Orchestrator = Depends(session_orch),
+):
+    """Add a PDF and/or stored documents to the current topic without re-indexing the others."""
+    try:
+        pdf_bytes = await pdf.read() if pdf else None
+        ids = [d.strip() for d in (doc_ids or "").split(",") if d.strip()]
+        if not pdf_bytes and not ids:
+            raise HTTPException(status_code=400, detail="Provide a pdf or doc_ids")
+        return ok(await orch.add_documents(
+            pdf_bytes=pdf_bytes,
+            filename=pdf.filename if pdf else None,
+            ocr_mode=ocr_mode,
+            doc_ids=ids,
+        ))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/api/topic/documents/{doc_id}")
+async def topic_remove_document(doc_id: str, orch: Orchestrator = Depends(session_orch)):
+    try:
+        return ok(await orch.remove_document(doc_id))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/api/ask")
-async def ask(question: str = Form(...)):
+async def ask(question: str = Form(...), orch: Orchestrator = Depends(session_orch)):
     try:
         result = await orch.answer_dual(question)
         # Back-compat flattening for existing frontend: expose final answer & sources
@@ -67,8 +167,40 @@ async def ask(question: str = Form(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ---------- Streaming ask (Server-Sent Events) ----------
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _ask_stream_response(sid: str, question: str) -> StreamingResponse:
+    async def events():
+        try:
+            async with sessions.use_async(sid) as orch:
+                async for event, data in orch.answer_dual_stream(question):
+                    yield _sse(event, data)
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/api/ask/stream")
+async def ask_stream(question: str = Form(...), sid: str = Depends(session_id)):
+    return _ask_stream_response(sid, question)
+
+
+@router.get("/api/ask/stream")
+async def ask_stream_get(question: str, sid: str = Depends(session_id)):
+    """Same as POST, for EventSource clients."""
+    return _ask_stream_response(sid, question)
+
+
 @router.get("/api/history")
-async def history():
+async def history(orch: Orchestrator = Depends(session_orch)):
     try:
         return ok(orch.get_history())
     except Exception as e:
@@ -76,18 +208,78 @@ async def history():
 
 
 @router.post("/api/clear")
-async def clear():
+async def clear(orch: Orchestrator = Depends(session_orch)):
     try:
         return ok(orch.clear())
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ---------- Knowledge base (shared documents + each session's own uploads) ----------
+@router.get("/api/kb")
+async def kb_documents(request: Request, orch: Orchestrator = Depends(session_orch)):
+    """Documents this session may attach; with the admin token, every document plus store stats."""
+    try:
+        kb = get_kb()
+        if is_admin(request):
+            return ok({"documents": kb.documents(), "stats": kb.stats()})
+        return ok({"documents": kb.visible_documents(orch.owner)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/api/kb/ingest", dependencies=[Depends(require_admin)])
+async def kb_ingest(
+    url: Optional[str] = Form(None),
+    title: Optional[str] = Form(None),
+    pdf: UploadFile | None = File(None),
+):
+    """Add a shared document (visible to every session)."""
+    try:
+        if pdf:
+            data = await pdf.read()
+            doc = get_kb().find(content_sha(data))
+            if doc is None:
+                doc, _ = await ingest_pdf(data, title or pdf.filename)
+        elif url:
+            text = await extract_main_text_async(url) or ""
+            doc = await run_in_thread(get_kb().add_document, text, "url", title or url)
+        else:
+            raise HTTPException(status_code=400, detail="Provide a pdf or a url")
+        if not doc:
+            raise HTTPException(status_code=422, detail="No text could be extracted")
+        return ok(doc)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/api/kb/{doc_id}", dependencies=[Depends(require_admin)])
+async def kb_delete(doc_id: str):
+    try:
+        removed = await run_in_thread(get_kb().delete, [doc_id])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not removed:
+        raise HTTPException(status_code=404, detail="Unknown document")
+    return ok({"deleted": doc_id})
+
+
+# ---------- Metrics (model load times, memory, caches) ----------
+@router.get("/api/metrics")
+async def get_metrics():
+    try:
+        return ok(metrics.snapshot())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ---------- NEW: toggle RAG ----------
 @router.post("/api/rag")
-async def rag_toggle(enabled: str = Form(...)):
+async def rag_toggle(enabled: str = Form(...), orch: Orchestrator = Depends(session_orch)):
     try:
-        state = orch.set_rag(enabled.lower() in ("1", "true", "yes", "on"))
+        state = await orch.set_rag(enabled.lower() in ("1", "true", "yes", "on"))
         return ok(state)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -133,36 +325,50 @@ async def sales_send(subject: str = Form(...), body: str = Form(...)):
 # ---------- Feature 3: Comparison Mode (CSE-only) ----------
 @router.post("/api/compare/init-topic")
 async def compare_init(
+    request: Request,
     a_name: Optional[str] = Form(None),
     a_url: Optional[str] = Form(None),
     a_pdf: UploadFile | None = File(None),
     b_name: Optional[str] = Form(None),
     b_url: Optional[str] = Form(None),
     b_pdf: UploadFile | None = File(None),
+    orch: Orchestrator = Depends(session_orch),
 ):
+    """
+    Products A, B and optionally C, D, ... (c_name / c_url / c_pdf and so on,
+    up to COMPARE_MAX_PRODUCTS). All candidates are parsed / scraped concurrently.
+    """
     try:
-        a_bytes = await a_pdf.read() if a_pdf else None
-        b_bytes = await b_pdf.read() if b_pdf else None
+        form = await request.form()
+        fields = [(a_name, a_url, a_pdf), (b_name, b_url, b_pdf)]
+        for label in LABELS[2:COMPARE_MAX_PRODUCTS].lower():
+            extra = (form.get(f"{label}_name"), form.get(f"{label}_url"), form.get(f"{label}_pdf"))
+            if any(extra):
+                fields.append(extra)
 
-        def make_topic(name, url, bytes_):
+        async def make_topic(name, url, pdf):
+            bytes_ = await pdf.read() if pdf and hasattr(pdf, "read") else None
             if bytes_:
-                txt = extract_pdf_text(bytes_)
+                txt = await run_in_process(extract_pdf_text, bytes_)
             elif url:
-                txt = extract_main_text(url)
+                txt = await extract_main_text_async(url)
             else:
                 txt = ""
             return extract_topics_heuristic(txt, user_name_hint=name)
 
-        topic_a = make_topic(a_name, a_url, a_bytes)
-        topic_b = make_topic(b_name, b_url, b_bytes)
-        await orch.compare_init(topic_a, topic_b)
-        return ok({"topicA": topic_a, "topicB": topic_b})
+        topics = await asyncio.gather(*(make_topic(*f) for f in fields))
+        await orch.compare_init(*topics)
+        out = {f"topic{label}": t for label, t in zip(LABELS, topics)}  # topicA, topicB, ...
+        out["topics"] = list(topics)
+        return ok(out)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/api/compare/ask")
-async def compare_ask(question: str = Form(...)):
+async def compare_ask(question: str = Form(...), orch: Orchestrator = Depends(session_orch)):
     try:
         result = await orch.compare_ask(question)
         return ok(result)
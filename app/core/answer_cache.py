@@ -0,0 +1,200 @@
+# app/core/answer_cache.py
+"""
+Semantic answer cache for Orchestrator.answer_dual.
+
+Visitors ask the same thing in many phrasings ("battery life?", "how long
+does the battery last"). Each question is embedded with the shared MiniLM
+model, and a stored answer is reused when a cached question of the same scope
+is at least ANSWER_CACHE_THRESHOLD cosine-similar.
+
+- Scope = topic["primary"] (normalized) + a hash of the documents backing
+  RAG, so answers never leak across products or document sets. Ingesting a
+  new document for a topic drops all of its scopes (invalidate()).
+- Each scope keeps an ExactIndex over its question vectors. Expired,
+  replaced and evicted entries are tombstoned, and the index is compacted
+  once tombstones outnumber live rows.
+- Bounded: ANSWER_CACHE_SIZE entries per scope (oldest evicted first) and
+  ANSWER_CACHE_SCOPES scopes (least recently used evicted).
+
+Hit / miss counts and the hit rate are listed under "answer_cache" in
+/api/metrics.
+
+Env:
+- ANSWER_CACHE             on/off (default 1)
+- ANSWER_CACHE_THRESHOLD   minimum cosine similarity for a hit (default 0.9)
+- ANSWER_CACHE_TTL         seconds an answer is reused (default 3600)
+- ANSWER_CACHE_SIZE        entries per scope (default 256)
+- ANSWER_CACHE_SCOPES      scopes kept (default 512)
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+import copy
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+from app.core import metrics
+from app.core.embedding_service import get_model, DEFAULT_EMBED_MODEL
+from app.core.vector_index import ExactIndex
+
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "1").lower() not in ("0", "false", "no", "off")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.9"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_SCOPES = int(os.getenv("ANSWER_CACHE_SCOPES", "512"))
+
+_CANDIDATES = 4  # nearest questions checked per lookup (skips expired ones)
+
+
+def embed_question(question: str, model_name: str = DEFAULT_EMBED_MODEL) -> np.ndarray:
+    return get_model(model_name).encode(
+        [question],
+        normalize_embeddings=True,
+        convert_to_numpy=True
+    )[0].astype("float32")
+
+
+def scope_key(topic: Optional[Dict], doc_ids: Optional[List[str]] = None) -> Optional[str]:
+    """'<primary>|<docs hash>', or None without a topic (nothing to scope answers to)."""
+    primary = ((topic or {}).get("primary") or "").strip().lower()
+    if not primary:
+        return None
+    docs = hashlib.sha1(",".join(sorted(doc_ids or [])).encode("utf-8")).hexdigest()[:16]
+    return f"{primary}|{docs}"
+
+
+class _Scope:
+    def __init__(self):
+        self.index = ExactIndex()
+        self.entries: List[Optional[Dict]] = []  # row id -> {"question", "payload", "expires"}; None once dropped
+
+    def drop(self, row: int):
+        if self.entries[row] is not None:
+            self.entries[row] = None
+            self.index.remove([row])
+
+    def compact(self):
+        rows = [i for i, e in enumerate(self.entries) if e is not None]
+        vecs = self.index.vecs[rows] if rows else None
+        self.entries = [self.entries[i] for i in rows]
+        self.index = ExactIndex()
+        if rows:
+            self.index.build(vecs)
+
+
+class SemanticAnswerCache:
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl: float = ANSWER_CACHE_TTL,
+        per_scope: int = ANSWER_CACHE_SIZE,
+        max_scopes: int = ANSWER_CACHE_SCOPES,
+    ):
+        self.threshold = float(threshold)
+        self.ttl = float(ttl)
+        self.per_scope = max(1, int(per_scope))
+        self.max_scopes = max(1, int(max_scopes))
+        self._scopes: "OrderedDict[str, _Scope]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    # ---------- Lookup ----------
+    def _nearest(self, scope: _Scope, q: np.ndarray) -> Tuple[Optional[int], float]:
+        """Best unexpired row at or above the threshold (expired rows met on the way are dropped)."""
+        now = time.time()
+        idx, sims = scope.index.search(q, _CANDIDATES)
+        for row, sim in zip(idx, sims):
+            if sim < self.threshold:
+                break
+            entry = scope.entries[int(row)]
+            if entry is None or entry["expires"] < now:
+                scope.drop(int(row))
+                continue
+            return int(row), float(sim)
+        return None, 0.0
+
+    def lookup(self, scope_id: str, q: np.ndarray) -> Optional[Dict]:
+        """A deep copy of the cached payload plus {"cached": {question, similarity}}, or None."""
+        with self._lock:
+            scope = self._scopes.get(scope_id)
+            row, sim = self._nearest(scope, q) if scope is not None and scope.index.live else (None, 0.0)
+            if row is None:
+                self.misses += 1
+                metrics.incr("answer_cache.miss")
+                return None
+            self._scopes.move_to_end(scope_id)
+            entry = scope.entries[row]
+            self.hits += 1
+        metrics.incr("answer_cache.hit")
+        metrics.observe("answer_cache.similarity", sim)
+        out = copy.deepcopy(entry["payload"])
+        out["cached"] = {"question": entry["question"], "similarity": round(sim, 4)}
+        return out
+
+    # ---------- Store ----------
+    def store(self, scope_id: str, question: str, q: np.ndarray, payload: Dict):
+        entry = {"question": question, "payload": copy.deepcopy(payload), "expires": time.time() + self.ttl}
+        with self._lock:
+            scope = self._scopes.get(scope_id)
+            if scope is None:
+                scope = self._scopes[scope_id] = _Scope()
+                while len(self._scopes) > self.max_scopes:
+                    self._scopes.popitem(last=False)
+            self._scopes.move_to_end(scope_id)
+            if scope.index.live:
+                row, _ = self._nearest(scope, q)
+                if row is not None:
+                    scope.drop(row)  # same question again: the newer answer replaces it
+            live = [i for i, e in enumerate(scope.entries) if e is not None]
+            for row in live[:max(0, len(live) - self.per_scope + 1)]:
+                scope.drop(row)
+            if len(scope.index) - scope.index.live > scope.index.live:
+                scope.compact()
+            scope.index.add(q[None, :])
+            scope.entries.append(entry)
+            self.stores += 1
+        metrics.incr("answer_cache.store")
+
+    # ---------- Invalidation ----------
+    def invalidate(self, primary: Optional[str]) -> int:
+        """Drop every scope of a topic (all document sets); returns how many."""
+        prefix = f"{(primary or '').strip().lower()}|"
+        with self._lock:
+            stale = [s for s in self._scopes if s.startswith(prefix)]
+            for s in stale:
+                del self._scopes[s]
+            self.invalidations += len(stale)
+        if stale:
+            metrics.incr("answer_cache.invalidated", len(stale))
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": ANSWER_CACHE,
+                "threshold": self.threshold,
+                "ttl": self.ttl,
+                "scopes": len(self._scopes),
+                "entries": sum(s.index.live for s in self._scopes.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+answer_cache = SemanticAnswerCache()
+metrics.register("answer_cache", answer_cache.stats)
@@ -0,0 +1,122 @@
+# app/core/async_io.py
+"""
+Shared async I/O plumbing so route handlers never block the event loop.
+
+- get_http_client(): one pooled keep-alive httpx.AsyncClient per event loop
+  (Groq, Google CSE, page fetches).
+- run_in_thread(fn, ...): bounded thread pool for CPU work that releases the
+  GIL (embedding, numpy) or blocking libs we can't make async.
+- run_in_process(fn, ...): bounded process pool for pure-Python CPU work
+  (PDF parsing, OCR). Falls back to the thread pool if processes can't start.
+
+Env:
+- HTTP_MAX_CONNECTIONS / HTTP_MAX_KEEPALIVE / HTTP_KEEPALIVE_EXPIRY
+- THREAD_WORKERS   default min(32, cpu + 4)
+- PROCESS_WORKERS  default cpu count
+"""
+from __future__ import annotations
+from typing import Any, Callable, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+
+import httpx
+
+from app.core import metrics
+
+_CPUS = os.cpu_count() or 2
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "64"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "32"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+THREAD_WORKERS = int(os.getenv("THREAD_WORKERS", str(min(32, _CPUS + 4))))
+PROCESS_WORKERS = int(os.getenv("PROCESS_WORKERS", str(_CPUS)))
+
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; ProductQAAssistant/1.0)"}
+
+_clients: Dict[int, httpx.AsyncClient] = {}
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+# ---------- HTTP ----------
+def get_http_client() -> httpx.AsyncClient:
+    """Pooled client bound to the running loop (httpx pools are loop-specific)."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(id(loop))
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(20.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            headers=DEFAULT_HEADERS,
+            follow_redirects=True,
+        )
+        _clients[id(loop)] = client
+        metrics.incr("http.client.created")
+    return client
+
+
+# ---------- Executors ----------
+def _threads() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        with _pool_lock:
+            if _thread_pool is None:
+                _thread_pool = ThreadPoolExecutor(max_workers=THREAD_WORKERS, thread_name_prefix="cpu")
+    return _thread_pool
+
+
+def _processes() -> Optional[ProcessPoolExecutor]:
+    global _process_pool
+    if _process_pool is None and PROCESS_WORKERS > 0:
+        with _pool_lock:
+            if _process_pool is None:
+                try:
+                    _process_pool = ProcessPoolExecutor(max_workers=PROCESS_WORKERS)
+                except (OSError, NotImplementedError):
+                    return None
+    return _process_pool
+
+
+async def run_in_thread(fn: Callable, *args, **kwargs) -> Any:
+    """fn runs with a copy of the caller's context (session id, usage tracking)."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_threads(), functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+async def run_in_process(fn: Callable, *args, **kwargs) -> Any:
+    """fn/args must be picklable (module-level functions, bytes, str...)."""
+    pool = _processes()
+    if pool is None:
+        return await run_in_thread(fn, *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+    except RuntimeError as e:  # pool shut down / broken
+        if "shutdown" not in str(e).lower() and "broken" not in str(e).lower():
+            raise
+        return await run_in_thread(fn, *args, **kwargs)
+
+
+async def aclose():
+    """Close pooled clients and executors (FastAPI shutdown)."""
+    global _thread_pool, _process_pool
+    for key, client in list(_clients.items()):
+        try:
+            await client.aclose()
+        finally:
+            _clients.pop(key, None)
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _thread_pool = None
@@ -0,0 +1,258 @@
+# app/core/bm25.py
+"""
+Sparse lexical index (BM25) for exact model numbers, SKUs and spec values
+("EDX Pro", "5000mAh", "A15") that dense embeddings tend to blur.
+
+Postings live in segments, one per add() batch, each CSR-style by term:
+- terms    int32 [T]    sorted term ids present in the segment
+- offsets  int64 [T+1]  postings of terms[i] = offsets[i]:offsets[i+1]
+- docs     int32        row ids, ascending within a term
+- tf       float32      term frequency in that row
+
+Document frequencies, row lengths and a live mask are kept corpus-wide, and
+the BM25 impact idf * tf*(k1+1) / (tf + k1*norm) of a term is computed from
+them when a query first uses it (then cached until the next update), so
+adding or removing rows only touches those rows: add() tokenizes the new
+chunks and appends a segment, remove() tombstones rows and re-tokenizes their
+text to take them out of the document frequencies.
+Segments are merged logarithmically (a new segment is folded into the
+previous one while it is at least half its size), which keeps a handful of
+segments per query term and drops tombstoned postings on the way.
+
+A query is one vectorized slice per query term and segment plus an
+argpartition top-k, with no per-document Python work.
+
+Tokens are lowercase alphanumeric runs (keeping inner '.', '-' as in "1.5" or
+"x-100"); mixed letter/digit tokens are also split ("5000mah" -> "5000", "mah")
+so "5000mAh" and "5000 mAh" match each other.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence, Tuple
+from collections import Counter
+import re
+
+import numpy as np
+
+from app.core.vector_index import _top_k
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+_PARTS_RE = re.compile(r"[a-z]+|[0-9]+(?:\.[0-9]+)?")
+_IMPACT_CACHE = 4096  # terms whose impacts are kept between updates
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with "
+    "what which who how does do can you your i we our".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    out = []
+    for tok in _TOKEN_RE.findall((text or "").lower()):
+        if tok in _STOPWORDS:
+            continue
+        out.append(tok)
+        parts = _PARTS_RE.findall(tok)
+        if len(parts) > 1:
+            out.extend(parts)
+    return out
+
+
+def _grown(buf: np.ndarray, n: int) -> np.ndarray:
+    """buf with room for at least n entries (doubling, like the vector buffers)."""
+    if len(buf) >= n:
+        return buf
+    out = np.zeros(max(n, 2 * len(buf), 64), dtype=buf.dtype)
+    out[:len(buf)] = buf
+    return out
+
+
+class _Segment:
+    """Postings of a run of rows, CSR by term id."""
+    __slots__ = ("terms", "offsets", "docs", "tf")
+
+    def __init__(self, terms: np.ndarray, docs: np.ndarray, tf: np.ndarray):
+        """terms / docs / tf: one entry per posting, in any term order (docs ascending per term)."""
+        order = np.argsort(terms, kind="stable")  # stable keeps docs ascending per term
+        terms = terms[order]
+        self.docs = docs[order]
+        self.tf = tf[order]
+        self.terms, counts = np.unique(terms, return_counts=True)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype("int64")
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def postings(self, t: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        i = int(np.searchsorted(self.terms, t))
+        if i == len(self.terms) or self.terms[i] != t:
+            return None
+        s, e = self.offsets[i], self.offsets[i + 1]
+        return self.docs[s:e], self.tf[s:e]
+
+    def expanded(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(term, doc, tf) per posting."""
+        return np.repeat(self.terms, np.diff(self.offsets)), self.docs, self.tf
+
+    def nbytes(self) -> int:
+        return int(self.terms.nbytes + self.offsets.nbytes + self.docs.nbytes + self.tf.nbytes)
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._reset()
+
+    def _reset(self):
+        self.vocab: Dict[str, int] = {}
+        self.segments: List[_Segment] = []
+        self.df = np.zeros(0, dtype="int64")          # live rows containing each term
+        self.lengths = np.zeros(0, dtype="float32")   # tokens per row
+        self.live = np.zeros(0, dtype=bool)
+        self.n_docs = 0   # rows ever added (row id space)
+        self.n_live = 0
+        self.total_len = 0.0  # tokens over live rows
+        self._norm: Optional[np.ndarray] = None  # k1 * length norm per row, for the current avgdl
+        self._weights: Dict[int, List[Tuple[np.ndarray, np.ndarray]]] = {}  # term -> [(docs, impacts)]
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def build(self, chunks: Sequence[str]):
+        self._reset()
+        self.add(chunks)
+
+    def _counts(self, chunks: Sequence[str]) -> List[Counter]:
+        return [Counter(tokenize(c)) for c in chunks]
+
+    def add(self, chunks: Sequence[str]):
+        """Append rows n_docs .. n_docs + len(chunks) - 1 (cost proportional to the new chunks)."""
+        n, base = len(chunks), self.n_docs
+        if not n:
+            return
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        tfs: List[int] = []
+        lengths = np.zeros(n, dtype="float32")
+        vocab = self.vocab
+        for d, counts in enumerate(self._counts(chunks)):
+            lengths[d] = sum(counts.values())
+            for term, tf in counts.items():
+                t = vocab.get(term)
+                if t is None:
+                    t = vocab[term] = len(vocab)
+                term_ids.append(t)
+                doc_ids.append(base + d)
+                tfs.append(tf)
+
+        self.lengths = _grown(self.lengths, base + n)
+        self.live = _grown(self.live, base + n)
+        self.df = _grown(self.df, len(vocab))
+        self.lengths[base:base + n] = lengths
+        self.live[base:base + n] = True
+        self.n_docs += n
+        self.n_live += n
+        self.total_len += float(lengths.sum())
+        self._norm, self._weights = None, {}
+        if not term_ids:
+            return
+        seg = _Segment(
+            np.asarray(term_ids, dtype="int32"),
+            np.asarray(doc_ids, dtype="int32"),
+            np.asarray(tfs, dtype="float32"),
+        )
+        self.df[seg.terms] += np.diff(seg.offsets)
+        self.segments.append(seg)
+        while len(self.segments) > 1 and 2 * len(self.segments[-1]) >= len(self.segments[-2]):
+            last = self.segments.pop()
+            self.segments[-1] = self._merge(self.segments[-1], last)
+
+    def _merge(self, a: _Segment, b: _Segment) -> _Segment:
+        """One segment from two consecutive ones (b's rows after a's), without tombstoned rows."""
+        parts = [a.expanded(), b.expanded()]
+        terms, docs, tf = (np.concatenate([p[i] for p in parts]) for i in range(3))
+        keep = self.live[docs]
+        return _Segment(terms[keep], docs[keep], tf[keep])
+
+    def remove(self, rows: Sequence[int], chunks: Sequence[str]):
+        """
+        Tombstone rows; `chunks` are their texts as given to add(), re-tokenized
+        to take them out of the document frequencies (no segment is scanned).
+        """
+        rows = np.asarray(rows, dtype="int64")
+        if not len(rows):
+            return
+        fresh = self.live[rows]
+        terms: List[int] = []
+        for counts, alive in zip(self._counts(chunks), fresh):
+            if alive:
+                terms.extend(self.vocab[t] for t in counts)
+        rows = rows[fresh]
+        self.live[rows] = False
+        self.n_live -= len(rows)
+        self.total_len -= float(self.lengths[rows].sum())
+        self._norm, self._weights = None, {}
+        if terms:
+            np.subtract.at(self.df, np.asarray(terms, dtype="int64"), 1)
+
+    def _impacts(self, t: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """[(rows, BM25 impact)] per segment for term t, cached until the next add / remove."""
+        hits = self._weights.get(t)
+        if hits is not None:
+            return hits
+        norm = self._norm
+        if norm is None:
+            avgdl = self.total_len / self.n_live or 1.0
+            norm = self._norm = (self.k1 * ((1.0 - self.b) + self.b * self.lengths[:self.n_docs] / avgdl)).astype("float32")
+        df = float(self.df[t])
+        idf = np.float32(np.log1p((self.n_live - df + 0.5) / (df + 0.5)) * (self.k1 + 1.0))
+        hits = []
+        for seg in self.segments:
+            hit = seg.postings(t)
+            if hit is not None:
+                docs, tf = hit
+                hits.append((docs, idf * tf / (tf + norm[docs])))
+        if len(self._weights) >= _IMPACT_CACHE:
+            self._weights.clear()
+        self._weights[t] = hits
+        return hits
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every row for query (zeros where no term matches, and for removed rows)."""
+        out = np.zeros(self.n_docs, dtype="float32")
+        if not self.n_live:
+            return out
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is None or self.df[t] <= 0:
+                continue
+            for docs, impact in self._impacts(t):
+                out[docs] += impact
+        if self.n_live < self.n_docs:
+            out[~self.live[:self.n_docs]] = 0.0
+        return out
+
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(row ids, scores) of the k best matches with a positive score."""
+        if not self.n_live:
+            return np.zeros(0, dtype="int64"), np.zeros(0, dtype="float32")
+        scores = self.scores(query)
+        idx = _top_k(scores, k)
+        idx = idx[scores[idx] > 0]
+        return idx, scores[idx]
+
+    def nbytes(self) -> int:
+        arrays = self.df.nbytes + self.lengths.nbytes + self.live.nbytes
+        arrays += sum(impact.nbytes for hits in self._weights.values() for _, impact in hits)
+        if self._norm is not None:
+            arrays += self._norm.nbytes
+        return int(arrays + sum(seg.nbytes() for seg in self.segments)) + 64 * len(self.vocab)
+
+
+def rrf_fuse(rankings: Sequence[Sequence[int]], k: int = 60) -> List[int]:
+    """Reciprocal-rank fusion of several ranked id lists -> ids by fused score."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking):
+            fused[int(i)] = fused.get(int(i), 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
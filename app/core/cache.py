@@ -0,0 +1,181 @@
+# app/core/cache.py
+"""
+Small TTL + LRU cache with optional JSON persistence.
+
+- get/set are O(1); expired entries are dropped lazily on access.
+- maxsize bounds the entry count (least recently used evicted first).
+- persist_path: entries are loaded on creation and written back (atomically)
+  at most every `persist_interval` seconds on writes, plus on flush(). The
+  write-back triggered by set() runs on a background thread, so callers on
+  the event loop never wait on JSON encoding or disk I/O. Values must be
+  JSON-serializable when persistence is on.
+
+Named caches created through get_cache() are listed under "caches" in
+/api/metrics with their hit rates.
+"""
+from __future__ import annotations
+from typing import Any, Dict, Optional
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+
+from app.core import metrics
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = 1024,
+        ttl: float = 3600,
+        persist_path: Optional[str] = None,
+        persist_interval: float = 30,
+    ):
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self.persist_path = persist_path
+        self.persist_interval = persist_interval
+        self._data: "OrderedDict[str, list]" = OrderedDict()  # key -> [expires_at, value]
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one writer of persist_path at a time
+        self._saving = False  # a background write-back is pending
+        self._dirty = False
+        self._last_save = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if persist_path:
+            self._load()
+
+    # ---------- Core ----------
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] < now:
+                del self._data[key]
+                self._dirty = True
+                item = None
+            if item is None:
+                self.misses += 1
+                metrics.incr(f"cache.{self.name}.miss")
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+        metrics.incr(f"cache.{self.name}.hit")
+        return item[1]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires = time.time() + (self.ttl if ttl is None else float(ttl))
+        with self._lock:
+            self._data[key] = [expires, value]
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            self._dirty = True
+            due = bool(self.persist_path) and not self._saving \
+                and (time.time() - self._last_save) >= self.persist_interval
+            if due:
+                self._saving = True
+        if due:
+            threading.Thread(target=self._flush_behind, name=f"cache-flush-{self.name}", daemon=True).start()
+
+    def delete(self, key: str):
+        with self._lock:
+            if self._data.pop(key, _MISSING) is not _MISSING:
+                self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._dirty = True
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    # ---------- Persistence ----------
+    def _load(self):
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except Exception:
+            return
+        now = time.time()
+        for key, (expires, value) in raw.get("entries", []):
+            if expires > now:
+                self._data[key] = [expires, value]
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def _flush_behind(self):
+        try:
+            self.flush()
+        finally:
+            self._saving = False
+
+    def flush(self):
+        """Write dirty entries to persist_path now (blocking; use run_in_thread from async code)."""
+        if not self.persist_path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                entries = [[k, v] for k, v in self._data.items()]
+                self._dirty = False
+                self._last_save = time.time()
+            try:
+                os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+                tmp = f"{self.persist_path}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({"name": self.name, "entries": entries}, f)
+                os.replace(tmp, self.persist_path)
+            except (OSError, TypeError, ValueError):
+                self._dirty = True
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "persistent": bool(self.persist_path),
+        }
+
+
+# ---------- Registry ----------
+_caches: Dict[str, TTLCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name: str, **kwargs) -> TTLCache:
+    """Create (once) and return the named cache; kwargs only apply on creation."""
+    cache = _caches.get(name)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(name)
+            if cache is None:
+                cache = _caches[name] = TTLCache(name, **kwargs)
+    return cache
+
+
+def flush_all():
+    for cache in list(_caches.values()):
+        cache.flush()
+
+
+def cache_stats() -> Dict:
+    return {name: c.stats() for name, c in _caches.items()}
+
+
+metrics.register("caches", cache_stats)
@@ -0,0 +1,254 @@
+# app/core/chunker.py
+"""
+Structure-aware chunker sized in *model tokens* (not words), so chunks fit the
+embedding model's window (MiniLM: 256) instead of being silently truncated.
+
+- Pages are joined into one document string with "\\n\\n" between them.
+- Lines are classified as headings (short, no trailing punctuation, numbered /
+  upper-case / title-case) or body; body lines form paragraphs, paragraphs are
+  split into sentences. Chunks are runs of whole sentences; a heading starts a
+  new chunk, and a sentence longer than the budget is cut at token offsets.
+- Consecutive chunks in a section overlap by up to CHUNK_OVERLAP_TOKENS of
+  trailing sentences.
+
+The result is a ChunkSet: the document string plus flat arrays (char start/end,
+first/last page, token count) per chunk, so provenance costs a few bytes per
+chunk and chunk text is a slice, not a copy.
+
+Env:
+- CHUNK_MAX_TOKENS      token budget per chunk (default: model max_seq_length - 2)
+- CHUNK_OVERLAP_TOKENS  overlap between consecutive chunks (default 32)
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence, Tuple
+import os
+import re
+
+import numpy as np
+
+from app.core.embedding_service import get_model, DEFAULT_EMBED_MODEL
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "0"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+PAGE_SEP = "\n\n"
+
+_LINE_RE = re.compile(r"[^\n]+")
+# sentence boundary: end punctuation (+ closing quote / bracket), whitespace, then a capital or digit
+SENT_END_RE = re.compile(r"[.!?]+[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])")
+_NUMBERED_RE = re.compile(r"^(\d+(\.\d+)*|[IVX]+\.|[A-Z]\.)\s+\S")
+
+
+# ---------- Token counting ----------
+def estimate_tokens(texts: Sequence[str]) -> np.ndarray:
+    """~4/3 tokens per word, for when no tokenizer is at hand."""
+    return np.fromiter((-(-len(t.split()) * 4 // 3) for t in texts), dtype="int32", count=len(texts))
+
+
+class TokenCounter:
+    """Counts with the embedding model's own tokenizer; ~4/3 tokens per word without one."""
+
+    def __init__(self, model_name: str = DEFAULT_EMBED_MODEL):
+        try:
+            model = get_model(model_name)
+        except Exception:
+            model = None
+        self.tokenizer = getattr(model, "tokenizer", None)
+        self.max_seq_length = int(getattr(model, "max_seq_length", 0) or 256)
+
+    def count(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros(0, dtype="int32")
+        if self.tokenizer is not None:
+            try:
+                ids = self.tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+                return np.fromiter((len(x) for x in ids), dtype="int32", count=len(ids))
+            except Exception:
+                pass
+        return estimate_tokens(texts)
+
+    def cuts(self, text: str, budget: int) -> List[int]:
+        """Char offsets that split text into pieces of <= budget tokens."""
+        if self.tokenizer is not None:
+            try:
+                offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+                return [offsets[i][0] for i in range(budget, len(offsets), budget)]
+            except Exception:
+                pass
+        words = [m.start() for m in re.finditer(r"\S+", text)]
+        per = max(1, budget * 3 // 4)
+        return [words[i] for i in range(per, len(words), per)]
+
+
+_counters: Dict[str, TokenCounter] = {}
+
+
+def get_counter(model_name: str = DEFAULT_EMBED_MODEL) -> TokenCounter:
+    counter = _counters.get(model_name)
+    if counter is None:
+        counter = _counters[model_name] = TokenCounter(model_name)
+    return counter
+
+
+# ---------- Chunk set ----------
+class ChunkSet:
+    """Chunks as spans of one document string plus per-chunk provenance arrays."""
+
+    def __init__(self, text: str, starts, ends, page_start, page_end, tokens, base: int = 0):
+        self.text = text
+        self.base = base  # char offset of `text` within the whole document (streamed batches)
+        self.starts = np.asarray(starts, dtype="int64")
+        self.ends = np.asarray(ends, dtype="int64")
+        self.page_start = np.asarray(page_start, dtype="int32")
+        self.page_end = np.asarray(page_end, dtype="int32")
+        self.tokens = np.asarray(tokens, dtype="int32")
+
+    def __len__(self) -> int:
+        return int(self.starts.shape[0])
+
+    def __getitem__(self, i: int) -> str:
+        return self.text[self.starts[i]:self.ends[i]]
+
+    def texts(self) -> List[str]:
+        return [self.text[s:e] for s, e in zip(self.starts.tolist(), self.ends.tolist())]
+
+    def provenance(self) -> np.ndarray:
+        """[n, 4] int64: first page, last page, char start, char end (document offsets)."""
+        return np.stack(
+            [self.page_start, self.page_end, self.starts + self.base, self.ends + self.base], axis=1
+        ).astype("int64")
+
+
+# ---------- Segmentation ----------
+def _is_heading(line: str) -> bool:
+    if len(line) < 2 or len(line) > 80 or line[-1] in ".,;:!?":
+        return False
+    if _NUMBERED_RE.match(line):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    if letters and sum(c.isupper() for c in letters) / len(letters) > 0.8:
+        return True
+    words = line.split()
+    return len(words) <= 8 and sum(w[0].isupper() or w[0].isdigit() for w in words) / len(words) >= 0.6
+
+
+def _units(doc: str) -> List[Tuple[int, int, bool]]:
+    """(start, end, is_heading) sentence / heading spans in document order."""
+    units: List[Tuple[int, int, bool]] = []
+
+    def paragraph(ps: int, pe: int):
+        s = ps
+        for m in SENT_END_RE.finditer(doc, ps, pe):
+            units.append((s, m.end(), False))
+            s = m.end()
+        if s < pe:
+            units.append((s, pe, False))
+
+    para_start = para_end = -1
+    for m in _LINE_RE.finditer(doc):
+        ls, le = m.span()
+        line = m.group().strip()
+        if not line:
+            continue
+        blank_before = para_end >= 0 and doc.count("\n", para_end, ls) > 1
+        if _is_heading(line):
+            if para_start >= 0:
+                paragraph(para_start, para_end)
+                para_start = para_end = -1
+            units.append((ls, le, True))
+            continue
+        if para_start >= 0 and blank_before:
+            paragraph(para_start, para_end)
+            para_start = -1
+        if para_start < 0:
+            para_start = ls
+        para_end = le
+    if para_start >= 0:
+        paragraph(para_start, para_end)
+    return units
+
+
+# ---------- Chunking ----------
+def chunk_pages(
+    pages: Sequence[str],
+    model_name: str = DEFAULT_EMBED_MODEL,
+    max_tokens: Optional[int] = None,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    first_page: int = 1,
+    char_offset: int = 0,
+) -> ChunkSet:
+    """
+    Chunk page texts (page i is page number first_page + i) into a ChunkSet.
+    When a document is chunked in page batches, pass the batch's first page and
+    its char offset in the whole document so provenance stays document-relative.
+    """
+    counter = get_counter(model_name)
+    budget = max_tokens or CHUNK_MAX_TOKENS or (counter.max_seq_length - 2)
+    budget = max(16, budget)
+
+    page_starts, parts, pos = [], [], 0
+    for p in pages:
+        page_starts.append(pos)
+        parts.append(p or "")
+        pos += len(p or "") + len(PAGE_SEP)
+    doc = PAGE_SEP.join(parts)
+    page_starts = np.asarray(page_starts, dtype="int64")
+
+    units = _units(doc)
+    counts = counter.count([doc[s:e] for s, e, _ in units])
+
+    # oversized sentences -> token-offset cuts
+    spans: List[Tuple[int, int, bool, int]] = []
+    for (s, e, head), n in zip(units, counts.tolist()):
+        if n <= budget:
+            spans.append((s, e, head, n))
+            continue
+        bounds = [s] + [s + c for c in counter.cuts(doc[s:e], budget)] + [e]
+        pieces = [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+        for (a, b), m in zip(pieces, counter.count([doc[a:b] for a, b in pieces]).tolist()):
+            spans.append((a, b, head, m))
+
+    starts, ends, ntoks = [], [], []
+    cur: List[Tuple[int, int, bool, int]] = []
+    cur_tok = 0
+
+    def flush(carry: bool):
+        nonlocal cur, cur_tok
+        if not cur:
+            return
+        starts.append(cur[0][0])
+        ends.append(cur[-1][1])
+        ntoks.append(cur_tok)
+        keep: List[Tuple[int, int, bool, int]] = []
+        if carry and overlap_tokens > 0:
+            total = 0
+            for span in reversed(cur[1:]):
+                if span[2] or total + span[3] > overlap_tokens:
+                    break
+                keep.insert(0, span)
+                total += span[3]
+        cur, cur_tok = keep, sum(sp[3] for sp in keep)
+
+    for span in spans:
+        s, e, head, n = span
+        if head and cur and cur_tok >= budget // 4:
+            flush(carry=False)  # new section
+        if cur and cur_tok + n > budget:
+            flush(carry=True)
+            if cur and cur_tok + n > budget:
+                cur, cur_tok = [], 0
+        cur.append(span)
+        cur_tok += n
+    if cur and (not ends or cur[-1][1] > ends[-1]):
+        flush(carry=False)
+
+    starts_a = np.asarray(starts, dtype="int64")
+    ends_a = np.asarray(ends, dtype="int64")
+    page_start = np.searchsorted(page_starts, starts_a, side="right") - 1 + first_page
+    page_end = np.searchsorted(page_starts, np.maximum(ends_a - 1, 0), side="right") - 1 + first_page
+    return ChunkSet(doc, starts_a, ends_a, page_start, page_end, ntoks, base=char_offset)
+
+
+def chunk_document(text: str, model_name: str = DEFAULT_EMBED_MODEL, **kwargs) -> ChunkSet:
+    """chunk_pages for text without page structure (everything is page 1)."""
+    return chunk_pages([text or ""], model_name, **kwargs)
@@ -0,0 +1,183 @@
+# app/core/compare_service.py
+"""
+N-way comparison mode (2..COMPARE_MAX_PRODUCTS products, labelled A, B, C...).
+
+- Evidence: each product's web research (search + scrape + passage
+  selection) runs concurrently, at most COMPARE_CONCURRENCY at a time. The
+  CSE result cache, page cache and per-host fetch limits are shared, so
+  products that share a retailer or review page fetch it once. All
+  products together get COMPARE_EVIDENCE_TOKENS of source passages, split
+  evenly.
+- Matrix: one JSON-mode completion over all products' evidence returns the
+  per-product summaries, COMPARE_DIMENSIONS comparison rows (the model
+  picks the dimensions that matter for the question) and a recommendation.
+  If that call fails, one plain completion writes the recommendation, so a
+  comparison costs at most two LLM calls whatever N is.
+
+Payload: "products" lists every product. Each label ("A", "B", ...) is also
+a top-level key, and matrix rows keep a_value / b_value / a_cites / b_cites,
+so two-product clients work unchanged.
+
+Env:
+- COMPARE_MAX_PRODUCTS      products per comparison (default 6)
+- COMPARE_CONCURRENCY       products researched at once (default 3)
+- COMPARE_EVIDENCE_TOKENS   source budget shared by all products (default 2400)
+- COMPARE_DIMENSIONS        matrix rows requested (default 5)
+"""
+from __future__ import annotations
+from typing import Dict, List, Sequence, Tuple
+import asyncio
+import os
+import re
+import time
+
+from app.core import metrics
+from app.core.web_service import gather_web_sources
+
+COMPARE_MAX_PRODUCTS = int(os.getenv("COMPARE_MAX_PRODUCTS", "6"))
+COMPARE_CONCURRENCY = int(os.getenv("COMPARE_CONCURRENCY", "3"))
+COMPARE_EVIDENCE_TOKENS = int(os.getenv("COMPARE_EVIDENCE_TOKENS", "2400"))
+COMPARE_DIMENSIONS = int(os.getenv("COMPARE_DIMENSIONS", "5"))
+
+LABELS = "ABCDEFGHIJKL"
+_MIN_PRODUCT_TOKENS = 150
+_CITE_RE = re.compile(r"(\d+)\s*$")
+
+
+def label_topics(topics: Sequence[Dict]) -> Dict[str, Dict]:
+    """{"A": topic, "B": topic, ...}; raises ValueError outside 2..COMPARE_MAX_PRODUCTS."""
+    topics = [t for t in topics if t]
+    limit = min(COMPARE_MAX_PRODUCTS, len(LABELS))
+    if not 2 <= len(topics) <= limit:
+        raise ValueError(f"Comparison needs 2 to {limit} products, got {len(topics)}")
+    return {LABELS[i]: t for i, t in enumerate(topics)}
+
+
+def _name(topic: Dict, label: str) -> str:
+    return (topic.get("primary") or "").strip() or f"Product {label}"
+
+
+# ---------- Evidence fan-out ----------
+async def gather_evidence(question: str, topics: Dict[str, Dict]) -> Dict[str, List[Tuple[str, str]]]:
+    """{label: [(url, passages)]}, researched concurrently under COMPARE_CONCURRENCY."""
+    slots = asyncio.Semaphore(max(1, COMPARE_CONCURRENCY))
+    budget = max(_MIN_PRODUCT_TOKENS, COMPARE_EVIDENCE_TOKENS // max(1, len(topics)))
+
+    async def one(label: str, topic: Dict):
+        async with slots:
+            t0 = time.perf_counter()
+            try:
+                pages = await gather_web_sources(question, topic, budget=budget)
+            except Exception:
+                metrics.incr("compare.evidence_error")
+                pages = []
+            metrics.observe("compare.evidence_ms", (time.perf_counter() - t0) * 1000.0)
+            return label, pages
+
+    return dict(await asyncio.gather(*(one(label, t) for label, t in topics.items())))
+
+
+# ---------- Matrix ----------
+def _matrix_prompt(question: str, topics: Dict[str, Dict], evidence: Dict[str, List[Tuple[str, str]]]) -> Tuple[str, str]:
+    labels = list(topics)
+    system = (
+        f"You compare {len(labels)} products for a buyer, using only the sources given for each product. "
+        "Reply with a JSON object with exactly these keys: "
+        "\"summaries\": {label: 2-3 sentence answer to the question for that product}; "
+        f"\"matrix\": a list of up to {COMPARE_DIMENSIONS} rows, the dimensions that matter most for the question "
+        "(e.g. price, battery, performance, warranty), each {\"dimension\": name, \"values\": {label: short value}, "
+        "\"cites\": {label: [source ids like \"A1\"]}}; "
+        "\"recommendation\": which product fits the question best and why, in 2 lines, or what extra info is needed. "
+        f"Use the labels {', '.join(labels)} as keys. Write \"unknown\" where the sources say nothing."
+    )
+    blocks = []
+    for label in labels:
+        pages = evidence.get(label) or []
+        srcs = "\n".join(f"[{label}{i}] {url}\n{text}" for i, (url, text) in enumerate(pages, 1)) or "(no sources found)"
+        blocks.append(f"Product {label}: {_name(topics[label], label)}\n{srcs}")
+    user = f"Question: {question}\n\n" + "\n\n".join(blocks)
+    return system, user
+
+
+def _cite_ids(raw, n_sources: int) -> List[int]:
+    """'A2' / 2 / '2' -> 0-based source index (dropped when out of range)."""
+    out = []
+    for c in raw if isinstance(raw, list) else [raw]:
+        m = _CITE_RE.search(str(c))
+        if m and 1 <= int(m.group(1)) <= n_sources and int(m.group(1)) - 1 not in out:
+            out.append(int(m.group(1)) - 1)
+    return out
+
+
+def _matrix_rows(data: Dict, labels: List[str], urls: Dict[str, List[str]]) -> List[Dict]:
+    rows = []
+    for row in (data.get("matrix") or [])[:COMPARE_DIMENSIONS]:
+        if not isinstance(row, dict) or not row.get("dimension"):
+            continue
+        values = row.get("values") if isinstance(row.get("values"), dict) else {}
+        cites = row.get("cites") if isinstance(row.get("cites"), dict) else {}
+        out = {
+            "dimension": str(row["dimension"]),
+            "values": {l: str(values.get(l) or "unknown") for l in labels},
+            "cites": {l: _cite_ids(cites.get(l) or [], len(urls[l])) for l in labels},
+        }
+        for l in labels[:2]:  # two-product clients read a_value / b_value
+            out[f"{l.lower()}_value"] = out["values"][l]
+            out[f"{l.lower()}_cites"] = out["cites"][l]
+        rows.append(out)
+    return rows
+
+
+def _web_tag(summary: str) -> str:
+    if summary and "(looked up on the web" not in summary:
+        summary = summary.strip() + "\n(looked up on the web)"
+    return summary
+
+
+async def compare_products(question: str, topics: Dict[str, Dict]) -> Dict:
+    """Evidence for every product concurrently, then one matrix completion (plus one fallback at most)."""
+    from app.core.groq_service import groq_complete_async, groq_complete_json_async
+
+    t0 = time.perf_counter()
+    labels = list(topics)
+    evidence = await gather_evidence(question, topics)
+    urls = {l: [u for u, _ in evidence.get(l) or []] for l in labels}
+
+    system, user = _matrix_prompt(question, topics, evidence)
+    data = await groq_complete_json_async(system, user, max_tokens=min(2000, 400 + 160 * len(labels)))
+    calls = 1
+    summaries = data.get("summaries") if isinstance(data.get("summaries"), dict) else {}
+    matrix = _matrix_rows(data, labels, urls) if "error" not in data else []
+    recommendation = str(data.get("recommendation") or "").strip()
+    if not recommendation:
+        metrics.incr("compare.matrix_fallback")
+        recommendation = (await groq_complete_async(
+            f"Recommend one of the products {', '.join(labels)} concisely (2 lines). "
+            "If ambiguous, say what extra info is needed.",
+            user,
+        ) or "").strip()
+        calls += 1
+
+    products = []
+    for l in labels:
+        pages = evidence.get(l) or []
+        summary = str(summaries.get(l) or "").strip() or (pages[0][1][:400] if pages else "No reliable sources were found.")
+        products.append({
+            "label": l,
+            "name": _name(topics[l], l),
+            "summary": _web_tag(summary),
+            "sources": urls[l],
+            "confidence": 0.7 if pages else 0.3,
+        })
+    metrics.incr("compare.asks")
+    metrics.observe("compare.products", len(labels))
+    metrics.observe("compare.ask_ms", (time.perf_counter() - t0) * 1000.0)
+    out = {p["label"]: {k: p[k] for k in ("summary", "sources", "confidence")} for p in products}
+    out.update({
+        "products": products,
+        "matrix": matrix,
+        "comparator": "matrix" if matrix else "partial",
+        "recommendation": recommendation,
+        "llm_calls": calls,
+    })
+    return out
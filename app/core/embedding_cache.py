@@ -0,0 +1,270 @@
+# app/core/embedding_cache.py
+"""
+Content-addressed, on-disk embedding cache for document chunks.
+
+Layout per model (under RAG_CACHE_DIR/embeddings/<model>/):
+- vectors.f32  memory-mapped float32 matrix [capacity, dim]
+- keys.bin     memory-mapped sha1 digest per row [capacity, 20]; zero = free
+- index.json   dim/capacity + LRU order (oldest first) of row digests
+
+The (model, sha1(chunk)) -> row map is rebuilt from keys.bin on open, so the
+index file only has to carry recency. Rows are re-verified against keys.bin
+after reading, so a row recycled by another worker is treated as a miss.
+
+Env:
+- RAG_CACHE_DIR         cache root (default ~/.cache/rag_chatbot)
+- EMBED_CACHE           "0" to disable
+- EMBED_CACHE_MAX_MB    size bound for vectors+keys per model (default 256)
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from app.core import metrics
+from app.core.utils import CACHE_DIR
+from app.core.embedding_service import get_model, DEFAULT_EMBED_MODEL
+
+try:
+    import fcntl  # POSIX only; on Windows we run single-writer without the file lock
+except Exception:
+    fcntl = None
+
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE", "1").lower() not in ("0", "false", "no", "off")
+EMBED_CACHE_MAX_MB = float(os.getenv("EMBED_CACHE_MAX_MB", "256"))
+
+_DIGEST = 20
+_INITIAL_CAPACITY = 1024
+
+
+def chunk_key(text: str) -> bytes:
+    return hashlib.sha1((text or "").encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, model_name: str, dim: int, root: str = CACHE_DIR, max_mb: float = EMBED_CACHE_MAX_MB):
+        safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.dir = os.path.join(root, "embeddings", safe)
+        os.makedirs(self.dir, exist_ok=True)
+        self.model_name = model_name
+        self.dim = int(dim)
+        self.max_entries = max(1, int(max_mb * 1024 * 1024) // (self.dim * 4 + _DIGEST))
+
+        self._vec_path = os.path.join(self.dir, "vectors.f32")
+        self._key_path = os.path.join(self.dir, "keys.bin")
+        self._idx_path = os.path.join(self.dir, "index.json")
+        self._lock_path = os.path.join(self.dir, ".lock")
+
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[bytes, int]" = OrderedDict()
+        self._free: List[int] = []
+        self._capacity = 0
+        self._vecs: Optional[np.memmap] = None
+        self._keys: Optional[np.memmap] = None
+        self._idx_mtime = 0.0
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    # ---------- Storage ----------
+    def _map(self, capacity: int):
+        for path, width in ((self._vec_path, self.dim * 4), (self._key_path, _DIGEST)):
+            need = capacity * width
+            with open(path, "ab") as f:
+                if f.tell() < need:
+                    f.truncate(need)
+        self._vecs = np.memmap(self._vec_path, dtype="float32", mode="r+", shape=(capacity, self.dim))
+        self._keys = np.memmap(self._key_path, dtype="uint8", mode="r+", shape=(capacity, _DIGEST))
+        self._capacity = capacity
+
+    def _load(self):
+        meta = {}
+        try:
+            with open(self._idx_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self._idx_mtime = os.path.getmtime(self._idx_path)
+        except Exception:
+            pass
+        if meta and int(meta.get("dim", self.dim)) != self.dim:
+            # model changed dimension under the same name: start over
+            for p in (self._vec_path, self._key_path, self._idx_path):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+            meta = {}
+
+        on_disk = os.path.getsize(self._key_path) // _DIGEST if os.path.exists(self._key_path) else 0
+        self._map(max(int(meta.get("capacity", 0)), on_disk, min(_INITIAL_CAPACITY, self.max_entries)))
+
+        rows: Dict[bytes, int] = {}
+        for row in np.flatnonzero(self._keys.any(axis=1)):
+            rows[bytes(self._keys[row])] = int(row)
+        order = [bytes.fromhex(h) for h in meta.get("lru", [])]
+        self._lru = OrderedDict((k, rows.pop(k)) for k in order if k in rows)
+        for k, row in rows.items():  # rows written by another worker since the last index save
+            self._lru[k] = row
+        used = set(self._lru.values())
+        self._free = [r for r in range(self._capacity - 1, -1, -1) if r not in used]
+
+    def _save_index(self):
+        tmp = self._idx_path + f".{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "model": self.model_name,
+                "dim": self.dim,
+                "capacity": self._capacity,
+                "lru": [k.hex() for k in self._lru],
+            }, f)
+        os.replace(tmp, self._idx_path)
+        self._idx_mtime = os.path.getmtime(self._idx_path)
+
+    def _refresh_if_changed(self):
+        try:
+            mtime = os.path.getmtime(self._idx_path)
+        except OSError:
+            return
+        if mtime != self._idx_mtime:
+            self._load()
+
+    # ---------- Public ----------
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        out: List[Optional[np.ndarray]] = []
+        with self._lock:
+            self._refresh_if_changed()
+            for k in keys:
+                row = self._lru.get(k)
+                vec = None
+                if row is not None:
+                    vec = np.array(self._vecs[row])
+                    if bytes(self._keys[row]) != k:  # recycled underneath us
+                        vec = None
+                        self._lru.pop(k, None)
+                    else:
+                        self._lru.move_to_end(k)
+                out.append(vec)
+        hits = sum(v is not None for v in out)
+        self.hits += hits
+        self.misses += len(out) - hits
+        metrics.incr("embedding_cache.hit", hits)
+        metrics.incr("embedding_cache.miss", len(out) - hits)
+        return out
+
+    def put_many(self, keys: List[bytes], vecs: np.ndarray):
+        if not keys:
+            return
+        with self._lock:
+            lock_f = open(self._lock_path, "a+")
+            try:
+                if fcntl:
+                    fcntl.flock(lock_f, fcntl.LOCK_EX)
+                self._refresh_if_changed()
+                for k, v in zip(keys, vecs):
+                    if k in self._lru:
+                        self._lru.move_to_end(k)
+                        continue
+                    while len(self._lru) >= self.max_entries:
+                        _, old = self._lru.popitem(last=False)
+                        self._keys[old] = 0
+                        self._free.append(old)
+                        metrics.incr("embedding_cache.evict")
+                    if not self._free:
+                        grow = min(self._capacity * 2, self.max_entries)
+                        self._vecs.flush()
+                        self._keys.flush()
+                        old_cap = self._capacity
+                        self._map(max(grow, old_cap + 1))
+                        self._free = list(range(self._capacity - 1, old_cap - 1, -1))
+                    row = self._free.pop()
+                    # key cleared -> vector -> key, so readers never match a half-written row
+                    self._keys[row] = 0
+                    self._vecs[row] = v
+                    self._keys[row] = np.frombuffer(k, dtype="uint8")
+                    self._lru[k] = row
+                self._vecs.flush()
+                self._keys.flush()
+                self._save_index()
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_f, fcntl.LOCK_UN)
+                lock_f.close()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "capacity": self._capacity,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# ---------- Registry ----------
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(model_name: str = DEFAULT_EMBED_MODEL) -> Optional[EmbeddingCache]:
+    if not EMBED_CACHE_ENABLED:
+        return None
+    cache = _caches.get(model_name)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(model_name)
+            if cache is None:
+                dim = int(get_model(model_name).get_sentence_embedding_dimension())
+                try:
+                    cache = EmbeddingCache(model_name, dim)
+                except OSError:
+                    return None  # read-only FS etc.: run uncached
+                _caches[model_name] = cache
+    return cache
+
+
+def embed_chunks(chunks: List[str], model_name: str = DEFAULT_EMBED_MODEL) -> np.ndarray:
+    """
+    Normalized float32 embeddings for chunks; only chunks not seen before
+    (for this model) are sent through the encoder.
+    """
+    model = get_model(model_name)
+    if not chunks:
+        return np.zeros((0, int(model.get_sentence_embedding_dimension())), dtype="float32")
+    cache = get_cache(model_name)
+    if cache is None:
+        return model.encode(chunks, normalize_embeddings=True, convert_to_numpy=True).astype("float32")
+
+    keys = [chunk_key(c) for c in chunks]
+    cached = cache.get_many(keys)
+    missing = [i for i, v in enumerate(cached) if v is None]
+    out = np.empty((len(chunks), cache.dim), dtype="float32")
+    for i, v in enumerate(cached):
+        if v is not None:
+            out[i] = v
+    if missing:
+        fresh = model.encode(
+            [chunks[i] for i in missing],
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        ).astype("float32")
+        out[missing] = fresh
+        # de-dup repeated chunks inside one document before writing
+        seen = {}
+        for j, i in enumerate(missing):
+            seen.setdefault(keys[i], j)
+        cache.put_many(list(seen.keys()), fresh[list(seen.values())])
+    return out
+
+
+def cache_stats() -> Dict:
+    return {name: c.stats() for name, c in _caches.items()}
+
+
+metrics.register("embedding_cache", cache_stats)
@@ -0,0 +1,112 @@
+# app/core/embedding_service.py
+"""
+Process-wide embedding model registry.
+
+Every RagIndex used to construct its own SentenceTransformer, which reloads the
+weights from disk on each topic init / RAG toggle. get_model() loads a model
+once per process (thread-safe, one lock per model name) and hands out the
+shared instance afterwards.
+
+Env:
+- EMBED_MODEL   default model name (all-MiniLM-L6-v2)
+- EMBED_WARMUP  "1" to load + warm the default model at FastAPI startup
+"""
+from __future__ import annotations
+from typing import Dict, Iterable, Optional
+import os
+import threading
+import time
+
+# Install: sentence-transformers
+from sentence_transformers import SentenceTransformer
+
+from app.core import metrics
+
+DEFAULT_EMBED_MODEL = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
+
+_models: Dict[str, SentenceTransformer] = {}
+_load_locks: Dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+_stats: Dict[str, Dict] = {}
+
+
+def _rss_bytes() -> int:
+    """Current resident set size (Linux /proc first, ru_maxrss as a fallback)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        pass
+    try:
+        import resource
+        return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) * 1024
+    except Exception:
+        return 0
+
+
+def _param_bytes(model: SentenceTransformer) -> int:
+    try:
+        return int(sum(p.numel() * p.element_size() for p in model.parameters()))
+    except Exception:
+        return 0
+
+
+def get_model(model_name: str = DEFAULT_EMBED_MODEL) -> SentenceTransformer:
+    """Return the shared model instance, loading it on first use."""
+    model = _models.get(model_name)
+    if model is not None:
+        metrics.incr("embedding.model.reuse")
+        return model
+
+    with _registry_lock:
+        lock = _load_locks.setdefault(model_name, threading.Lock())
+
+    with lock:
+        model = _models.get(model_name)
+        if model is not None:
+            return model
+        rss_before = _rss_bytes()
+        t0 = time.perf_counter()
+        model = SentenceTransformer(model_name)
+        load_ms = (time.perf_counter() - t0) * 1000.0
+        _stats[model_name] = {
+            "load_ms": round(load_ms, 1),
+            "loaded_at": time.time(),
+            "param_bytes": _param_bytes(model),
+            "rss_delta_bytes": max(0, _rss_bytes() - rss_before),
+            "warm": False,
+        }
+        metrics.incr("embedding.model.load")
+        metrics.observe("embedding.model.load_ms", load_ms)
+        _models[model_name] = model
+    return model
+
+
+def is_loaded(model_name: str = DEFAULT_EMBED_MODEL) -> bool:
+    return model_name in _models
+
+
+def warmup(model_names: Optional[Iterable[str]] = None) -> Dict:
+    """
+    Load the given models (default: DEFAULT_EMBED_MODEL) and run one tiny encode
+    so the first user request doesn't pay for lazy kernel/tokenizer init.
+    """
+    out = {}
+    for name in (list(model_names) if model_names else [DEFAULT_EMBED_MODEL]):
+        model = get_model(name)
+        t0 = time.perf_counter()
+        model.encode(["warmup"], normalize_embeddings=True, convert_to_numpy=True)
+        warm_ms = (time.perf_counter() - t0) * 1000.0
+        _stats[name].update({"warm": True, "warmup_ms": round(warm_ms, 1)})
+        out[name] = dict(_stats[name])
+    return out
+
+
+def model_stats() -> Dict:
+    return {
+        "rss_bytes": _rss_bytes(),
+        "models": {name: dict(s) for name, s in _stats.items()},
+    }
+
+
+metrics.register("embedding_models", model_stats)
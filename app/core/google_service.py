@@ -1,9 +1,13 @@
 # app/core/google_service.py
 
 import os
+import re
 import requests
 from bs4 import BeautifulSoup
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from app.core.cache import get_cache
+from app.core.utils import CACHE_DIR
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
 # Allow either GOOGLE_CSE_ID or GOOGLE_CX in .env
@@ -13,23 +17,77 @@ HEADERS = {
     "User-Agent": "Mozilla/5.0 (compatible; ProductQAAssistant/1.0; +https://example.local)"
 }
 
+# =========================
+# Search result cache (shared with web_service._google_search)
+# =========================
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "86400"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "4096"))
+SEARCH_CACHE_PERSIST = os.getenv("SEARCH_CACHE_PERSIST", "1").lower() not in ("0", "false", "no", "off")
+
+search_cache = get_cache(
+    "cse_search",
+    maxsize=SEARCH_CACHE_SIZE,
+    ttl=SEARCH_CACHE_TTL,
+    persist_path=os.path.join(CACHE_DIR, "cse_search.json") if SEARCH_CACHE_PERSIST else None,
+)
+
+_SPACE = re.compile(r"\s+")
+
+def normalize_query(query: str) -> str:
+    """Lowercased, whitespace collapsed. Words and punctuation are kept: "USB to USB cable" != "USB to cable"."""
+    return _SPACE.sub(" ", (query or "").lower()).strip()
+
+def search_cache_key(query: str, num: int) -> str:
+    return f"{int(num)}|{normalize_query(query)}"
+
+def cached_search(query: str, num: int) -> Optional[List[Dict]]:
+    """[{"title", "link"}, ...] from the cache, or None."""
+    return search_cache.get(search_cache_key(query, num))
+
+def store_search(query: str, num: int, results: List[Dict]):
+    if results:  # never cache empty/error results
+        search_cache.set(search_cache_key(query, num), results)
+
+def _as_tuples(results: List[Dict]) -> List[Tuple[str, str]]:
+    return [(r.get("title") or "", r["link"]) for r in results]
+
 # =========================
 # Google Custom Search
 # =========================
-def google_search(query: str, num: int = 5) -> List[Tuple[str, str]]:
+CSE_URL = "https://www.googleapis.com/customsearch/v1"
+
+def _cse_params(query: str, num: int) -> Dict:
+    return {"q": query, "key": GOOGLE_API_KEY, "cx": GOOGLE_CSE_ID, "num": num}
+
+def _lookup(query: str, num: int, use_cache: bool) -> Optional[List[Tuple[str, str]]]:
+    hit = cached_search(query, num) if use_cache else None
+    return _as_tuples(hit) if hit is not None else None
+
+def _results(data: Dict, query: str, num: int, use_cache: bool) -> List[Tuple[str, str]]:
+    """(title, link) from a CSE response, stored in the search cache."""
+    out = [(item["title"], item["link"]) for item in data.get("items", [])]
+    if use_cache:
+        store_search(query, num, [{"title": t, "link": l} for t, l in out])
+    return out
+
+def google_search(query: str, num: int = 5, use_cache: bool = True) -> List[Tuple[str, str]]:
     """Search Google Custom Search API and return (title, link)."""
-    url = "https://www.googleapis.com/customsearch/v1"
-    params = {
-        "q": query,
-        "key": GOOGLE_API_KEY,
-        "cx": GOOGLE_CSE_ID,
-        "num": num
-    }
-    resp = requests.get(url, params=params, headers=HEADERS, timeout=15)
+    hit = _lookup(query, num, use_cache)
+    if hit is not None:
+        return hit
+    resp = requests.get(CSE_URL, params=_cse_params(query, num), headers=HEADERS, timeout=15)
+    resp.raise_for_status()
+    return _results(resp.json(), query, num, use_cache)
+
+async def google_search_async(query: str, num: int = 5, use_cache: bool = True) -> List[Tuple[str, str]]:
+    """google_search over the shared keep-alive httpx pool (non-blocking)."""
+    from app.core.async_io import get_http_client
+    hit = _lookup(query, num, use_cache)
+    if hit is not None:
+        return hit
+    resp = await get_http_client().get(CSE_URL, params=_cse_params(query, num), headers=HEADERS, timeout=15)
     resp.raise_for_status()
-    data = resp.json()
-    items = data.get("items", [])
-    return [(item["title"], item["link"]) for item in items]
+    return _results(resp.json(), query, num, use_cache)
 
 # =========================
 # Web Scraping
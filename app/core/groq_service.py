@@ -1,20 +1,86 @@
 # app/core/groq_service.py
-import os, time, requests
+import os, json, asyncio, hashlib, threading, requests
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from app.core import metrics
+from app.core.cache import get_cache
+from app.core.rate_limit import groq_limiter, estimate_tokens
+from app.core.utils import CACHE_DIR
 
 BASE_URL = "https://api.groq.com/openai/v1/chat/completions"
 DEFAULT_MODEL = "llama-3.1-8b-instant"
 HTTP_TIMEOUT = 20
 
+# Calls are admitted by the RPM/TPM limiter (app.core.rate_limit); a 413/429
+# is retried up to GROQ_MAX_RETRIES times, after the limiter has absorbed the
+# server's retry-after / reset headers, with a smaller completion budget.
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "2"))
+_FIRST_MAX_TOKENS = 500
+_RETRY_MAX_TOKENS = 300
+
+class GroqRateLimited(RuntimeError):
+    """413/429 from Groq (message starts with 'TPM/Rate limit')."""
+
+# Exact-match completion cache keyed by sha256(model, temperature, max_tokens,
+# response_format, messages). Only successful, non-empty completions are
+# stored (errors raise below this layer, so error / rate-limit strings never
+# reach it). Identical concurrent calls are coalesced into one upstream request.
+GROQ_CACHE = os.getenv("GROQ_CACHE", "1").lower() not in ("0", "false", "no", "off")
+GROQ_CACHE_TTL = float(os.getenv("GROQ_CACHE_TTL", "21600"))
+GROQ_CACHE_SIZE = int(os.getenv("GROQ_CACHE_SIZE", "2048"))
+GROQ_CACHE_PERSIST = os.getenv("GROQ_CACHE_PERSIST", "1").lower() not in ("0", "false", "no", "off")
+
+completion_cache = get_cache(
+    "groq_completion",
+    maxsize=GROQ_CACHE_SIZE,
+    ttl=GROQ_CACHE_TTL,
+    persist_path=os.path.join(CACHE_DIR, "groq_completion.json") if GROQ_CACHE_PERSIST else None,
+)
+_inflight: Dict = {}  # (loop id, key) -> upstream task
+_inflight_sync: Dict[str, list] = {}  # key -> [threading.Event, result, error]
+_inflight_lock = threading.Lock()
+
+# Token usage accumulator for the current task (see track_usage)
+_usage_var: ContextVar[Optional[Dict]] = ContextVar("groq_usage", default=None)
+
+@contextmanager
+def track_usage():
+    """Collect Groq token usage of every call made inside the block (same task)."""
+    acc = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    token = _usage_var.set(acc)
+    try:
+        yield acc
+    finally:
+        try:
+            _usage_var.reset(token)
+        except ValueError:
+            pass  # closed from another context (e.g. an abandoned stream)
+
+def _record_usage(usage: Optional[Dict], reserved: int = 0):
+    usage = usage or {}
+    groq_limiter.settle(reserved, int(usage.get("total_tokens") or 0) or reserved)
+    metrics.incr("groq.calls")
+    acc = _usage_var.get()
+    if acc is not None:
+        acc["calls"] += 1
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        n = int(usage.get(key) or 0)
+        if n:
+            metrics.incr(f"groq.{key}", n)
+            if acc is not None:
+                acc[key] += n
+
 def _get_api_key() -> str:
     api_key = os.getenv("GROQ_API_KEY", "").strip()
     if not api_key:
         raise RuntimeError("GROQ_API_KEY is not set in the environment.")
     return api_key
 
-def _post_chat(messages, model=DEFAULT_MODEL, temperature=0.2, max_tokens=500) -> str:
-    api_key = _get_api_key()
+def _build_request(messages, model, temperature, max_tokens, response_format=None):
     headers = {
-        "Authorization": f"Bearer {api_key}",
+        "Authorization": f"Bearer {_get_api_key()}",
         "Content-Type": "application/json",
         "Accept": "application/json",
     }
@@ -24,41 +90,290 @@ def _post_chat(messages, model=DEFAULT_MODEL, temperature=0.2, max_tokens=500) -
         "temperature": float(temperature),
         "max_tokens": int(max_tokens),
     }
-    resp = requests.post(BASE_URL, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
+    if response_format:
+        payload["response_format"] = response_format
+    return headers, payload
+
+def _raise_for_status(status_code: int, body: str):
+    if status_code == 200:
+        return
+    txt = (body or "").strip()
+    if status_code in (413, 429):
+        # Token-per-minute or rate/size issues
+        raise GroqRateLimited(f"TPM/Rate limit: {status_code} {txt[:240]}")
+    if status_code == 401:
+        raise RuntimeError("Groq 401 Unauthorized: invalid or missing GROQ_API_KEY.")
+    if status_code >= 500:
+        raise RuntimeError(f"Groq {status_code} server error. Body: {txt[:240]}")
+    raise RuntimeError(f"Groq {status_code} error. Body: {txt[:240]}")
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def _http() -> requests.Session:
+    """Keep-alive connection pool for the sync path (worker threads)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                sess = requests.Session()
+                sess.mount("https://", requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=32))
+                _session = sess
+    return _session
+
+def _settle_failed(reserved: int, status_code: int):
+    # a rejected call used no completion tokens; a 429 stays charged (bucket already zeroed)
+    if status_code != 429:
+        groq_limiter.settle(reserved, 0)
+
+# ---------- Completion cache / single flight ----------
+def completion_key(messages, model, temperature, max_tokens, response_format=None) -> str:
+    blob = json.dumps(
+        [model, round(float(temperature), 4), int(max_tokens), response_format, messages],
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def _cacheable(text: Optional[str], response_format=None) -> bool:
+    if not text or not text.strip():
+        return False
+    if response_format:
+        try:
+            json.loads(text)
+        except ValueError:
+            return False
+    return True
+
+def _post_chat(messages, model=DEFAULT_MODEL, temperature=0.2, max_tokens=500) -> str:
+    """Cached, coalesced _request_chat (threads wait on the first caller's request)."""
+    if not GROQ_CACHE:
+        return _request_chat(messages, model, temperature, max_tokens)
+    key = completion_key(messages, model, temperature, max_tokens)
+    hit = completion_cache.get(key)
+    if hit is not None:
+        return hit
+    with _inflight_lock:
+        slot = _inflight_sync.get(key)
+        leader = slot is None
+        if leader:
+            slot = _inflight_sync[key] = [threading.Event(), None, None]
+    if not leader:
+        metrics.incr("groq.coalesced")
+        slot[0].wait(HTTP_TIMEOUT * (GROQ_MAX_RETRIES + 2))
+        if slot[2] is not None:
+            raise slot[2]
+        if slot[1] is not None:
+            return slot[1]
+        return _request_chat(messages, model, temperature, max_tokens)  # leader timed out
+    try:
+        text = _request_chat(messages, model, temperature, max_tokens)
+        slot[1] = text
+        if _cacheable(text):
+            completion_cache.set(key, text)
+        return text
+    except Exception as e:
+        slot[2] = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight_sync.pop(key, None)
+        slot[0].set()
 
+async def _post_chat_async(messages, model=DEFAULT_MODEL, temperature=0.2, max_tokens=500, response_format=None) -> str:
+    """
+    Cached, coalesced _request_chat_async: concurrent identical calls await
+    one upstream task (shielded, so a cancelled caller doesn't cancel the rest).
+    """
+    if not GROQ_CACHE:
+        return await _request_chat_async(messages, model, temperature, max_tokens, response_format)
+    key = completion_key(messages, model, temperature, max_tokens, response_format)
+    hit = completion_cache.get(key)
+    if hit is not None:
+        return hit
+    flight = (id(asyncio.get_running_loop()), key)
+    task = _inflight.get(flight)
+    if task is None:
+        task = asyncio.ensure_future(_request_chat_async(messages, model, temperature, max_tokens, response_format))
+        _inflight[flight] = task
+
+        def landed(t: asyncio.Future):
+            _inflight.pop(flight, None)
+            if not t.cancelled() and t.exception() is None and _cacheable(t.result(), response_format):
+                completion_cache.set(key, t.result())
+
+        task.add_done_callback(landed)
+    else:
+        metrics.incr("groq.coalesced")
+    return await asyncio.shield(task)
+
+def _request_chat(messages, model=DEFAULT_MODEL, temperature=0.2, max_tokens=500) -> str:
+    headers, payload = _build_request(messages, model, temperature, max_tokens)
+    reserved = groq_limiter.acquire_sync(estimate_tokens(messages, max_tokens))
+    try:
+        resp = _http().post(BASE_URL, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
+    except Exception:
+        groq_limiter.settle(reserved, 0)
+        raise
+    groq_limiter.observe(resp.status_code, resp.headers)
     if resp.status_code != 200:
-        txt = (resp.text or "").strip()
-        if resp.status_code in (413, 429):
-            # Token-per-minute or rate/size issues
-            raise RuntimeError(f"TPM/Rate limit: {resp.status_code} {txt[:240]}")
-        if resp.status_code == 401:
-            raise RuntimeError("Groq 401 Unauthorized: invalid or missing GROQ_API_KEY.")
-        if resp.status_code >= 500:
-            raise RuntimeError(f"Groq {resp.status_code} server error. Body: {txt[:240]}")
-        raise RuntimeError(f"Groq {resp.status_code} error. Body: {txt[:240]}")
+        _settle_failed(reserved, resp.status_code)
+    _raise_for_status(resp.status_code, resp.text)
+    data = resp.json()
+    _record_usage(data.get("usage"), reserved)
+    return (data["choices"][0]["message"]["content"] or "").strip()
 
+async def _request_chat_async(messages, model=DEFAULT_MODEL, temperature=0.2, max_tokens=500, response_format=None) -> str:
+    """Same as _request_chat, over the shared keep-alive httpx pool."""
+    from app.core.async_io import get_http_client
+    headers, payload = _build_request(messages, model, temperature, max_tokens, response_format)
+    reserved = await groq_limiter.acquire(estimate_tokens(messages, max_tokens))
+    try:
+        resp = await get_http_client().post(BASE_URL, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
+    except BaseException:
+        groq_limiter.settle(reserved, 0)
+        raise
+    groq_limiter.observe(resp.status_code, resp.headers)
+    if resp.status_code != 200:
+        _settle_failed(reserved, resp.status_code)
+    _raise_for_status(resp.status_code, resp.text)
     data = resp.json()
+    _record_usage(data.get("usage"), reserved)
     return (data["choices"][0]["message"]["content"] or "").strip()
 
-def groq_complete(system: str, user: str) -> str:
-    """Single-turn completion pinned to llama-3.1-8b-instant with 1 retry on TPM/Rate."""
-    messages = [
+def _messages(system: str, user: str):
+    return [
         {"role": "system", "content": system or ""},
         {"role": "user", "content": user or ""},
     ]
+
+def _attempts():
+    """(attempt, temperature, max_tokens): first call, then smaller retries after a 413/429."""
+    yield 0, 0.3, _FIRST_MAX_TOKENS
+    for attempt in range(1, GROQ_MAX_RETRIES + 1):
+        yield attempt, 0.2, _RETRY_MAX_TOKENS
+
+def groq_complete(system: str, user: str) -> str:
+    """Single-turn completion pinned to llama-3.1-8b-instant, rate-limited, retried on TPM/Rate."""
+    messages = _messages(system, user)
+    for attempt, temperature, max_tokens in _attempts():
+        try:
+            return _post_chat(messages, model=DEFAULT_MODEL, temperature=temperature, max_tokens=max_tokens)
+        except GroqRateLimited as e:
+            metrics.incr("groq.retries")
+            if attempt == GROQ_MAX_RETRIES:
+                return f"Groq error after retry: {e}"
+        except Exception as e:
+            return f"Groq error: {e}"
+
+async def groq_complete_async(system: str, user: str) -> str:
+    """Non-blocking groq_complete: pooled connection, limiter waits instead of fixed sleeps."""
+    messages = _messages(system, user)
+    for attempt, temperature, max_tokens in _attempts():
+        try:
+            return await _post_chat_async(messages, model=DEFAULT_MODEL, temperature=temperature, max_tokens=max_tokens)
+        except GroqRateLimited as e:
+            metrics.incr("groq.retries")
+            if attempt == GROQ_MAX_RETRIES:
+                return f"Groq error after retry: {e}"
+        except Exception as e:
+            return f"Groq error: {e}"
+
+async def _stream_chat_async(messages, model=DEFAULT_MODEL, temperature=0.2, max_tokens=500):
+    """
+    Yield content deltas from Groq's streaming (SSE) chat completions. Shares
+    the completion cache: a hit is yielded as one piece, and a stream that
+    completes is stored (streams are not coalesced).
+    """
+    from app.core.async_io import get_http_client
+    key = completion_key(messages, model, temperature, max_tokens) if GROQ_CACHE else None
+    hit = completion_cache.get(key) if key else None
+    if hit is not None:
+        yield hit
+        return
+    parts = []
+    headers, payload = _build_request(messages, model, temperature, max_tokens)
+    headers["Accept"] = "text/event-stream"
+    payload["stream"] = True
+    payload["stream_options"] = {"include_usage": True}
+    reserved = await groq_limiter.acquire(estimate_tokens(messages, max_tokens))
+    try:
+        stream = get_http_client().stream("POST", BASE_URL, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
+        resp = await stream.__aenter__()
+    except BaseException:
+        groq_limiter.settle(reserved, 0)
+        raise
+    try:
+        groq_limiter.observe(resp.status_code, resp.headers)
+        if resp.status_code != 200:
+            _settle_failed(reserved, resp.status_code)
+            body = (await resp.aread()).decode("utf-8", "replace")
+            _raise_for_status(resp.status_code, body)
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                if key and _cacheable("".join(parts).strip()):
+                    completion_cache.set(key, "".join(parts).strip())
+                break
+            try:
+                chunk = json.loads(data)
+            except ValueError:
+                continue
+            usage = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage")
+            if usage:
+                _record_usage(usage, reserved)
+            delta = ((chunk.get("choices") or [{}])[0].get("delta") or {}).get("content")
+            if delta:
+                parts.append(delta)
+                yield delta
+    finally:
+        await stream.__aexit__(None, None, None)
+
+async def groq_stream_async(system: str, user: str):
+    """
+    Streaming groq_complete: yields text pieces as they arrive. Same retry
+    policy (only if nothing was streamed yet); errors are yielded as text.
+    """
+    messages = _messages(system, user)
+    started = False
+    for attempt, temperature, max_tokens in _attempts():
+        try:
+            async for piece in _stream_chat_async(messages, model=DEFAULT_MODEL, temperature=temperature, max_tokens=max_tokens):
+                started = True
+                yield piece
+            return
+        except GroqRateLimited as e:
+            if started or attempt == GROQ_MAX_RETRIES:
+                yield f"Groq error after retry: {e}" if attempt else f"Groq error: {e}"
+                return
+            metrics.incr("groq.retries")
+        except Exception as e:
+            yield f"Groq error: {e}"
+            return
+
+async def groq_complete_json_async(system: str, user: str, max_tokens: int = 800) -> Dict:
+    """
+    JSON-mode completion (response_format=json_object). Returns the parsed
+    object, or {"error": "..."} if the call or the parse failed. Retries after
+    a 413/429 shrink max_tokens in the same ratio as _attempts().
+    """
+    messages = _messages(system, user)
+    fmt = {"type": "json_object"}
     try:
-        return _post_chat(messages, model=DEFAULT_MODEL, temperature=0.3, max_tokens=500)
-    except RuntimeError as e:
-        msg = str(e)
-        if "TPM/Rate limit" in msg:
-            time.sleep(3)
+        for attempt, temperature, tokens in _attempts():
+            budget = max(1, max_tokens * tokens // _FIRST_MAX_TOKENS)
             try:
-                return _post_chat(messages, model=DEFAULT_MODEL, temperature=0.2, max_tokens=300)
-            except Exception as e2:
-                return f"Groq error after retry: {e2}"
-        return f"Groq error: {e}"
+                raw = await _post_chat_async(messages, model=DEFAULT_MODEL, temperature=temperature, max_tokens=budget, response_format=fmt)
+                break
+            except GroqRateLimited:
+                metrics.incr("groq.retries")
+                if attempt == GROQ_MAX_RETRIES:
+                    raise
+        data = json.loads(raw)
+        return data if isinstance(data, dict) else {"error": "Groq JSON response is not an object"}
     except Exception as e:
-        return f"Groq error: {e}"
+        return {"error": f"Groq error: {e}"}
 
 def chat_complete(system: str, user: str) -> str:
     # Backwards-compatible alias
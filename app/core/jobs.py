@@ -0,0 +1,146 @@
+# app/core/jobs.py
+"""
+Background ingestion jobs, so /api/init-topic returns at once instead of
+parsing, OCR-ing and embedding a large PDF inside the request.
+
+- submit(fn) registers a Job and runs `await fn(job)` as an asyncio task; at
+  most INGEST_WORKERS jobs run at once, the rest wait in the "queued" stage.
+  The heavy work inside a job already goes through the shared process / thread
+  pools, so this only bounds how many documents compete for them.
+- fn reports progress with job.progress(stage, pages_done, pages_total); the
+  ETA is extrapolated from the page rate since the job started.
+- Finished jobs stay pollable (GET /api/jobs/{id}) for INGEST_JOB_TTL seconds.
+
+Env:
+- INGEST_BACKGROUND   PDF uploads to /api/init-topic run as jobs (default 1)
+- INGEST_WORKERS      jobs running at once (default 2)
+- INGEST_MAX_QUEUED   submit() refuses new jobs past this many waiting (default 100)
+- INGEST_JOB_TTL      seconds a finished job is kept (default 3600)
+"""
+from __future__ import annotations
+from typing import Awaitable, Callable, Dict, Optional
+from collections import OrderedDict
+import asyncio
+import os
+import time
+import uuid
+
+from app.core import metrics
+
+INGEST_BACKGROUND = os.getenv("INGEST_BACKGROUND", "1").lower() not in ("0", "false", "no", "off")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_MAX_QUEUED = int(os.getenv("INGEST_MAX_QUEUED", "100"))
+INGEST_JOB_TTL = int(os.getenv("INGEST_JOB_TTL", "3600"))
+
+_FINAL_STAGES = ("done", "failed", "cancelled")
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.stage = "queued"
+        self.pages_done = 0
+        self.pages_total = 0
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.stage in _FINAL_STAGES
+
+    def progress(self, stage: str, pages_done: Optional[int] = None, pages_total: Optional[int] = None):
+        self.stage = stage
+        if pages_done is not None:
+            self.pages_done = int(pages_done)
+        if pages_total is not None:
+            self.pages_total = int(pages_total)
+
+    def eta_seconds(self) -> Optional[float]:
+        if self.done or not self.started or not self.pages_done or self.pages_total <= self.pages_done:
+            return 0.0 if self.done else None
+        elapsed = time.time() - self.started
+        return round(elapsed / self.pages_done * (self.pages_total - self.pages_done), 1)
+
+    def to_dict(self) -> Dict:
+        end = self.finished or time.time()
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "stage": self.stage,
+            "done": self.done,
+            "pages_done": self.pages_done,
+            "pages_total": self.pages_total,
+            "eta_seconds": self.eta_seconds(),
+            "queued_seconds": round((self.started or end) - self.created, 2),
+            "elapsed_seconds": round(end - self.started, 2) if self.started else 0.0,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    def __init__(self, workers: int = INGEST_WORKERS, max_queued: int = INGEST_MAX_QUEUED, ttl: int = INGEST_JOB_TTL):
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._slots = asyncio.Semaphore(self.workers)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+
+    def submit(self, fn: Callable[[Job], Awaitable[Optional[Dict]]], kind: str = "ingest") -> Job:
+        """Start fn(job) in the background (must be called from the event loop)."""
+        self._prune()
+        if sum(1 for j in self._jobs.values() if j.stage == "queued") >= self.max_queued:
+            metrics.incr("jobs.rejected")
+            raise QueueFull("Ingestion queue is full, try again shortly")
+        job = Job(kind)
+        self._jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, fn))
+        metrics.incr("jobs.submitted")
+        return job
+
+    async def _run(self, job: Job, fn: Callable[[Job], Awaitable[Optional[Dict]]]):
+        async with self._slots:
+            job.started = time.time()
+            metrics.observe("jobs.queued_ms", (job.started - job.created) * 1000.0)
+            job.progress("starting")
+            try:
+                job.result = await fn(job)
+                job.progress("done")
+                metrics.incr("jobs.done")
+            except asyncio.CancelledError:
+                job.progress("cancelled")
+                raise
+            except Exception as e:
+                job.error = f"{e.__class__.__name__}: {e}"
+                job.progress("failed")
+                metrics.incr("jobs.failed")
+            finally:
+                job.finished = time.time()
+                metrics.observe("jobs.run_ms", (job.finished - job.started) * 1000.0)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for jid in [j.id for j in self._jobs.values() if j.done and (j.finished or 0) < cutoff]:
+            del self._jobs[jid]
+
+    def stats(self) -> Dict:
+        stages: Dict[str, int] = {}
+        for j in self._jobs.values():
+            stages[j.stage] = stages.get(j.stage, 0) + 1
+        return {"workers": self.workers, "jobs": len(self._jobs), "stages": stages}
+
+
+ingest_jobs = JobQueue()
+metrics.register("jobs", ingest_jobs.stats)
@@ -0,0 +1,659 @@
+# app/core/knowledge_base.py
+"""
+Persistent, append-only knowledge base of ingested documents (PDFs, URLs).
+
+Layout under KB_DIR (data files of generation N > 0 live in gen-N/):
+- meta.json    model, dim, generation, committed chunk count / text bytes, document list
+- vectors.f32  float32 [count, dim] chunk embeddings (normalized)
+- text.bin     UTF-8 chunk texts, back to back
+- ends.i64     int64 end offset of each chunk in text.bin
+- docs.i32     int32 document ordinal of each chunk
+- prov.i64     int64 [count, 4] provenance: first page, last page, char start, char end
+
+Everything is opened read-only with np.memmap / mmap, so opening is a JSON
+parse plus a few mmaps (milliseconds) and every worker process shares the
+same page-cache pages with zero copies. Adding a document appends to the
+data files first and commits by atomically rewriting meta.json; readers only
+ever look at the first `count` rows, so a crash mid-append is harmless (the
+next writer truncates the uncommitted tail). Large documents are streamed in
+page batches through a DocumentWriter, which spools chunks + embeddings to a
+temp directory and appends them in one step on commit.
+
+Ownership: every document has an "owner". Uploads belong to the session that
+made them (owner = session id) and are only visible to it (visible_documents,
+visible, find); documents ingested by an admin (app/data at startup,
+/api/kb/ingest) have owner None and are shared with every session.
+
+Size: deleting a document only tombstones its record. Session documents are
+deleted when their session ends, once older than KB_SESSION_DOC_TTL, and
+oldest first while live data exceeds KB_MAX_MB. Once tombstoned rows
+outnumber live ones, the live rows are copied into a new generation and
+meta.json is switched to it. Shared documents are only removed by delete().
+
+Readers take one immutable _Mapping (meta + maps) per call, and open() swaps
+in a new one whole. Maps are never closed explicitly: an old mapping stays
+valid until the last reader holding it lets go.
+
+Env:
+- KB_DIR               location (default RAG_CACHE_DIR/kb)
+- KB_INGEST_DIR        directory whose PDFs are ingested at startup (default app/data)
+- KB_INGEST_ON_STARTUP "0" to skip that background ingestion
+- KB_MAX_MB            live data budget; session documents are evicted past it (default 2048)
+- KB_SESSION_DOC_TTL   seconds a session document is kept at most (default 7 days)
+- KB_ADMIN_TOKEN       X-Admin-Token value for /api/kb/ingest, DELETE /api/kb/{doc_id} and
+                       the full /api/kb listing (unset = those are disabled)
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+from contextlib import contextmanager
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from app.core import metrics
+from app.core.utils import CACHE_DIR
+from app.core.embedding_service import DEFAULT_EMBED_MODEL
+
+try:
+    import fcntl  # POSIX only; on Windows we run single-writer without the file lock
+except Exception:
+    fcntl = None
+
+KB_DIR = os.getenv("KB_DIR", os.path.join(CACHE_DIR, "kb"))
+KB_INGEST_DIR = os.getenv("KB_INGEST_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data"))
+KB_INGEST_ON_STARTUP = os.getenv("KB_INGEST_ON_STARTUP", "1").lower() not in ("0", "false", "no", "off")
+KB_MAX_MB = float(os.getenv("KB_MAX_MB", "2048"))
+KB_SESSION_DOC_TTL = float(os.getenv("KB_SESSION_DOC_TTL", str(7 * 86400)))
+KB_ADMIN_TOKEN = os.getenv("KB_ADMIN_TOKEN", "")
+
+_DATA_FILES = ("vectors.f32", "text.bin", "ends.i64", "docs.i32", "prov.i64")
+_ROW_BYTES = 8 + 4 + 32  # ends + docs + prov per chunk, besides its vector and text
+
+
+def content_sha(data) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data or b"").hexdigest()
+
+
+def doc_owner(doc: Dict) -> Optional[str]:
+    """Session id owning a document, None if shared. Records from before ownership: startup
+    ingests ("file") are shared, anything else belongs to no live session."""
+    if "owner" in doc:
+        return doc["owner"]
+    return None if doc.get("source") == "file" else ""
+
+
+def _visible(doc: Dict, owner: Optional[str]) -> bool:
+    o = doc_owner(doc)
+    return o is None or (owner is not None and o == owner)
+
+
+def _live(meta: Dict) -> List[Dict]:
+    return [d for d in meta.get("docs", []) if not d.get("deleted")]
+
+
+class _Mapping:
+    """One immutable view of the committed store: meta plus its memory maps."""
+    __slots__ = ("meta", "vecs", "ends", "prov", "text")
+
+    def __init__(self, meta: Dict, vecs=None, ends=None, prov=None, text=None):
+        self.meta = meta
+        self.vecs: Optional[np.ndarray] = vecs
+        self.ends: Optional[np.ndarray] = ends
+        self.prov: Optional[np.ndarray] = prov
+        self.text: Optional[mmap.mmap] = text
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        for d in self.meta.get("docs", []):
+            if d["doc_id"] == doc_id and not d.get("deleted"):
+                return d
+        return None
+
+    def chunk(self, i: int) -> str:
+        start = int(self.ends[i - 1]) if i > 0 else 0
+        return self.text[start:int(self.ends[i])].decode("utf-8")
+
+
+class KnowledgeBase:
+    def __init__(self, root: str = KB_DIR, model_name: str = DEFAULT_EMBED_MODEL):
+        self.root = root
+        self.model_name = model_name
+        os.makedirs(root, exist_ok=True)
+        self._meta_path = os.path.join(root, "meta.json")
+        self._lock_path = os.path.join(root, ".lock")
+        self._lock = threading.Lock()
+        self._meta_mtime = 0.0
+        self._map = _Mapping(self._empty_meta())
+        self.budget = int(KB_MAX_MB * 1024 * 1024)
+        self.session_ttl = KB_SESSION_DOC_TTL
+        self.open()
+
+    # ---------- Open / refresh ----------
+    def _empty_meta(self) -> Dict:
+        return {"model": self.model_name, "dim": 0, "gen": 0, "count": 0, "text_bytes": 0, "docs": []}
+
+    def _read_meta(self) -> Dict:
+        try:
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return self._empty_meta()
+
+    def _files(self, gen: int) -> Dict[str, str]:
+        """Data file paths of one generation (generation 0 lives in the root)."""
+        base = os.path.join(self.root, f"gen-{gen}") if gen else self.root
+        return {name: os.path.join(base, name) for name in _DATA_FILES}
+
+    def _map_files(self, meta: Dict) -> _Mapping:
+        count, dim = int(meta.get("count", 0)), int(meta.get("dim", 0))
+        if not (count and dim):
+            return _Mapping(meta)
+        files = self._files(int(meta.get("gen", 0)))
+        with open(files["text.bin"], "rb") as f:
+            text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)  # the map keeps its own handle
+        return _Mapping(
+            meta,
+            vecs=np.memmap(files["vectors.f32"], dtype="float32", mode="r", shape=(count, dim)),
+            ends=np.memmap(files["ends.i64"], dtype="int64", mode="r", shape=(count,)),
+            prov=self._open_prov(files["prov.i64"], count),
+            text=text,
+        )
+
+    @staticmethod
+    def _open_prov(path: str, count: int) -> Optional[np.ndarray]:
+        # knowledge bases written before provenance existed have no prov.i64
+        try:
+            if os.path.getsize(path) >= count * 32:
+                return np.memmap(path, dtype="int64", mode="r", shape=(count, 4))
+        except OSError:
+            pass
+        return None
+
+    def open(self):
+        """Map the committed files and swap the new view in (callers other than __init__ hold self._lock)."""
+        t0 = time.perf_counter()
+        try:
+            mtime = os.path.getmtime(self._meta_path)
+        except OSError:
+            mtime = 0.0
+        try:
+            mapping = self._map_files(self._read_meta())
+        except FileNotFoundError:
+            # another worker compacted between our meta read and the maps: read again
+            mapping = self._map_files(self._read_meta())
+        self._map = mapping  # one reference swap; readers holding the old view keep it alive
+        self._meta_mtime = mtime
+        metrics.observe("kb.open_ms", (time.perf_counter() - t0) * 1000.0)
+
+    def refresh(self):
+        """Re-map if another worker committed new documents."""
+        try:
+            if os.path.getmtime(self._meta_path) != self._meta_mtime:
+                with self._lock:
+                    if os.path.getmtime(self._meta_path) != self._meta_mtime:
+                        self.open()
+        except OSError:
+            pass
+
+    # current view, for callers that only need one field
+    @property
+    def meta(self) -> Dict:
+        return self._map.meta
+
+    @property
+    def vecs(self) -> Optional[np.ndarray]:
+        return self._map.vecs
+
+    @property
+    def prov(self) -> Optional[np.ndarray]:
+        return self._map.prov
+
+    def __len__(self) -> int:
+        return int(self._map.meta.get("count", 0))
+
+    # ---------- Read ----------
+    def documents(self) -> List[Dict]:
+        """Every live document, all owners (admin / internal use)."""
+        return _live(self._map.meta)
+
+    def visible_documents(self, owner: Optional[str]) -> List[Dict]:
+        """Shared documents plus those owned by `owner` (a session id)."""
+        return [d for d in _live(self._map.meta) if _visible(d, owner)]
+
+    def get_document(self, doc_id: str) -> Optional[Dict]:
+        return self._map.get(doc_id)
+
+    def visible(self, doc_id: str, owner: Optional[str]) -> Optional[Dict]:
+        """The document if `owner` may use it, else None."""
+        d = self._map.get(doc_id)
+        return d if d is not None and _visible(d, owner) else None
+
+    def find(self, sha: str, owner: Optional[str] = None) -> Optional[Dict]:
+        """Document visible to `owner` by content or file hash (dedup on re-upload)."""
+        for d in _live(self._map.meta):
+            if sha in (d.get("sha"), d.get("file_sha")) and _visible(d, owner):
+                return d
+        return None
+
+    def chunk(self, i: int) -> str:
+        return self._map.chunk(i)
+
+    def doc_chunks(self, doc_id: str) -> List[str]:
+        m = self._map
+        d = m.get(doc_id)
+        return [m.chunk(i) for i in range(d["row_start"], d["row_end"])] if d else []
+
+    def read_document(self, doc_id: str) -> Optional[Tuple[List[str], np.ndarray, Optional[np.ndarray]]]:
+        """(chunks, vectors, provenance) of one document, all from the same view."""
+        m = self._map
+        d = m.get(doc_id)
+        if not d or m.vecs is None:
+            return None
+        s, e = d["row_start"], d["row_end"]
+        return [m.chunk(i) for i in range(s, e)], m.vecs[s:e], None if m.prov is None else m.prov[s:e]
+
+    # ---------- Append ----------
+    def writer(
+        self,
+        source: str,
+        title: Optional[str] = None,
+        file_sha: Optional[str] = None,
+        extra: Optional[Dict] = None,
+        owner: Optional[str] = None,
+    ) -> "DocumentWriter":
+        """Stream one document in page batches (see DocumentWriter); owner None = shared."""
+        return DocumentWriter(self, source, title, file_sha, extra, owner)
+
+    def add_document(
+        self,
+        text: str,
+        source: str,
+        title: Optional[str] = None,
+        file_sha: Optional[str] = None,
+        pages: Optional[List[str]] = None,
+        extra: Optional[Dict] = None,
+        owner: Optional[str] = None,
+    ) -> Optional[Dict]:
+        """
+        Chunk + embed + append one document; returns its record. Pass the
+        per-page texts as `pages` for page-level provenance. Documents already
+        visible to `owner` (same text or same source file hash) are returned as-is.
+        """
+        existing = self.find(content_sha(text), owner) or (self.find(file_sha, owner) if file_sha else None)
+        if existing:
+            metrics.incr("kb.dedup")
+            return existing
+        w = self.writer(source, title, file_sha, extra, owner)
+        try:
+            w.add_pages(pages if pages is not None else [text])
+            return w.commit(counted_pages=pages is not None)
+        finally:
+            w.abort()
+
+    @contextmanager
+    def _writing(self):
+        """Thread lock + cross-process file lock around a read-modify-write of the store."""
+        with self._lock:
+            lock_f = open(self._lock_path, "a+")
+            try:
+                if fcntl:
+                    fcntl.flock(lock_f, fcntl.LOCK_EX)
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_f, fcntl.LOCK_UN)
+                lock_f.close()
+
+    def _write_meta(self, meta: Dict):
+        tmp = f"{self._meta_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._meta_path)  # commit point
+
+    def _append(self, spool: "DocumentWriter", doc: Dict) -> Dict:
+        """Append a spooled document under the write lock and commit it; returns the stored record."""
+        with self._writing():
+            meta = self._read_meta()
+            keys = {doc["sha"], doc.get("file_sha")} - {None}
+            existing = next(
+                (d for d in _live(meta) if keys & {d.get("sha"), d.get("file_sha")} and _visible(d, doc.get("owner"))),
+                None,
+            )
+            if existing:  # another worker got there first
+                metrics.incr("kb.dedup")
+                self.open()
+                return existing
+            count, text_bytes = int(meta.get("count", 0)), int(meta.get("text_bytes", 0))
+            dim = int(meta.get("dim") or spool.dim)
+            if spool.dim != dim:
+                raise ValueError(f"embedding dim {spool.dim} != knowledge base dim {dim}")
+
+            n = spool.count
+            ends = text_bytes + np.fromfile(spool.path("ends.i64"), dtype="int64")
+            ordinal = len(meta.get("docs", []))
+            files = self._files(int(meta.get("gen", 0)))
+            # drop any uncommitted tail from a crashed writer, then append
+            for path, size, payload in (
+                (files["vectors.f32"], count * dim * 4, spool.path("vectors.f32")),
+                (files["text.bin"], text_bytes, spool.path("text.bin")),
+                (files["ends.i64"], count * 8, ends.tobytes()),
+                (files["docs.i32"], count * 4, np.full(n, ordinal, dtype="int32").tobytes()),
+                (files["prov.i64"], count * 32, spool.path("prov.i64")),
+            ):
+                with open(path, "ab") as f:
+                    f.truncate(size)
+                    if isinstance(payload, bytes):
+                        f.write(payload)
+                    else:
+                        with open(payload, "rb") as src:
+                            shutil.copyfileobj(src, f, 1 << 20)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            doc = dict(
+                doc,
+                doc_id=uuid.uuid4().hex[:12],
+                row_start=count,
+                row_end=count + n,
+                bytes=n * (dim * 4 + _ROW_BYTES) + int(ends[-1]) - text_bytes,
+                added_at=time.time(),
+            )
+            meta.update({
+                "model": self.model_name,
+                "dim": dim,
+                "count": count + n,
+                "text_bytes": int(ends[-1]),
+                "docs": meta.get("docs", []) + [doc],
+            })
+            self._commit(self._tidy(meta, keep=doc["doc_id"]))
+        metrics.incr("kb.documents_added")
+        metrics.incr("kb.chunks_added", n)
+        return self.get_document(doc["doc_id"]) or doc  # rows move if the append triggered a compaction
+
+    # ---------- Delete / bound / compact ----------
+    def delete(self, doc_ids: List[str]) -> int:
+        """Remove documents (any owner); returns how many were live."""
+        ids = set(doc_ids)
+        return self._delete(lambda d: d["doc_id"] in ids)
+
+    def delete_owner(self, owner: str) -> int:
+        """Remove every document a session uploaded (its session ended)."""
+        if not owner:
+            return 0
+        return self._delete(lambda d: doc_owner(d) == owner)
+
+    def enforce_limits(self) -> int:
+        """Apply KB_SESSION_DOC_TTL / KB_MAX_MB now (also done on every append); returns documents removed."""
+        with self._writing():
+            meta = self._read_meta()
+            before = len(_live(meta))
+            meta = self._tidy(meta)
+            removed = before - len(_live(meta))
+            if removed:
+                self._commit(meta)
+        return removed
+
+    def _delete(self, match) -> int:
+        with self._writing():
+            meta = self._read_meta()
+            hit = [d for d in _live(meta) if match(d)]
+            for d in hit:
+                d["deleted"] = True
+            if hit:
+                self._commit(self._tidy(meta))
+        if hit:
+            metrics.incr("kb.documents_deleted", len(hit))
+        return len(hit)
+
+    def _doc_bytes(self, d: Dict, dim: int) -> int:
+        rows = d["row_end"] - d["row_start"]
+        return int(d.get("bytes") or rows * (dim * 4 + _ROW_BYTES) + int(d.get("chars", 0)))
+
+    def _tidy(self, meta: Dict, keep: Optional[str] = None) -> Dict:
+        """Tombstone expired / over-budget session documents, then compact if mostly dead."""
+        now = time.time()
+        dim = int(meta.get("dim", 0))
+        live = _live(meta)
+        session_docs = sorted(
+            (d for d in live if doc_owner(d) is not None and d["doc_id"] != keep),
+            key=lambda d: d.get("added_at", 0),
+        )
+        total = sum(self._doc_bytes(d, dim) for d in live)
+        for d in session_docs:  # oldest first
+            expired = now - d.get("added_at", 0) > self.session_ttl
+            if not expired and total <= self.budget:
+                continue
+            d["deleted"] = True
+            total -= self._doc_bytes(d, dim)
+            metrics.incr("kb.expired" if expired else "kb.evicted")
+        if total > self.budget:
+            metrics.incr("kb.over_budget")  # shared documents alone exceed KB_MAX_MB
+        dead = sum(d["row_end"] - d["row_start"] for d in meta.get("docs", []) if d.get("deleted"))
+        if dead and dead > int(meta.get("count", 0)) - dead:
+            meta = self._compact(meta)
+        return meta
+
+    def _compact(self, meta: Dict) -> Dict:
+        """Copy live rows into the next generation; returns its meta (committed by the caller)."""
+        t0 = time.perf_counter()
+        old = self._map_files(meta)
+        gen = int(meta.get("gen", 0)) + 1
+        files = self._files(gen)
+        out_dir = os.path.dirname(files["vectors.f32"])
+        shutil.rmtree(out_dir, ignore_errors=True)  # leftovers of a crashed compaction
+        os.makedirs(out_dir)
+        docs, rows, text_pos = [], 0, 0
+        handles = {name: open(path, "wb") for name, path in files.items()}
+        try:
+            for ordinal, d in enumerate(_live(meta)):
+                s, e = d["row_start"], d["row_end"]
+                t0_byte = int(old.ends[s - 1]) if s > 0 else 0
+                t1_byte = int(old.ends[e - 1])
+                handles["vectors.f32"].write(np.ascontiguousarray(old.vecs[s:e]).tobytes())
+                handles["text.bin"].write(old.text[t0_byte:t1_byte])
+                handles["ends.i64"].write((np.asarray(old.ends[s:e]) - t0_byte + text_pos).tobytes())
+                handles["docs.i32"].write(np.full(e - s, ordinal, dtype="int32").tobytes())
+                prov = np.asarray(old.prov[s:e]) if old.prov is not None else np.zeros((e - s, 4), "int64")
+                handles["prov.i64"].write(np.ascontiguousarray(prov, dtype="int64").tobytes())
+                docs.append(dict(d, row_start=rows, row_end=rows + e - s))
+                rows += e - s
+                text_pos += t1_byte - t0_byte
+            for f in handles.values():
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            for f in handles.values():
+                f.close()
+        metrics.incr("kb.compactions")
+        metrics.observe("kb.compact_ms", (time.perf_counter() - t0) * 1000.0)
+        return dict(meta, gen=gen, count=rows, text_bytes=text_pos, docs=docs)
+
+    def _commit(self, meta: Dict):
+        """Publish meta (caller holds _writing()), re-map, and drop the generation it replaced."""
+        previous = self._read_meta()
+        self._write_meta(meta)
+        self.open()
+        old_gen, gen = int(previous.get("gen", 0)), int(meta.get("gen", 0))
+        if old_gen != gen:
+            # open maps (here or in other workers) keep the unlinked files readable
+            if old_gen:
+                shutil.rmtree(os.path.dirname(self._files(old_gen)["vectors.f32"]), ignore_errors=True)
+            else:
+                for path in self._files(0).values():
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def stats(self) -> Dict:
+        meta = self._map.meta
+        dim = int(meta.get("dim", 0))
+        live = _live(meta)
+        return {
+            "documents": len(live),
+            "shared_documents": sum(1 for d in live if doc_owner(d) is None),
+            "chunks": int(meta.get("count", 0)),
+            "live_chunks": sum(d["row_end"] - d["row_start"] for d in live),
+            "dim": dim,
+            "generation": int(meta.get("gen", 0)),
+            "vector_bytes": int(meta.get("count", 0)) * dim * 4,
+            "text_bytes": int(meta.get("text_bytes", 0)),
+            "live_bytes": sum(self._doc_bytes(d, dim) for d in live),
+            "budget_bytes": self.budget,
+        }
+
+
+class DocumentWriter:
+    """
+    Streams one document into the knowledge base without holding it in memory:
+    each add_pages() batch is chunked, embedded and spooled to a private temp
+    directory; commit() appends the spool to the shared files under the write
+    lock (a file copy, no re-embedding) and returns the document record.
+    """
+
+    def __init__(
+        self,
+        kb: KnowledgeBase,
+        source: str,
+        title: Optional[str],
+        file_sha: Optional[str],
+        extra: Optional[Dict],
+        owner: Optional[str] = None,
+    ):
+        self.kb = kb
+        self.source = source
+        self.owner = owner
+        self.title = title
+        self.file_sha = file_sha
+        self.extra = extra
+        tmp_root = os.path.join(kb.root, "tmp")
+        os.makedirs(tmp_root, exist_ok=True)
+        self.dir = tempfile.mkdtemp(dir=tmp_root)
+        self.count = 0
+        self.dim = 0
+        self.pages = 0
+        self.chars = 0        # characters of "\n".join(pages) so far
+        self.text_bytes = 0
+        self._char_base = 0   # offset of the next batch in the PAGE_SEP-joined document
+        self._sha = hashlib.sha256()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.dir, name)
+
+    def add_pages(self, pages: List[str], first_page: Optional[int] = None):
+        """Chunk + embed one batch of consecutive pages (numbered from first_page)."""
+        from app.core.chunker import chunk_pages, PAGE_SEP
+        from app.core.embedding_cache import embed_chunks
+
+        first_page = first_page or self.pages + 1
+        # document text is "\n".join(pages); hash it incrementally
+        for p in pages:
+            if self.pages or self.chars:
+                self._sha.update(b"\n")
+                self.chars += 1
+            self._sha.update((p or "").encode("utf-8"))
+            self.chars += len(p or "")
+            self.pages += 1
+        # chunks never span batches; char offsets are relative to the PAGE_SEP-joined pages
+        base = self._char_base
+        chunkset = chunk_pages(pages, self.kb.model_name, first_page=first_page, char_offset=base)
+        self._char_base = base + sum(len(p or "") for p in pages) + len(PAGE_SEP) * len(pages)
+        chunks = chunkset.texts()
+        if not chunks:
+            return
+        vecs = np.ascontiguousarray(embed_chunks(chunks, self.kb.model_name), dtype="float32")
+        self.dim = int(vecs.shape[1])
+        encoded = [c.encode("utf-8") for c in chunks]
+        ends = self.text_bytes + np.cumsum([len(b) for b in encoded], dtype="int64")
+        for name, payload in (
+            ("vectors.f32", vecs.tobytes()),
+            ("text.bin", b"".join(encoded)),
+            ("ends.i64", ends.tobytes()),
+            ("prov.i64", chunkset.provenance().tobytes()),
+        ):
+            with open(self.path(name), "ab") as f:
+                f.write(payload)
+        self.text_bytes = int(ends[-1])
+        self.count += len(chunks)
+
+    def commit(self, counted_pages: bool = True) -> Optional[Dict]:
+        """Publish the document (or the existing copy if it's a duplicate); None if it had no text."""
+        try:
+            if not self.count:
+                return None
+            doc = {
+                "source": self.source,
+                "title": self.title or "",
+                "sha": self._sha.hexdigest(),
+                "file_sha": self.file_sha,
+                "chars": self.chars,
+                "pages": self.pages if counted_pages else None,
+                "owner": self.owner,
+            }
+            if self.extra:
+                doc.update(self.extra)
+            return self.kb._append(self, doc)
+        finally:
+            self.abort()
+
+    def abort(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+# ---------- Shared instance ----------
+_kb: Optional[KnowledgeBase] = None
+_kb_lock = threading.Lock()
+
+
+def get_kb() -> KnowledgeBase:
+    global _kb
+    if _kb is None:
+        with _kb_lock:
+            if _kb is None:
+                _kb = KnowledgeBase()
+                metrics.register("knowledge_base", _kb.stats)
+    else:
+        _kb.refresh()
+    return _kb
+
+
+def ingest_directory(path: str = KB_INGEST_DIR) -> List[Dict]:
+    """
+    Add every PDF under path as a shared document (skipping files already
+    ingested, by file hash), streaming page batches.
+    """
+    from app.core.pdf_service import iter_pdf_pages
+
+    kb = get_kb()
+    added = []
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            if not name.lower().endswith(".pdf"):
+                continue
+            full = os.path.join(root, name)
+            sha = hashlib.sha256()
+            with open(full, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(block)
+            file_sha = sha.hexdigest()
+            if kb.find(file_sha):
+                continue
+            w = kb.writer("file", name, file_sha)
+            try:
+                for first_page, pages in iter_pdf_pages(full):
+                    w.add_pages(pages, first_page)
+                doc = w.commit()
+            finally:
+                w.abort()
+            if doc:
+                added.append(doc)
+    return added
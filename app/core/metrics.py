@@ -0,0 +1,85 @@
+# app/core/metrics.py
+"""
+Tiny in-process metrics registry.
+
+- incr(name)            -> monotonically increasing counters
+- observe(name, value)  -> rolling window of samples (count/avg/p50/p95/max)
+- register(name, fn)    -> snapshot provider for component-specific stats
+- snapshot()            -> everything above as a JSON-able dict (see /api/metrics)
+"""
+from __future__ import annotations
+from typing import Callable, Dict, List
+from collections import deque
+from contextlib import contextmanager
+import threading
+import time
+
+_WINDOW = 512
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_samples: Dict[str, deque] = {}
+_totals: Dict[str, List[float]] = {}  # name -> [count, sum] over process lifetime
+_providers: Dict[str, Callable[[], Dict]] = {}
+
+
+def incr(name: str, value: float = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name: str, value: float) -> None:
+    with _lock:
+        window = _samples.get(name)
+        if window is None:
+            window = _samples[name] = deque(maxlen=_WINDOW)
+        window.append(float(value))
+        tot = _totals.setdefault(name, [0, 0.0])
+        tot[0] += 1
+        tot[1] += float(value)
+
+
+@contextmanager
+def timer(name: str):
+    """Observe the wall time of the block in milliseconds."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - t0) * 1000.0)
+
+
+def register(name: str, provider: Callable[[], Dict]) -> None:
+    """Attach a component snapshot (e.g. model registry, caches) to snapshot()."""
+    with _lock:
+        _providers[name] = provider
+
+
+def _summarize(values: List[float], count: int, total: float) -> Dict:
+    vals = sorted(values)
+    n = len(vals)
+    return {
+        "count": count,
+        "avg": round(total / count, 3) if count else 0.0,
+        "p50": round(vals[n // 2], 3) if n else 0.0,
+        "p95": round(vals[min(n - 1, int(n * 0.95))], 3) if n else 0.0,
+        "max": round(vals[-1], 3) if n else 0.0,
+    }
+
+
+def snapshot() -> Dict:
+    with _lock:
+        counters = dict(_counters)
+        series = {k: (list(v), _totals[k][0], _totals[k][1]) for k, v in _samples.items()}
+        providers = dict(_providers)
+
+    out: Dict = {
+        "counters": counters,
+        "timings": {k: _summarize(v, c, s) for k, (v, c, s) in series.items()},
+    }
+    for name, fn in providers.items():
+        try:
+            out[name] = fn()
+        except Exception as e:
+            out[name] = {"error": f"{e.__class__.__name__}: {e}"}
+    return out
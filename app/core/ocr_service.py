@@ -1,11 +1,12 @@
 # app/core/ocr_service.py
 from __future__ import annotations
-from typing import Tuple, List
+from typing import Tuple, List, Union
+import hashlib
 import os
 import io
 import re
 
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
 import pytesseract
 
@@ -20,6 +21,17 @@ if TESSERACT_CMD:
 
 
 from pypdf import PdfReader
+from app.core.pdf_service import ParsedPdf, pdf_page_count
+from app.core.utils import CACHE_DIR
+
+# --- Per-page OCR ---
+# Pages are rasterized one at a time (grayscale) and OCR'd in the process pool;
+# results are cached on disk by a hash of the rendered page image, so the same
+# scanned page (re-uploads, shared brochures) is never OCR'd twice.
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_CACHE = os.getenv("OCR_CACHE", "1").lower() not in ("0", "false", "no", "off")
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", os.path.join(CACHE_DIR, "ocr"))
 
 
 def _extract_plain_text_len(pdf_bytes: bytes) -> Tuple[int, int]:
@@ -55,16 +67,80 @@ def _clean_ocr_text(text: str) -> str:
     return text.strip()
 
 
-def ocr_pdf(pdf_bytes: bytes, dpi: int = 300, lang: str = "eng") -> str:
+def _image_key(img: Image.Image, dpi: int, lang: str) -> str:
+    h = hashlib.sha1(f"{dpi}|{lang}|{img.mode}|{img.size}".encode("utf-8"))
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(OCR_CACHE_DIR, key[:2], f"{key}.txt")
+
+
+def ocr_page(path: str, page_no: int, dpi: int = OCR_DPI, lang: str = OCR_LANG) -> Tuple[str, bool]:
+    """
+    OCR one page (1-based) of the PDF at path -> (text, from_cache). Only this
+    page is rasterized, so memory is one page image regardless of document
+    size. Module-level so it can run in the process pool.
+    """
+    images = convert_from_path(
+        path, dpi=dpi, first_page=page_no, last_page=page_no,
+        grayscale=True, poppler_path=POPPLER_PATH or None,
+    )
+    if not images:
+        return "", False
+    img = images[0]
+    key = _image_key(img, dpi, lang) if OCR_CACHE else ""
+    if key:
+        try:
+            with open(_cache_path(key), "r", encoding="utf-8") as f:
+                return f.read(), True
+        except OSError:
+            pass
+    text = _clean_ocr_text(pytesseract.image_to_string(img, lang=lang) or "")
+    if key:
+        try:
+            os.makedirs(os.path.dirname(_cache_path(key)), exist_ok=True)
+            tmp = f"{_cache_path(key)}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, _cache_path(key))
+        except OSError:
+            pass
+    return text, False
+
+
+async def ocr_page_async(path: str, page_no: int, dpi: int = OCR_DPI, lang: str = OCR_LANG) -> str:
+    """ocr_page in the process pool (sized to the cores); records ocr.* metrics here, not in the worker."""
+    from app.core.async_io import run_in_process
+    from app.core import metrics
+
+    text, cached = await run_in_process(ocr_page, path, page_no, dpi, lang)
+    metrics.incr("ocr.cache_hit" if cached else "ocr.pages")
+    return text
+
+
+def ocr_page_count(path: str) -> int:
+    """Page count as poppler sees it (for files pypdf can't read)."""
+    try:
+        return int(pdfinfo_from_path(path, poppler_path=POPPLER_PATH or None).get("Pages", 0))
+    except Exception:
+        return 0
+
+
+def ocr_pdf_pages(pdf_bytes: Union[bytes, str], dpi: int = OCR_DPI, lang: str = OCR_LANG) -> List[str]:
     """
-    Page-wise OCR using Tesseract. Requires:
+    Page-wise OCR using Tesseract (index i = page i+1), one page rasterized at
+    a time. Accepts bytes or a file path (e.g. ParsedPdf.path). Requires:
       - Tesseract installed on the OS
       - Poppler (for pdf2image rasterization)
     """
-    # rasterize pages
-    images: List[Image.Image] = convert_from_bytes(pdf_bytes, dpi=dpi, poppler_path=POPPLER_PATH or None)
-    out_pages = []
-    for img in images:
-        txt = pytesseract.image_to_string(img, lang=lang) or ""
-        out_pages.append(_clean_ocr_text(txt))
-    return "\n\n".join(out_pages).strip()
+    if isinstance(pdf_bytes, str):
+        n = pdf_page_count(pdf_bytes) or ocr_page_count(pdf_bytes)
+        return [ocr_page(pdf_bytes, p, dpi, lang)[0] for p in range(1, n + 1)]
+    with ParsedPdf(pdf_bytes) as parsed:
+        return ocr_pdf_pages(parsed.path, dpi=dpi, lang=lang)
+
+
+def ocr_pdf(pdf_bytes: bytes, dpi: int = 300, lang: str = "eng") -> str:
+    return "\n\n".join(ocr_pdf_pages(pdf_bytes, dpi=dpi, lang=lang)).strip()
@@ -1,12 +1,190 @@
 # app/core/orchestrator.py
 from __future__ import annotations
-from typing import Optional, Dict, List, Tuple
+from typing import Optional, Dict, List, Tuple, Callable, AsyncIterator
+from collections import deque
 import asyncio
+import os
+import time
+import uuid
 
-from app.core.pdf_service import extract_pdf_text, extract_topics_heuristic
-from app.core.web_service import web_fallback_answer, extract_main_text
-from app.core.rag_service import RagIndex, rag_knows, synthesize_from_chunks
-from app.core.ocr_service import is_scanned, ocr_pdf
+from app.core.pdf_service import ParsedPdf, extract_topics_heuristic, PDF_PAGE_BATCH
+from app.core.web_service import web_fallback_answer, prepare_web_answer, extract_main_text_async
+from app.core.rag_service import RagIndex, rag_knows, synthesize_from_chunks_async
+from app.core.knowledge_base import get_kb, content_sha
+from app.core.ocr_service import ocr_page_async, ocr_page_count
+from app.core.async_io import run_in_thread
+from app.core.jobs import Job, ingest_jobs
+from app.core.answer_cache import answer_cache, embed_question, scope_key, ANSWER_CACHE
+from app.core.compare_service import label_topics, compare_products
+from app.core import metrics
+
+# "single": one JSON completion returns both the agreement note and the final
+# answer (streamed answers: one streamed final completion, no agreement note);
+# "legacy": separate 'fused' and 'final' completions.
+FUSION_MODE = os.getenv("FUSION_MODE", "single").strip().lower()
+
+# Latency budgets (seconds) for the two evidence branches of answer_dual. A
+# branch that blows its budget is dropped and fusion is skipped.
+RAG_BUDGET_SECONDS = float(os.getenv("RAG_BUDGET_SECONDS", "15"))
+CSE_BUDGET_SECONDS = float(os.getenv("CSE_BUDGET_SECONDS", "30"))
+
+_CSE_TIMEOUT_ANSWER = "Sorry, the web lookup took too long. Please try again in a moment."
+
+
+# Always act as sales agent suggesting competitors for any product - AT THE END
+_SALES_INSTRUCTION = " Structure response: 1) Answer about requested product first, 2) LAST: Add 'Competitor Alternatives' section with positive points about alternatives to help customers decide."
+
+
+async def _drain(queue: asyncio.Queue, tasks: List[asyncio.Task], until_any: bool = False):
+    """Yield queued events as they arrive until every (or, with until_any, one) task has finished."""
+    while True:
+        while not queue.empty():
+            yield queue.get_nowait()
+        running = [t for t in tasks if not t.done()]
+        if not running or (until_any and len(running) < len(tasks)):
+            return
+        getter = asyncio.ensure_future(queue.get())
+        done, _ = await asyncio.wait([getter, *running], return_when=asyncio.FIRST_COMPLETED)
+        if getter in done:
+            yield getter.result()
+        else:
+            getter.cancel()
+
+
+async def _budgeted(coro, budget: float, name: str):
+    """(result, timed_out) of coro under a latency budget; records answer.<name>_ms."""
+    t0 = time.perf_counter()
+    try:
+        res = await asyncio.wait_for(coro, timeout=max(0.01, budget))
+    except asyncio.TimeoutError:
+        metrics.incr(f"answer.{name}_timeout")
+        return None, True
+    metrics.observe(f"answer.{name}_ms", (time.perf_counter() - t0) * 1000.0)
+    return res, False
+
+
+def _record_fusion(mode: str, t0: float, usage: Dict):
+    metrics.incr(f"fusion.{mode}.calls")
+    metrics.observe(f"fusion.{mode}.latency_ms", (time.perf_counter() - t0) * 1000.0)
+    metrics.observe(f"fusion.{mode}.llm_calls", usage["calls"])
+    metrics.observe(f"fusion.{mode}.prompt_tokens", usage["prompt_tokens"])
+    metrics.observe(f"fusion.{mode}.completion_tokens", usage["completion_tokens"])
+    metrics.observe(f"fusion.{mode}.total_tokens", usage["total_tokens"])
+
+
+def _index_from_kb(doc_ids: List[str]) -> RagIndex:
+    return RagIndex.from_kb(get_kb(), doc_ids)
+
+
+# Only the head of a document is kept as text (topic detection); the rest
+# streams straight into the knowledge base.
+TOPIC_HEAD_CHARS = 20000
+
+
+# Parsed batches waiting on OCR of an earlier page are held in memory; past
+# this many, ingestion waits for OCR before parsing further.
+_MAX_HELD_BATCHES = 16
+
+
+async def ingest_pdf(
+    pdf_bytes: bytes,
+    title: Optional[str],
+    ocr_mode: str = "auto",
+    meta: Optional[Dict] = None,
+    source: str = "pdf",
+    progress: Optional[Callable[..., None]] = None,
+    owner: Optional[str] = None,
+) -> Tuple[Optional[Dict], str]:
+    """
+    Extract each page's text once (ParsedPdf) and stream it into the knowledge base:
+    page batches are parsed in the process pool while earlier batches are
+    chunked + embedded. OCR is per page: in "auto" only pages the parse flags
+    as scanned (too little native text), in "force" every page; OCR runs in
+    the process pool as soon as its batch is parsed, and batches are embedded
+    in page order once their OCR is done. Returns (document, head text) and
+    records ocr_used / ocr_pages / ocr_error / pages in meta. progress, if
+    given, is called as progress(stage, pages_done, pages_total). The document
+    belongs to `owner` (a session id), or is shared when owner is None.
+    """
+    meta = meta if meta is not None else {}
+    kb = get_kb()
+    writer = kb.writer(source, title, content_sha(pdf_bytes), owner=owner)
+    held: deque = deque()  # (first_page, page texts, {page_no: OCR task}) in page order
+    ocr_ok: List[int] = []
+    ocr_errors: List[str] = []
+    report = progress or (lambda *a: None)
+    written = total = 0
+
+    with ParsedPdf(pdf_bytes) as parsed:
+
+        async def ocr(page_no: int) -> Optional[str]:
+            try:
+                return await ocr_page_async(parsed.path, page_no)
+            except Exception as e:
+                ocr_errors.append(f"{e.__class__.__name__}: {e}")
+                return None
+
+        def hold(first_page: int, batch: List[str], ocr_all: bool = False):
+            tasks = {
+                p: asyncio.ensure_future(ocr(p))
+                for p in range(first_page, first_page + len(batch))
+                if ocr_all or ocr_mode == "force" or (ocr_mode == "auto" and parsed.scanned[p - 1])
+            }
+            held.append((first_page, list(batch), tasks))
+
+        async def release(limit: int):
+            nonlocal written
+            while held and (len(held) > limit or all(t.done() for t in held[0][2].values())):
+                first_page, batch, tasks = held.popleft()
+                for page_no, task in tasks.items():
+                    text = await task
+                    if text is not None:
+                        batch[page_no - first_page] = text
+                        parsed.set_page(page_no, text)
+                        ocr_ok.append(page_no)
+                await run_in_thread(writer.add_pages, batch, first_page)
+                metrics.incr("ingest.pages", len(batch))
+                written += len(batch)
+                report("indexing", written, total)
+
+        try:
+            report("parsing", 0, None)
+            async for first_page, batch in parsed.stream():
+                total = parsed.n_pages
+                hold(first_page, batch)
+                if held[-1][2]:
+                    report("ocr", written, total)
+                await release(_MAX_HELD_BATCHES)
+            if not parsed.n_pages and ocr_mode in ("auto", "force"):
+                # unreadable for pypdf (image-only / malformed): OCR every page poppler sees
+                total = await run_in_thread(ocr_page_count, parsed.path)
+                for s in range(1, total + 1, PDF_PAGE_BATCH):
+                    hold(s, [""] * min(PDF_PAGE_BATCH, total - s + 1), ocr_all=True)
+                report("ocr", 0, total)
+            await release(0)
+            meta["ocr_used"] = bool(ocr_ok)
+            meta["ocr_pages"] = len(ocr_ok)
+            if ocr_errors:
+                meta["ocr_error"] = ocr_errors[0]  # native text kept for those pages
+            meta["pages"] = parsed.n_pages
+            report("committing", written, written)
+            doc = await run_in_thread(writer.commit)
+        finally:
+            for _, _, tasks in held:
+                for t in tasks.values():
+                    t.cancel()
+            writer.abort()
+        head = parsed.head(TOPIC_HEAD_CHARS)
+    return doc, head
+
+
+def _stem(filename: Optional[str]) -> Optional[str]:
+    return os.path.splitext(os.path.basename(filename))[0] if filename else None
+
+
+def _kb_text(doc_ids: List[str]) -> str:
+    kb = get_kb()
+    return "\n".join(c for d in doc_ids for c in kb.doc_chunks(d))
 
 
 class Orchestrator:
@@ -17,26 +195,35 @@ class Orchestrator:
       - Comparison Mode (CSE-only)
       - Sales handoff handled in routes
     """
-    def __init__(self):
+    def __init__(self, owner: Optional[str] = None, keep_alive: Optional[Callable[[], Callable[[], None]]] = None):
+        # uploads are private to this owner (the session id) in the knowledge base
+        self.owner: str = owner or uuid.uuid4().hex
+        # set by the session manager: pins the session while a background job uses it, returns the unpin
+        self.keep_alive = keep_alive
         self.topic: Optional[Dict] = None
         self.history: List[Dict] = []
-        self.pdf_text: str = ""
+        self.doc_ids: List[str] = []  # knowledge-base documents backing RAG
         self.rag_enabled: bool = True
         self.rag_index: RagIndex | None = None
+        self.index_status: str = "disabled_or_empty"  # "building" while a background ingest job runs
+        self.index_job: Optional[str] = None
+        self._topic_gen = 0  # bumped per init_topic / clear; stale background jobs don't apply
+        self.fusion_mode: str = FUSION_MODE
+        self.rag_budget: float = RAG_BUDGET_SECONDS
+        self.cse_budget: float = CSE_BUDGET_SECONDS
 
         # Comparison
         self.compare: Dict | None = None
 
     # ---------- Config ----------
-    def set_rag(self, enabled: bool) -> Dict:
+    async def set_rag(self, enabled: bool) -> Dict:
         self.rag_enabled = bool(enabled)
         # If disabling, free the index
         if not self.rag_enabled:
             self.rag_index = None
-        elif self.rag_enabled and self.pdf_text:
-            # lazily (re)build if we have text
-            self.rag_index = RagIndex()
-            self.rag_index.build(self.pdf_text)
+        elif self.rag_enabled and self.doc_ids:
+            # lazily re-attach the stored documents (no re-embedding)
+            self.rag_index = await run_in_thread(_index_from_kb, self.doc_ids)
         return {"rag_enabled": self.rag_enabled}
 
     # ---------- Topic init ----------
@@ -53,63 +240,227 @@ class Orchestrator:
         url: Optional[str] = None,
         product_name: Optional[str] = None,
         rag_enabled: Optional[bool] = None,
-        ocr_mode: str = "auto"
+        ocr_mode: str = "auto",
+        filename: Optional[str] = None,
+        doc_ids: Optional[List[str]] = None,
+        background: bool = False,
     ) -> Dict:
+        """
+        With background=True a PDF not yet in the knowledge base is ingested
+        by a job (see app.core.jobs): this returns at once with index_status
+        "building" and a job_id, the topic comes from the product name /
+        filename until the job replaces it, and answers are web-only meanwhile.
+        """
         if rag_enabled is not None:
             self.rag_enabled = bool(rag_enabled)
 
         text = ""
         meta = {"source": "manual"}
+        self.doc_ids = []
+        self._topic_gen += 1
+        self.index_job = None
+        kb = get_kb()
+        known = kb.find(content_sha(pdf_bytes), self.owner) if pdf_bytes else None
 
-        if pdf_bytes:
+        if pdf_bytes and background and not known:
             meta["source"] = "pdf"
-            # OCR routing
+            gen = self._topic_gen
+            # the job writes to this session and its upload belongs to it: keep it alive until the job ends
+            unpin = self.keep_alive() if self.keep_alive else (lambda: None)
             try:
-                needs_ocr = (ocr_mode == "force") or (ocr_mode == "auto" and is_scanned(pdf_bytes))
-            except Exception:
-                needs_ocr = (ocr_mode == "force")  # fail-closed to non-OCR
-
-            if needs_ocr:
-                try:
-                    text = ocr_pdf(pdf_bytes)
-                    meta["ocr_used"] = True
-                except Exception as e:
-                    # Fallback to standard extraction with a warning-like marker
-                    text = extract_pdf_text(pdf_bytes) or ""
-                    meta["ocr_used"] = False
-                    meta["ocr_error"] = f"{e.__class__.__name__}: {e}"
-            else:
-                text = extract_pdf_text(pdf_bytes) or ""
-                meta["ocr_used"] = False
+                job = ingest_jobs.submit(
+                    lambda job: self._ingest_job(job, gen, pdf_bytes, filename, ocr_mode, product_name, meta)
+                )
+            except BaseException:
+                unpin()
+                raise
+            job.task.add_done_callback(lambda _: unpin())  # done, failed or cancelled (even while queued)
+            self.index_job = meta["job_id"] = job.id
+            self.topic = self._detect_topic_from_text("", product_name or _stem(filename))
+            self.topic["meta"] = meta
+            self.rag_index = None
+            self.index_status = "building"
+            return {
+                "topic": self.topic,
+                "rag_enabled": self.rag_enabled,
+                "index_status": self.index_status,
+                "job_id": job.id,
+            }
 
-            self.pdf_text = text
+        if known:
+            # same file already in the knowledge base: skip parsing / OCR / embedding
+            meta.update({"source": "pdf", "kb_cached": True})
+            self.doc_ids = [known["doc_id"]]
+            text = await run_in_thread(_kb_text, self.doc_ids)
+
+        elif pdf_bytes:
+            meta["source"] = "pdf"
+            # one text extraction shared by OCR routing, topic detection and chunking;
+            # chunks carry page numbers for citations
+            doc, text = await ingest_pdf(pdf_bytes, filename, ocr_mode=ocr_mode, meta=meta, owner=self.owner)
+            self.doc_ids = [doc["doc_id"]] if doc else []
+            meta["ingested"] = True
+
+        elif doc_ids:
+            # attach shared documents or this session's own uploads
+            meta["source"] = "kb"
+            self.doc_ids = [d for d in doc_ids if kb.visible(d, self.owner)]
+            text = await run_in_thread(_kb_text, self.doc_ids)
 
         elif url:
             meta["source"] = "url"
-            text = extract_main_text(url) or ""
-            self.pdf_text = ""  # not caching web text as document
-        else:
-            # Product name only
-            self.pdf_text = ""
+            text = await extract_main_text_async(url) or ""
+            # web text is used for the topic only, not as a RAG document
+        # else: product name only
 
+        meta["doc_ids"] = list(self.doc_ids)
         self.topic = self._detect_topic_from_text(text, product_name)
         self.topic["meta"] = meta
+        if meta.pop("ingested", False):
+            self._invalidate_answers()
 
-        # (Re)build RAG if enabled and we have doc text
-        if self.rag_enabled and self.pdf_text:
-            self.rag_index = RagIndex()
-            self.rag_index.build(self.pdf_text)
-            index_status = "ready"
+        # (Re)build RAG if enabled and we have documents
+        if self.rag_enabled and self.doc_ids:
+            self.rag_index = await run_in_thread(_index_from_kb, self.doc_ids)
+            self.index_status = "ready"
         else:
             self.rag_index = None
-            index_status = "disabled_or_empty"
+            self.index_status = "disabled_or_empty"
 
         return {
             "topic": self.topic,
             "rag_enabled": self.rag_enabled,
-            "index_status": index_status,
+            "index_status": self.index_status,
         }
 
+    async def _ingest_job(
+        self,
+        job: Job,
+        gen: int,
+        pdf_bytes: bytes,
+        filename: Optional[str],
+        ocr_mode: str,
+        product_name: Optional[str],
+        meta: Dict,
+    ) -> Dict:
+        """Background half of init_topic for an uploaded PDF."""
+        try:
+            doc, text = await ingest_pdf(
+                pdf_bytes, filename, ocr_mode=ocr_mode, meta=meta, progress=job.progress, owner=self.owner
+            )
+            doc_ids = [doc["doc_id"]] if doc else []
+            if gen == self._topic_gen:
+                # documents attached (add_documents) while this one was building
+                doc_ids += [d for d in self.doc_ids if d not in doc_ids]
+            index = None
+            if self.rag_enabled and doc_ids:
+                job.progress("loading", job.pages_done, job.pages_total)
+                index = await run_in_thread(_index_from_kb, doc_ids)
+        except Exception:
+            if gen == self._topic_gen:
+                self.index_status = "failed"
+            raise
+        out = {"doc_ids": doc_ids, "pages": meta.get("pages", 0)}
+        if gen != self._topic_gen:
+            # topic changed meanwhile; the document stays in the knowledge base
+            return {**out, "applied": False}
+        self.doc_ids = doc_ids
+        meta["doc_ids"] = list(doc_ids)
+        self.topic = self._detect_topic_from_text(text, product_name)
+        self.topic["meta"] = meta
+        self.rag_index = index if self.rag_enabled else None
+        self.index_status = "ready" if self.rag_index is not None else "disabled_or_empty"
+        self._invalidate_answers()
+        return {**out, "applied": True, "primary": self.topic["primary"], "index_status": self.index_status}
+
+    async def add_documents(
+        self,
+        pdf_bytes: bytes | None = None,
+        filename: Optional[str] = None,
+        ocr_mode: str = "auto",
+        doc_ids: Optional[List[str]] = None,
+    ) -> Dict:
+        """
+        Attach more documents to the current topic (e.g. a spec sheet next to
+        the manual). Only the new documents' chunks are appended to the index.
+        """
+        kb = get_kb()
+        meta: Dict = {}
+        new: List[str] = []
+        if pdf_bytes:
+            doc = kb.find(content_sha(pdf_bytes), self.owner)
+            if doc is None:
+                doc, _ = await ingest_pdf(pdf_bytes, filename, ocr_mode=ocr_mode, meta=meta, owner=self.owner)
+                self._invalidate_answers()
+            if doc:
+                new.append(doc["doc_id"])
+        new += [d for d in (doc_ids or []) if kb.visible(d, self.owner)]
+        new = [d for d in dict.fromkeys(new) if d not in self.doc_ids]
+        self.doc_ids += new
+        if new and self.rag_enabled and self.index_status != "building":
+            if self.rag_index is None:
+                self.rag_index = await run_in_thread(_index_from_kb, self.doc_ids)
+            else:
+                await run_in_thread(self.rag_index.add_kb, kb, new)
+            self.index_status = "ready"
+        if self.topic is not None:
+            self.topic.setdefault("meta", {})["doc_ids"] = list(self.doc_ids)
+        return {"doc_ids": list(self.doc_ids), "added": new, "index_status": self.index_status, **meta}
+
+    async def remove_document(self, doc_id: str) -> Dict:
+        """Detach one document (it stays in the knowledge base); its chunks leave the index."""
+        removed = doc_id in self.doc_ids
+        if removed:
+            self.doc_ids.remove(doc_id)
+            if self.rag_index is not None:
+                await run_in_thread(self.rag_index.remove, doc_id)
+            if not self.doc_ids and self.index_status != "building":
+                self.rag_index = None
+                self.index_status = "disabled_or_empty"
+            if self.topic is not None:
+                self.topic.setdefault("meta", {})["doc_ids"] = list(self.doc_ids)
+        return {"doc_ids": list(self.doc_ids), "removed": removed, "index_status": self.index_status}
+
+    # ---------- Semantic answer cache ----------
+    def _answer_scope(self) -> Optional[str]:
+        """Cache scope of the current topic + RAG documents; None while caching can't apply."""
+        if not ANSWER_CACHE or self.index_status == "building":
+            return None
+        docs = self.doc_ids if self.rag_enabled and self.rag_index is not None else []
+        return scope_key(self.topic, docs)
+
+    async def _cached_answer(self, question: str) -> Tuple[Optional[str], object, Optional[Dict]]:
+        """(scope, question vector, cached payload or None)."""
+        scope = self._answer_scope()
+        if scope is None:
+            return None, None, None
+        try:
+            q = await run_in_thread(embed_question, question)
+        except Exception:
+            metrics.incr("answer_cache.error")
+            return None, None, None
+        hit = answer_cache.lookup(scope, q)
+        if hit is not None:
+            self.history.append({"role": "user", "text": question})
+            self.history.append({"role": "ai", "text": hit["final_answer"]})
+        return scope, q, hit
+
+    def _remember_answer(self, scope: Optional[str], question: str, q, out: Dict):
+        """Store a complete answer; timeouts, Groq errors and answers for a changed topic are skipped."""
+        if scope is None or scope != self._answer_scope():
+            return
+        final = (out.get("final_answer") or "").strip()
+        if not final or final == _CSE_TIMEOUT_ANSWER or "Groq error" in final:
+            return
+        if out.get("rag", {}).get("timed_out") or out.get("cse", {}).get("timed_out"):
+            return
+        answer_cache.store(scope, question, q, out)
+
+    def _invalidate_answers(self):
+        """A document was (re)ingested for this topic: its cached answers are stale."""
+        if self.topic is not None:
+            answer_cache.invalidate(self.topic.get("primary"))
+
     # ---------- Answering ----------
     async def _run_cse(self, question: str) -> Tuple[str, List[str]]:
         try:
@@ -119,54 +470,133 @@ class Orchestrator:
             ans, urls = web_fallback_answer(question=question, topics=self.topic)  # type: ignore
             return ans, urls
 
-    async def answer_dual(self, question: str) -> Dict:
-        # Always run CSE
-        cse_task = asyncio.create_task(self._run_cse(question))
-
-        # Optional RAG
+    async def _rag_branch(self, question: str, emit: Optional[Callable] = None) -> Dict:
+        """Retrieve + synthesize from the document; {"status": "unknown"} if RAG can't answer."""
         rag_payload = {"status": "unknown"}
-        if self.rag_enabled and self.rag_index is not None:
-            retrieved = self.rag_index.retrieve(question, k=8)
+        if self.index_status == "building":
+            # document still ingesting in the background: web-only until ready
+            return {"status": "unknown", "index_status": "building", "job_id": self.index_job}
+        # one reference for the whole branch: the session may be spilled, or the
+        # index replaced, while we await retrieval and synthesis
+        index = self.rag_index
+        if self.rag_enabled and index is not None:
+            # text and citations come from one consistent view of the index
+            hits = await run_in_thread(index.retrieve_cited, question, k=8)
+            retrieved = [(c, s) for c, s, _ in hits]
+            if emit:
+                emit("progress", {"stage": "retrieved", "chunks": len(retrieved)})
             if rag_knows(retrieved):
                 top_chunks = [c for c, _ in retrieved[:5]]
-                rag_summary = synthesize_from_chunks(question, top_chunks)
+                rag_summary = await synthesize_from_chunks_async(question, top_chunks)
                 if "insufficient evidence" not in (rag_summary or "").lower():
                     rag_payload = {
                         "status": "known",
                         "summary": (rag_summary or "").strip(),
-                        "citations": [],  # extend if you map chunks→pages
+                        "citations": self._citations([cite for _, _, cite in hits[:5]]),
                         "confidence": 0.75
                     }
+        return rag_payload
 
-        cse_answer, cse_urls = await cse_task
+    @staticmethod
+    def _citations(cites: List[Dict]) -> List[Dict]:
+        """One pdf citation per distinct (document, page) among the chunks used, in rank order."""
+        kb = get_kb()
+        out, seen = [], set()
+        for cite in cites:
+            key = (cite.get("doc_id"), cite.get("page"))
+            if key in seen:
+                continue
+            seen.add(key)
+            doc = kb.get_document(cite["doc_id"]) if cite.get("doc_id") else None
+            title = (doc or {}).get("title") or "document"
+            ref = f"{title} p. {cite['page']}" if cite.get("page") else title
+            out.append({"type": "pdf", "ref": ref, **cite})
+        return out
+
+    @staticmethod
+    def _tag_cse(cse_answer: str) -> str:
         if cse_answer and "(found in PDF)" not in cse_answer and "(looked up on the web" not in cse_answer:
             cse_answer = cse_answer.strip() + "\n(looked up on the web since not in PDF)"
+        return cse_answer
 
-        if rag_payload["status"] == "unknown":
-            final = cse_answer
+    @staticmethod
+    def _fusion_prompts(question: str, rag_summary: str, cse_answer: str) -> Tuple[Tuple[str, str], Tuple[str, str]]:
+        """(system, user) pairs for the 'fused' and 'final' completions."""
+        fused = (
+            f"Merge two short answers, noting agreements or differences in <=2 lines.{_SALES_INSTRUCTION}",
+            f"Answer A (doc): {rag_summary}\n\nAnswer B (web): {cse_answer}"
+        )
+        final = (
+            f"Compose a single direct answer grounded primarily in Answer A (doc). "
+            f"Use Answer B (web) only to fill small gaps. Keep it concise.{_SALES_INSTRUCTION}",
+            f"Question: {question}\n\nAnswer A (doc): {rag_summary}\n\nAnswer B (web): {cse_answer}"
+        )
+        return fused, final
+
+    @staticmethod
+    def _fusion_single_prompt(question: str, rag_summary: str, cse_answer: str) -> Tuple[str, str]:
+        system = (
+            "Merge two answers to the customer's question. Reply with a JSON object with exactly two string keys: "
+            "\"agreement\": agreements or differences between Answer A (doc) and Answer B (web) in <=2 lines; "
+            "\"final_answer\": a single direct answer grounded primarily in Answer A (doc), using Answer B (web) "
+            f"only to fill small gaps. Keep it concise. For final_answer:{_SALES_INSTRUCTION}"
+        )
+        user = f"Question: {question}\n\nAnswer A (doc): {rag_summary}\n\nAnswer B (web): {cse_answer}"
+        return system, user
+
+    async def _fuse(self, question: str, rag_summary: str, cse_answer: str) -> Tuple[str, str]:
+        """(fused, final) for the RAG-known branch, per self.fusion_mode; records latency/tokens per mode."""
+        from app.core.groq_service import groq_complete_async, groq_complete_json_async, track_usage
+
+        mode = "single" if self.fusion_mode == "single" else "legacy"
+        fused_prompt, final_prompt = self._fusion_prompts(question, rag_summary, cse_answer)
+        t0 = time.perf_counter()
+        with track_usage() as usage:
+            if mode == "single":
+                data = await groq_complete_json_async(*self._fusion_single_prompt(question, rag_summary, cse_answer))
+                fused, final = str(data.get("agreement") or ""), str(data.get("final_answer") or "")
+                if not final.strip():
+                    # bad/failed JSON: fall back to the plain final completion
+                    metrics.incr("fusion.single.fallback")
+                    final = await groq_complete_async(*final_prompt)
+            else:
+                fused = await groq_complete_async(*fused_prompt)
+                final = await groq_complete_async(*final_prompt)
+        _record_fusion(mode, t0, usage)
+        return fused, final
+
+    def _finish(
+        self,
+        question: str,
+        rag_payload: Dict,
+        cse_answer: str,
+        cse_urls: List[str],
+        fused: Optional[str] = None,
+        final: Optional[str] = None,
+    ) -> Dict:
+        """
+        Assemble the answer payload and record history. With RAG known but no
+        final (web branch timed out), the doc summary is the answer, unfused.
+        """
+        if rag_payload["status"] != "known":
             final_cites = [{"type": "url", "ref": u} for u in (cse_urls or [])]
             out = {
                 "rag": rag_payload,
                 "cse": {"summary": cse_answer, "sources": cse_urls, "confidence": 0.7},
-                "final_answer": final,
+                "final_answer": cse_answer or _CSE_TIMEOUT_ANSWER,
                 "final_citations": final_cites
             }
+        elif final is None:
+            out = {
+                "rag": rag_payload,
+                "cse": {"summary": cse_answer, "sources": cse_urls, "confidence": 0.0, "timed_out": True},
+                "fused": {"comparator": "skipped", "summary": ""},
+                "final_answer": rag_payload["summary"],
+                "final_citations": rag_payload.get("citations") or [{"type": "pdf", "ref": "document"}]
+            }
         else:
-            from app.core.groq_service import groq_complete
-            
-            # Always act as sales agent suggesting competitors for any product - AT THE END
-            sales_instruction = " Structure response: 1) Answer about requested product first, 2) LAST: Add 'Competitor Alternatives' section with positive points about alternatives to help customers decide."
-            
-            fused = groq_complete(
-                f"Merge two short answers, noting agreements or differences in <=2 lines.{sales_instruction}",
-                f"Answer A (doc): {rag_payload['summary']}\n\nAnswer B (web): {cse_answer}"
-            )
-            final = groq_complete(
-                f"Compose a single direct answer grounded primarily in Answer A (doc). "
-                f"Use Answer B (web) only to fill small gaps. Keep it concise.{sales_instruction}",
-                f"Question: {question}\n\nAnswer A (doc): {rag_payload['summary']}\n\nAnswer B (web): {cse_answer}"
-            )
-            final_cites = [{"type": "pdf", "ref": "document"}] + [{"type": "url", "ref": u} for u in (cse_urls or [])]
+            pdf_cites = rag_payload.get("citations") or [{"type": "pdf", "ref": "document"}]
+            final_cites = pdf_cites + [{"type": "url", "ref": u} for u in (cse_urls or [])]
             out = {
                 "rag": rag_payload,
                 "cse": {"summary": cse_answer, "sources": cse_urls, "confidence": 0.7},
@@ -180,42 +610,177 @@ class Orchestrator:
         self.history.append({"role": "ai", "text": out["final_answer"]})
         return out
 
-    # ---------- Comparison Mode (CSE-only) ----------
-    async def compare_init(self, topic_a: Dict, topic_b: Dict):
-        self.compare = {"A": topic_a, "B": topic_b}
+    async def answer_dual(self, question: str) -> Dict:
+        scope, q, hit = await self._cached_answer(question)
+        if hit is not None:
+            return hit
+        out = await self._answer_dual(question)
+        self._remember_answer(scope, question, q, out)
+        return out
 
-    async def compare_ask(self, question: str) -> Dict:
-        if not self.compare:
-            return {"A": {}, "B": {}, "matrix": [], "recommendation": "Initialize comparison first."}
+    async def _answer_dual(self, question: str) -> Dict:
+        # RAG and CSE run as independent tasks, each under its own budget,
+        # so latency follows the slower branch instead of the sum.
+        rag_task = asyncio.create_task(_budgeted(self._rag_branch(question), self.rag_budget, "rag"))
+        cse_task = asyncio.create_task(_budgeted(self._run_cse(question), self.cse_budget, "cse"))
+        (rag_payload, rag_timed_out), (cse_res, cse_timed_out) = await asyncio.gather(rag_task, cse_task)
 
-        async def cse_for(t):
-            try:
-                ans, urls = await web_fallback_answer(question=question, topics=t)
-            except TypeError:
-                ans, urls = web_fallback_answer(question=question, topics=t)  # type: ignore
-            if ans and "(looked up on the web" not in ans:
-                ans = ans.strip() + "\n(looked up on the web)"
-            return ans, urls
+        if rag_timed_out:
+            rag_payload = {"status": "unknown", "timed_out": True}
+        cse_answer, cse_urls = ("", []) if cse_timed_out else cse_res
+        cse_answer = self._tag_cse(cse_answer)
 
-        a_task = asyncio.create_task(cse_for(self.compare["A"]))
-        b_task = asyncio.create_task(cse_for(self.compare["B"]))
-        (a_ans, a_urls), (b_ans, b_urls) = await asyncio.gather(a_task, b_task)
+        if rag_payload["status"] != "known" or cse_timed_out:
+            return self._finish(question, rag_payload, cse_answer, cse_urls)
 
-        from app.core.groq_service import groq_complete
-        reco = groq_complete(
-            "Recommend A or B concisely (2 lines). If ambiguous, say what extra info is needed.",
-            f"Question: {question}\n\nA: {a_ans}\n\nB: {b_ans}"
-        )
-        matrix = [
-            {"dimension": "Answer (web)", "a_value": a_ans, "b_value": b_ans, "a_cites": list(range(len(a_urls))), "b_cites": list(range(len(b_urls)))}
-        ]
-        return {
-            "A": {"summary": a_ans, "sources": a_urls, "confidence": 0.7},
-            "B": {"summary": b_ans, "sources": b_urls, "confidence": 0.7},
-            "matrix": matrix,
-            "comparator": "partial",
-            "recommendation": (reco or "").strip()
-        }
+        fused, final = await self._fuse(question, rag_payload["summary"], cse_answer)
+        return self._finish(question, rag_payload, cse_answer, cse_urls, fused=fused, final=final)
+
+    async def answer_dual_stream(self, question: str) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Streaming answer_dual. Yields (event, data):
+          ("progress", {"stage": ...})   searching / sources / retrieved / synthesizing / fusing / answering
+          ("evidence", {"source", ...})  a branch's answer as soon as it lands (rag or web, whichever first)
+          ("token", {"text": ...})       pieces of the final answer
+          ("done", payload)              same payload as answer_dual (final_answer is canonical)
+        A semantic cache hit yields ("progress", {"stage": "cached"}), the answer as one token, then done.
+        """
+        scope, q, hit = await self._cached_answer(question)
+        if hit is not None:
+            yield ("progress", {"stage": "cached", "similarity": hit["cached"]["similarity"]})
+            yield ("token", {"text": hit["final_answer"]})
+            yield ("done", hit)
+            return
+        stream = self._answer_dual_stream(question)
+        try:
+            async for event, data in stream:
+                if event == "done":
+                    self._remember_answer(scope, question, q, data)
+                yield event, data
+        finally:
+            await stream.aclose()  # cancels its branch tasks if the client went away
+
+    async def _answer_dual_stream(self, question: str) -> AsyncIterator[Tuple[str, Dict]]:
+        from app.core.groq_service import groq_complete_async, groq_stream_async, track_usage
+
+        queue: asyncio.Queue = asyncio.Queue()
+        emit = lambda event, data: queue.put_nowait((event, data))
+        cse_deadline = time.perf_counter() + self.cse_budget
+
+        async def cse_prepare():
+            prep = await prepare_web_answer(question=question, topics=self.topic)
+            emit("progress", {"stage": "sources", "count": len(prep["urls"])})
+            return prep
+
+        async def cse_synthesize(prep):
+            ans = await groq_complete_async(prep["system"], prep["user"])
+            return self._tag_cse(ans + prep["suffix"])
+
+        yield ("progress", {"stage": "searching"})
+        prep_task = asyncio.create_task(_budgeted(cse_prepare(), self.cse_budget, "cse_sources"))
+        rag_task = asyncio.create_task(_budgeted(self._rag_branch(question, emit), self.rag_budget, "rag"))
+        tasks = [prep_task, rag_task]
+        rag_payload: Optional[Dict] = None
+        prep: Optional[Dict] = None
+        synth_task: Optional[asyncio.Task] = None
+        cse_timed_out = False
+        try:
+            # Phase 1: RAG verdict + web prompt. Whichever lands first is surfaced
+            # right away; if the web prompt is ready before RAG decided, its
+            # synthesis starts immediately instead of waiting on RAG.
+            while rag_payload is None or (prep is None and not cse_timed_out):
+                async for item in _drain(queue, [t for t in (rag_task, prep_task) if not t.done()], until_any=True):
+                    yield item
+                if rag_payload is None and rag_task.done():
+                    rag_payload, rag_timed_out = rag_task.result()
+                    if rag_timed_out:
+                        rag_payload = {"status": "unknown", "timed_out": True}
+                    if rag_payload["status"] == "known":
+                        yield ("evidence", {"source": "rag", "summary": rag_payload["summary"]})
+                if prep is None and not cse_timed_out and prep_task.done():
+                    prep, cse_timed_out = prep_task.result()
+                    if prep is not None and (rag_payload is None or rag_payload["status"] == "known"):
+                        synth_task = asyncio.create_task(
+                            _budgeted(cse_synthesize(prep), cse_deadline - time.perf_counter(), "cse_synthesis")
+                        )
+                        tasks.append(synth_task)
+            cse_urls = prep["urls"] if prep else []
+
+            if rag_payload["status"] != "known":
+                yield ("progress", {"stage": "answering"})
+                if synth_task is not None:
+                    # synthesis already running (started before RAG gave up)
+                    async for item in _drain(queue, [synth_task]):
+                        yield item
+                    cse_answer, cse_timed_out = synth_task.result()
+                    cse_answer = cse_answer or ""
+                    yield ("token", {"text": cse_answer or _CSE_TIMEOUT_ANSWER})
+                elif prep is not None:
+                    parts: List[str] = []
+                    async for piece in groq_stream_async(prep["system"], prep["user"]):
+                        parts.append(piece)
+                        yield ("token", {"text": piece})
+                    streamed = "".join(parts)
+                    cse_answer = self._tag_cse(streamed + prep["suffix"])
+                    tail = cse_answer[len(streamed):] if cse_answer.startswith(streamed) else ""
+                    if tail:
+                        yield ("token", {"text": tail})
+                else:
+                    cse_answer = ""
+                    yield ("token", {"text": _CSE_TIMEOUT_ANSWER})
+                out = self._finish(question, rag_payload, cse_answer, cse_urls)
+                yield ("done", out)
+                return
+
+            yield ("progress", {"stage": "synthesizing"})
+            cse_answer = ""
+            if synth_task is not None:
+                async for item in _drain(queue, [synth_task]):
+                    yield item
+                cse_answer, cse_timed_out = synth_task.result()
+                cse_answer = cse_answer or ""
+                if cse_answer:
+                    yield ("evidence", {"source": "web", "summary": cse_answer, "sources": cse_urls})
+
+            if cse_timed_out or not cse_answer:
+                # Web branch missed its budget: the doc answer stands alone, no fusion.
+                yield ("token", {"text": rag_payload["summary"]})
+                yield ("done", self._finish(question, rag_payload, "", []))
+                return
+
+            yield ("progress", {"stage": "fusing"})
+            # JSON mode can't stream, so the final answer is always a streamed plain
+            # completion here; "single" skips the agreement note to stay at one call.
+            mode = "single" if self.fusion_mode == "single" else "legacy"
+            fused_prompt, final_prompt = self._fusion_prompts(question, rag_payload["summary"], cse_answer)
+            t0 = time.perf_counter()
+            with track_usage() as usage:
+                fused_task = None
+                if mode == "legacy":
+                    fused_task = asyncio.create_task(groq_complete_async(*fused_prompt))
+                    tasks.append(fused_task)
+                parts = []
+                async for piece in groq_stream_async(*final_prompt):
+                    parts.append(piece)
+                    yield ("token", {"text": piece})
+                fused = await fused_task if fused_task is not None else ""
+                final = "".join(parts)
+            _record_fusion(mode, t0, usage)
+            yield ("done", self._finish(question, rag_payload, cse_answer, cse_urls, fused=fused, final=final))
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+
+    # ---------- Comparison Mode (CSE-only) ----------
+    async def compare_init(self, *topics: Dict):
+        """Products to compare, labelled A, B, C... in order (2..COMPARE_MAX_PRODUCTS)."""
+        self.compare = label_topics(topics)
+
+    async def compare_ask(self, question: str) -> Dict:
+        if not self.compare:
+            return {"A": {}, "B": {}, "products": [], "matrix": [], "recommendation": "Initialize comparison first."}
+        return await compare_products(question, self.compare)
 
     # ---------- History ----------
     def get_history(self) -> List[Dict]:
@@ -224,7 +789,10 @@ class Orchestrator:
     def clear(self) -> Dict:
         self.topic = None
         self.history.clear()
-        self.pdf_text = ""
+        self.doc_ids = []  # documents stay in the knowledge base
         self.rag_index = None
+        self.index_status = "disabled_or_empty"
+        self.index_job = None
+        self._topic_gen += 1  # a running ingest job finishes into the KB only
         self.compare = None
         return {"ok": True}
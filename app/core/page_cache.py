@@ -0,0 +1,259 @@
+# app/core/page_cache.py
+"""
+Cache of *extracted* main text per URL, so repeat questions skip both the
+download and the trafilatura/BeautifulSoup pass.
+
+- Entries younger than PAGE_CACHE_FRESH_SECONDS are served without network.
+- Older entries are revalidated with a conditional GET (If-None-Match /
+  If-Modified-Since from the stored ETag / Last-Modified); a 304 refreshes the
+  entry and reuses the stored text without re-parsing.
+- Text is zlib-compressed on disk (one file per URL) under a byte budget
+  (PAGE_CACHE_MAX_MB); least recently used pages are evicted first.
+- Entries older than PAGE_CACHE_MAX_AGE are dropped regardless.
+
+All methods do blocking file I/O (and zlib); async callers go through
+run_in_thread. The cache (and its directory) is created on first use by
+get_page_cache(), not at import.
+"""
+from __future__ import annotations
+from typing import Dict, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+from app.core import metrics
+from app.core.utils import CACHE_DIR
+
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE", "1").lower() not in ("0", "false", "no", "off")
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", os.path.join(CACHE_DIR, "pages"))
+PAGE_CACHE_MAX_MB = float(os.getenv("PAGE_CACHE_MAX_MB", "128"))
+PAGE_CACHE_FRESH_SECONDS = float(os.getenv("PAGE_CACHE_FRESH_SECONDS", "3600"))
+PAGE_CACHE_MAX_AGE = float(os.getenv("PAGE_CACHE_MAX_AGE", str(7 * 86400)))
+
+
+def _url_key(url: str) -> str:
+    return hashlib.sha1((url or "").strip().encode("utf-8")).hexdigest()
+
+
+class PageCache:
+    def __init__(
+        self,
+        root: str = PAGE_CACHE_DIR,
+        max_mb: float = PAGE_CACHE_MAX_MB,
+        fresh_seconds: float = PAGE_CACHE_FRESH_SECONDS,
+        max_age: float = PAGE_CACHE_MAX_AGE,
+    ):
+        self.root = root
+        self.budget = int(max_mb * 1024 * 1024)
+        self.fresh_seconds = fresh_seconds
+        self.max_age = max_age
+        self._idx_path = os.path.join(root, "index.json")
+        self._index: "OrderedDict[str, Dict]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one writer of index.json at a time
+        self._dirty = False
+        self._last_save = 0.0
+        self.fresh_hits = 0
+        self.revalidated = 0
+        self.misses = 0  # lookups with no entry at all
+        self.refetched = 0  # stale entries whose page had to be downloaded again
+        self.evictions = 0
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    # ---------- Index ----------
+    def _load(self):
+        try:
+            with open(self._idx_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except Exception:
+            return
+        for key, meta in entries:
+            if os.path.exists(self._path(key)):
+                self._index[key] = meta
+                self._bytes += int(meta.get("size", 0))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.txt.z")
+
+    def flush(self):
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                entries = [[k, v] for k, v in self._index.items()]
+                self._dirty = False
+                self._last_save = time.time()
+            try:
+                tmp = f"{self._idx_path}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(entries, f)
+                os.replace(tmp, self._idx_path)
+            except OSError:
+                self._dirty = True
+
+    def _maybe_flush(self):
+        if time.time() - self._last_save >= 30:
+            self.flush()
+
+    def _remove(self, key: str):
+        meta = self._index.pop(key, None)
+        if meta is not None:
+            self._bytes -= int(meta.get("size", 0))
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self._dirty = True
+
+    # ---------- Public ----------
+    def lookup(self, url: str) -> Optional[Dict]:
+        """Metadata for url (etag, last_modified, fetched_at, fresh) or None."""
+        key = _url_key(url)
+        now = time.time()
+        with self._lock:
+            meta = self._index.get(key)
+            if meta is None:
+                return None
+            if now - meta.get("stored_at", 0) > self.max_age:
+                self._remove(key)
+                return None
+            self._index.move_to_end(key)
+            out = dict(meta)
+        out["fresh"] = (now - out.get("fetched_at", 0)) <= self.fresh_seconds
+        return out
+
+    def read_text(self, url: str) -> Optional[str]:
+        try:
+            with open(self._path(_url_key(url)), "rb") as f:
+                return zlib.decompress(f.read()).decode("utf-8")
+        except Exception:
+            with self._lock:
+                self._remove(_url_key(url))
+            return None
+
+    def probe(self, url: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """(metadata or None, text if fresh enough to skip the network entirely)."""
+        meta = self.lookup(url)
+        if meta is None:
+            self.misses += 1
+            metrics.incr("page_cache.miss")
+            return None, None
+        if not meta["fresh"]:
+            return meta, None
+        text = self.read_text(url)
+        if text is None:
+            return None, None  # unreadable file: entry dropped, fetch as new
+        self.fresh_hits += 1
+        metrics.incr("page_cache.fresh_hit")
+        return meta, text
+
+    def get_fresh(self, url: str) -> Optional[str]:
+        """Text if the entry is fresh enough to skip the network entirely."""
+        return self.probe(url)[1]
+
+    def conditional_headers(self, meta: Optional[Dict]) -> Dict[str, str]:
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def revalidated_text(self, url: str) -> Optional[str]:
+        """Server said 304: bump fetched_at and hand back the stored text."""
+        text = self.read_text(url)
+        if text is None:
+            return None
+        key = _url_key(url)
+        with self._lock:
+            meta = self._index.get(key)
+            if meta is not None:
+                meta["fetched_at"] = time.time()
+                self._dirty = True
+        self.revalidated += 1
+        metrics.incr("page_cache.revalidated")
+        self._maybe_flush()
+        return text
+
+    def put(self, url: str, text: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        if not text:
+            return
+        key = _url_key(url)
+        blob = zlib.compress(text.encode("utf-8"), 6)
+        if len(blob) > self.budget:
+            return
+        try:
+            tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(blob)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            return
+        now = time.time()
+        with self._lock:
+            old = self._index.pop(key, None)
+            if old is not None:
+                self._bytes -= int(old.get("size", 0))
+                self.refetched += 1
+            self._index[key] = {
+                "url": url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "fetched_at": now,
+                "stored_at": now,
+                "size": len(blob),
+            }
+            self._bytes += len(blob)
+            while self._bytes > self.budget and len(self._index) > 1:
+                oldest = next(iter(self._index))
+                self._remove(oldest)
+                self.evictions += 1
+            self._dirty = True
+        self._maybe_flush()
+
+    def stats(self) -> Dict:
+        served = self.fresh_hits + self.revalidated
+        total = served + self.misses + self.refetched
+        return {
+            "entries": len(self._index),
+            "bytes": self._bytes,
+            "budget_bytes": self.budget,
+            "fresh_hits": self.fresh_hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "refetched": self.refetched,
+            "evictions": self.evictions,
+            "hit_rate": round(served / total, 4) if total else 0.0,
+        }
+
+
+_page_cache: Optional[PageCache] = None
+_page_cache_failed = False
+_page_cache_lock = threading.Lock()
+
+
+def get_page_cache() -> Optional[PageCache]:
+    """The shared cache, created on first use; None when disabled or the directory can't be created."""
+    global _page_cache, _page_cache_failed
+    if _page_cache is None and PAGE_CACHE_ENABLED and not _page_cache_failed:
+        with _page_cache_lock:
+            if _page_cache is None and not _page_cache_failed:
+                try:
+                    _page_cache = PageCache()
+                    metrics.register("page_cache", _page_cache.stats)
+                except OSError:
+                    _page_cache_failed = True  # read-only FS etc.: run uncached
+    return _page_cache
+
+
+def flush_page_cache():
+    """Write the index if the cache was ever used (blocking; shutdown hook)."""
+    if _page_cache is not None:
+        _page_cache.flush()
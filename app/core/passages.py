@@ -0,0 +1,188 @@
+# app/core/passages.py
+"""
+Query-focused extractive compression of scraped pages for the web-answer
+prompt (replaces "first 1800 chars of each page", which is mostly navigation
+and boilerplate).
+
+- Pages are split into sentences (line breaks and sentence ends) and grouped
+  into passages of about WEB_PASSAGE_TOKENS tokens. Very short or mostly
+  non-alphabetic lines (menus, footers, buttons) and repeated passages are
+  dropped.
+- Passages are ranked against the question with BM25 and, when the
+  embedding model is already loaded, MiniLM cosine similarity over BM25's
+  best candidates (one batched encode). Both rankings are combined with
+  reciprocal-rank fusion, as in RagIndex retrieval.
+- The best passages are packed into WEB_SOURCE_TOKENS, with each page's top
+  passage first so every source keeps a citation. Within a page, passages
+  stay in document order, with "..." marking the gaps.
+
+Tokens are counted like chunks are (app.core.chunker): with the embedding
+model's tokenizer once the model is loaded, else ~4/3 tokens per word.
+
+Env:
+- WEB_SOURCE_TOKENS   token budget for all sources together (default 900)
+- WEB_PASSAGE_TOKENS  target passage size (default 60)
+- WEB_PASSAGE_EMBED   "0" ranks with BM25 only (default 1)
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence, Tuple
+import os
+import re
+
+import numpy as np
+
+from app.core import metrics
+from app.core.bm25 import BM25Index, rrf_fuse
+from app.core.chunker import SENT_END_RE, estimate_tokens, get_counter
+from app.core.embedding_service import get_model, is_loaded, DEFAULT_EMBED_MODEL
+
+WEB_SOURCE_TOKENS = int(os.getenv("WEB_SOURCE_TOKENS", "900"))
+WEB_PASSAGE_TOKENS = int(os.getenv("WEB_PASSAGE_TOKENS", "60"))
+WEB_PASSAGE_EMBED = os.getenv("WEB_PASSAGE_EMBED", "1").lower() not in ("0", "false", "no", "off")
+
+_LINE_RE = re.compile(r"[^\n]+")
+_WORD_RE = re.compile(r"[A-Za-z]{2,}")
+_MIN_WORDS = 4  # shorter lines are menu items / buttons
+_GAP = " ... "
+_EMBED_CANDIDATES = 96  # passages re-ranked by embeddings (BM25's best); bounds the encode cost
+
+
+# ---------- Token counting ----------
+def count_tokens(texts: Sequence[str]) -> np.ndarray:
+    """Tokens per text: the embedding tokenizer if the model is already loaded (never loads it), else an estimate."""
+    if not texts:
+        return np.zeros(0, dtype="int32")
+    if is_loaded(DEFAULT_EMBED_MODEL):
+        return get_counter().count(texts)
+    return estimate_tokens(texts)
+
+
+# ---------- Splitting ----------
+def _sentences(text: str) -> List[str]:
+    out = []
+    for m in _LINE_RE.finditer(text or ""):
+        line = m.group(0).strip()
+        if len(_WORD_RE.findall(line)) < _MIN_WORDS:
+            continue
+        start = 0
+        for end in SENT_END_RE.finditer(line):
+            out.append(line[start:end.end()].strip())
+            start = end.end()
+        if start < len(line):
+            out.append(line[start:].strip())
+    return [s for s in out if s]
+
+
+def _pieces(sent: str, n: int, target_tokens: int) -> List[Tuple[str, int]]:
+    """A run-on "sentence" (text without punctuation, e.g. a flattened menu) cut into word runs."""
+    if n <= 2 * target_tokens:
+        return [(sent, n)]
+    words = sent.split()
+    per = max(1, len(words) * target_tokens // n)
+    return [(" ".join(words[i:i + per]), target_tokens) for i in range(0, len(words), per)]
+
+
+def split_passages(text: str, target_tokens: int = WEB_PASSAGE_TOKENS, seen: Optional[set] = None) -> List[str]:
+    """
+    Runs of consecutive sentences of ~target_tokens each. Sentences already in
+    `seen` (repeated banners / menus, within and across pages) are skipped.
+    """
+    sents = _sentences(text)
+    if seen is not None:
+        kept = []
+        for sent in sents:
+            key = sent.lower()
+            if key not in seen:
+                seen.add(key)
+                kept.append(sent)
+        sents = kept
+    if not sents:
+        return []
+    lengths = count_tokens(sents)
+    out, cur, size = [], [], 0
+    for sent, n in (p for s, n in zip(sents, lengths) for p in _pieces(s, int(n), target_tokens)):
+        if cur and size + n > target_tokens:
+            out.append(" ".join(cur))
+            cur, size = [], 0
+        cur.append(sent)
+        size += int(n)
+    if cur:
+        out.append(" ".join(cur))
+    return out
+
+
+# ---------- Ranking ----------
+def _rank(query: str, passages: List[str], use_embeddings: bool) -> List[int]:
+    """Passage ids best first: RRF of BM25 and (optionally) MiniLM cosine rankings."""
+    bm25 = BM25Index()
+    bm25.build(passages)
+    lexical = np.argsort(-bm25.scores(query), kind="stable")
+    rankings = [lexical]
+    if use_embeddings:
+        cands = lexical[:_EMBED_CANDIDATES]
+        try:
+            vecs = get_model(DEFAULT_EMBED_MODEL).encode(
+                [query] + [passages[i] for i in cands],
+                normalize_embeddings=True,
+                convert_to_numpy=True
+            ).astype("float32")
+            rankings.append(cands[np.argsort(-(vecs[1:] @ vecs[0]), kind="stable")])
+        except Exception:
+            metrics.incr("web.passages.embed_error")
+    return rrf_fuse(rankings)
+
+
+def select_passages(
+    question: str,
+    pages: List[Tuple[str, str]],
+    budget: int = WEB_SOURCE_TOKENS,
+    query: Optional[str] = None,
+    use_embeddings: Optional[bool] = None,
+) -> List[Tuple[str, str]]:
+    """
+    [(url, compressed text)] for the pages that got at least one passage, in
+    the input order. `query` (default: question) is what passages are scored
+    against, e.g. the question plus the product name.
+    """
+    if use_embeddings is None:
+        # only when the model is already resident; never load it for a web answer
+        use_embeddings = WEB_PASSAGE_EMBED and is_loaded(DEFAULT_EMBED_MODEL)
+    owner: List[int] = []
+    passages: List[str] = []
+    seen: set = set()
+    for p, (_, text) in enumerate(pages):
+        for passage in split_passages(text, seen=seen):
+            owner.append(p)
+            passages.append(passage)
+    if not passages:
+        return []
+
+    order = _rank(query or question, passages, use_embeddings)
+    cost = count_tokens(passages)
+    # every page's best passage first (keeps each source citable), then global rank
+    firsts: Dict[int, int] = {}
+    for i in order:
+        firsts.setdefault(owner[i], i)
+    lead = set(firsts.values())
+    queue = [i for i in order if i in lead] + [i for i in order if i not in lead]
+
+    chosen: List[int] = []
+    used = 0
+    for i in queue:
+        if used + cost[i] <= budget:
+            chosen.append(i)
+            used += int(cost[i])
+
+    by_page: Dict[int, List[int]] = {}
+    for i in sorted(chosen):
+        by_page.setdefault(owner[i], []).append(i)
+    out = []
+    for p, ids in sorted(by_page.items()):
+        parts = [passages[ids[0]]]
+        for prev, i in zip(ids, ids[1:]):
+            parts.append((" " if i == prev + 1 else _GAP) + passages[i])
+        out.append((pages[p][0], "".join(parts)))
+
+    metrics.observe("web.passages.tokens", used)
+    metrics.observe("web.passages.kept_ratio", used / max(1, int(cost.sum())))
+    return out
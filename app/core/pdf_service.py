@@ -1,11 +1,215 @@
 import re
-from typing import Optional, Dict, List
+import os
+import asyncio
+import tempfile
+from collections import deque
+from typing import Optional, Dict, List, Tuple, Iterator, AsyncIterator, Union
 from io import BytesIO
+import numpy as np
 try:
     from pypdf import PdfReader
 except Exception:
     PdfReader = None
 
+# Streaming extraction: pages are parsed in batches of PDF_PAGE_BATCH, at most
+# PDF_PARSE_INFLIGHT batches at once in the process pool (0 = PROCESS_WORKERS),
+# so a long manual never sits in memory as one string. PDF_MAX_PAGES=0: no limit.
+PDF_PAGE_BATCH = int(os.getenv("PDF_PAGE_BATCH", "8"))
+PDF_PARSE_INFLIGHT = int(os.getenv("PDF_PARSE_INFLIGHT", "0"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "0"))
+# A page with fewer extractable characters than this is treated as scanned.
+SCANNED_MIN_CHARS = int(os.getenv("SCANNED_MIN_CHARS", "50"))
+
+PdfSource = Union[bytes, str]  # raw bytes or a file path
+
+
+def _reader(source: PdfSource):
+    return PdfReader(BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+
+def _clean_page_text(txt: str) -> str:
+    # collapse runs of spaces inside lines but keep line breaks (headings / paragraphs for the chunker)
+    lines = (re.sub(r"[ \t\r\f\v]+", " ", ln).strip() for ln in (txt or "").split("\n"))
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def pdf_page_count(source: PdfSource) -> int:
+    if not source or not PdfReader:
+        return 0
+    try:
+        return len(_reader(source).pages)
+    except Exception:
+        return 0
+
+
+def extract_pdf_page_range(source: PdfSource, start: int, end: int) -> List[str]:
+    """Cleaned text of pages [start, end) (0-based); process-pool friendly with a path."""
+    if not source or not PdfReader:
+        return []
+    try:
+        reader = _reader(source)
+        return [_clean_page_text(reader.pages[i].extract_text() or "") for i in range(start, min(end, len(reader.pages)))]
+    except Exception:
+        return []
+
+
+def _page_limit(n: int, max_pages: Optional[int]) -> int:
+    limit = PDF_MAX_PAGES if max_pages is None else max_pages
+    return min(n, limit) if limit else n
+
+
+def iter_pdf_pages(source: PdfSource, batch: int = PDF_PAGE_BATCH, max_pages: Optional[int] = None) -> Iterator[Tuple[int, List[str]]]:
+    """Serial generator of (first page number, page texts) batches from one PdfReader."""
+    if not source or not PdfReader:
+        return
+    try:
+        reader = _reader(source)
+        n = _page_limit(len(reader.pages), max_pages)
+    except Exception:
+        return
+    for s in range(0, n, batch):
+        pages = []
+        for i in range(s, min(s + batch, n)):
+            try:
+                pages.append(_clean_page_text(reader.pages[i].extract_text() or ""))
+            except Exception:
+                pages.append("")
+        yield s + 1, pages
+
+
+class ParsedPdf:
+    """
+    One text extraction pass over an uploaded PDF, shared by OCR routing,
+    topic detection and chunking (instead of is_scanned / extract / OCR each
+    re-extracting every page from the bytes).
+
+    - The bytes are spooled to a temp file once (`path`); workers extract page
+      ranges from it and OCR rasterizes from it.
+    - Per page: character count and a scanned flag (fewer than
+      SCANNED_MIN_CHARS extractable chars), as flat numpy arrays.
+    - Page texts are spooled to a side file, not held in memory; page() and
+      head() read them back.
+
+    stream() extracts page-range batches in the process pool and yields them
+    as they complete, so the caller can embed while later pages are still
+    being parsed. A PdfReader can't be shared across processes, so each
+    batch opens its own reader on `path` (the cross-reference table is read
+    per batch); the page text itself is extracted exactly once.
+    """
+
+    def __init__(self, file_bytes: bytes, min_chars_per_page: int = SCANNED_MIN_CHARS):
+        self.min_chars = min_chars_per_page
+        fd, self.path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            f.write(file_bytes or b"")
+        self._text_path = self.path + ".txt"
+        self._text_f = open(self._text_path, "w+b")
+        self._spans: List[Tuple[int, int]] = []  # byte span of each page in the text spool
+        self.char_counts = np.zeros(0, dtype="int32")
+        self.scanned = np.zeros(0, dtype=bool)
+        self.n_pages = 0
+
+    # ---------- Parse ----------
+    def _record(self, first_page: int, pages: List[str]):
+        for i, text in enumerate(pages):
+            self.set_page(first_page + i, text)
+
+    async def stream(
+        self,
+        batch: int = PDF_PAGE_BATCH,
+        inflight: int = PDF_PARSE_INFLIGHT,
+        max_pages: Optional[int] = None,
+    ) -> AsyncIterator[Tuple[int, List[str]]]:
+        """
+        Parse page-range batches in the process pool (at most `inflight`
+        pending) and yield (first page number, page texts) in page order.
+        """
+        from app.core.async_io import run_in_process, PROCESS_WORKERS
+
+        if not PdfReader:
+            return
+        n = _page_limit(await run_in_process(pdf_page_count, self.path), max_pages)
+        self._grow(n)
+        starts = iter(range(0, n, batch))
+        limit = max(1, inflight or PROCESS_WORKERS)
+        pending: deque = deque()
+
+        def submit() -> bool:
+            s = next(starts, None)
+            if s is None:
+                return False
+            pending.append((s, asyncio.ensure_future(run_in_process(extract_pdf_page_range, self.path, s, s + batch))))
+            return True
+
+        try:
+            while len(pending) < limit and submit():
+                pass
+            while pending:
+                s, fut = pending.popleft()
+                pages = await fut
+                submit()
+                self._record(s + 1, pages)
+                yield s + 1, pages
+        finally:
+            for _, fut in pending:
+                fut.cancel()
+
+    # ---------- Pages ----------
+    def _grow(self, n: int):
+        if n > self.n_pages:
+            self.char_counts = np.concatenate([self.char_counts, np.zeros(n - self.n_pages, dtype="int32")])
+            self.scanned = np.concatenate([self.scanned, np.ones(n - self.n_pages, dtype=bool)])
+            self._spans.extend([(0, 0)] * (n - self.n_pages))
+            self.n_pages = n
+
+    def set_page(self, page_no: int, text: str):
+        """Store (or replace, e.g. with OCR output) the text of page page_no (1-based)."""
+        self._grow(page_no)
+        data = (text or "").encode("utf-8")
+        self._text_f.seek(0, os.SEEK_END)
+        start = self._text_f.tell()
+        self._text_f.write(data)
+        i = page_no - 1
+        self._spans[i] = (start, start + len(data))
+        self.char_counts[i] = len((text or "").strip())
+        self.scanned[i] = self.char_counts[i] < self.min_chars
+
+    def page(self, page_no: int) -> str:
+        s, e = self._spans[page_no - 1]
+        if e <= s:
+            return ""
+        self._text_f.seek(s)
+        return self._text_f.read(e - s).decode("utf-8")
+
+    def head(self, max_chars: int) -> str:
+        """Leading text up to max_chars (topic detection)."""
+        out, total = [], 0
+        for p in range(1, self.n_pages + 1):
+            if total >= max_chars:
+                break
+            t = self.page(p)
+            out.append(t)
+            total += len(t) + 1
+        return "\n".join(out)[:max_chars]
+
+    # ---------- Cleanup ----------
+    def close(self):
+        try:
+            self._text_f.close()
+        except Exception:
+            pass
+        for p in (self.path, self._text_path):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    def __enter__(self) -> "ParsedPdf":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 def extract_pdf_text(file_bytes: Optional[bytes], max_pages: int = 6, max_chars: int = 40000) -> str:
     if not file_bytes or not PdfReader:
         return ""
@@ -1,16 +1,34 @@
 # app/core/rag_service.py
 from __future__ import annotations
-from typing import List, Tuple
+from typing import Dict, List, Tuple
+import json
+import os
+import threading
+import uuid
 import numpy as np
 
-# Lightweight local embedding model
-# Install: sentence-transformers
-from sentence_transformers import SentenceTransformer
+# Lightweight local embedding model, shared process-wide (see embedding_service)
+from app.core.embedding_service import get_model, DEFAULT_EMBED_MODEL
+from app.core.embedding_cache import embed_chunks
+from app.core.vector_index import VectorIndex, make_index
+from app.core.bm25 import BM25Index, rrf_fuse
+from app.core.chunker import chunk_pages
+from app.core import metrics
+
+# Hybrid retrieval: BM25 (exact SKUs / spec values) fused with dense similarity
+# by reciprocal-rank fusion. RAG_HYBRID=0 for dense only.
+RAG_HYBRID = os.getenv("RAG_HYBRID", "1").lower() not in ("0", "false", "no", "off")
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+RAG_HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "50"))
+# Removed documents are tombstoned; the index is rebuilt from live rows once
+# dead rows exceed RAG_COMPACT_RATIO x live rows.
+RAG_COMPACT_RATIO = float(os.getenv("RAG_COMPACT_RATIO", "1.0"))
 
 
 def chunk_text(text: str, chunk_size: int = 800, overlap: int = 150) -> List[str]:
     """
-    Split text into overlapping chunks for retrieval.
+    Split text into overlapping word windows (legacy; RagIndex and the
+    knowledge base use the token-based chunker in app.core.chunker).
     """
     text = (text or "").strip()
     if not text:
@@ -28,35 +46,310 @@ def chunk_text(text: str, chunk_size: int = 800, overlap: int = 150) -> List[str
 class RagIndex:
     """
     Very small local vector index. No external services required.
+    Search goes through a pluggable backend (see vector_index.make_index):
+    exact by default, ANN (IVF / HNSW) for large document sets. With
+    hybrid on, a BM25 index over the same chunks is fused in by RRF.
+
+    The index holds one or more documents, each a contiguous run of rows
+    (chunks / vectors / provenance). add() appends a document and remove()
+    tombstones one, both at a cost proportional to that document's chunks
+    (the BM25 index is updated in step, see app.core.bm25); when tombstones
+    outnumber live rows the index is compacted.
     """
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
-        self.chunks: List[str] = []
+    def __init__(self, model_name: str = DEFAULT_EMBED_MODEL, backend: str | None = None, hybrid: bool = RAG_HYBRID):
+        self.model_name = model_name
+        self.model = get_model(model_name)
+        self.backend = backend
+        self.hybrid = hybrid
+        self.chunks: List[str] = []  # "" for rows of removed documents
         self.vecs: np.ndarray | None = None
+        self.index: VectorIndex | None = None
+        self.bm25: BM25Index | None = None
+        self.prov: np.ndarray | None = None  # [n, 4] first page, last page, char start, char end
+        self.doc_ids: List[str] = []  # live documents, in row order
+        self._seg_ids: List[str | None] = []  # document of each row run (None: removed)
+        self._doc_ends: np.ndarray | None = None  # cumulative row counts of _seg_ids
+        self._kb_docs: set = set()  # doc ids whose rows are knowledge-base documents
+        self._mapped = False  # vecs is a view of the knowledge-base memory map
+        self._prov_buf: np.ndarray | None = None
+        self._lock = threading.RLock()
+
+    def _set_vectors(self, vecs: np.ndarray | None):
+        """Index vecs (rows aligned with self.chunks) and, if hybrid, the chunk text."""
+        self.vecs = vecs
+        self._mapped = isinstance(vecs, np.memmap)
+        if vecs is None or not len(vecs):
+            self.index = None
+            self.bm25 = None
+            return
+        self.index = make_index(len(vecs), backend=self.backend)
+        self.index.build(vecs)
+        if self.hybrid:
+            self.bm25 = BM25Index()
+            self.bm25.build(self.chunks)
 
     def build(self, text: str):
-        self.chunks = chunk_text(text, 800, 150)
-        if not self.chunks:
-            self.vecs = None
+        self.build_pages([text])
+
+    def build_pages(self, pages: List[str]):
+        """Replace the contents with one document from page texts (see add_pages)."""
+        with self._lock:
+            self._clear()
+            self.add_pages(pages)
+
+    def _clear(self):
+        self.chunks, self.prov, self._prov_buf = [], None, None
+        self.doc_ids, self._seg_ids, self._doc_ends, self._kb_docs = [], [], None, set()
+        self._set_vectors(None)
+
+    # ---------- Incremental updates ----------
+    def add_pages(self, pages: List[str], doc_id: str | None = None) -> str | None:
+        """Chunk + embed page texts as one document; returns its id (None if no text)."""
+        chunkset = chunk_pages(pages, self.model_name)
+        chunks = chunkset.texts()
+        if not chunks:
+            return None
+        doc_id = doc_id or uuid.uuid4().hex[:12]
+        # only chunks not seen before (same model) hit the encoder
+        self.add(doc_id, chunks, embed_chunks(chunks, self.model_name), chunkset.provenance())
+        return doc_id
+
+    def add_kb(self, kb, doc_ids: List[str]) -> List[str]:
+        """Append knowledge-base documents (stored vectors, no re-embedding); returns the ids added."""
+        entries = []
+        for d in doc_ids:
+            doc = kb.read_document(d) if d not in self.doc_ids else None
+            if doc is None or not len(doc[1]):
+                continue
+            entries.append((d, *doc))
+        self._add(entries, from_kb=True)
+        return [e[0] for e in entries]
+
+    def add(self, doc_id: str, chunks: List[str], vecs: np.ndarray, prov: np.ndarray | None = None):
+        """Append one document (replacing any document with the same id)."""
+        self._add([(doc_id, list(chunks), vecs, prov)])
+
+    def _add(self, entries: List[Tuple], from_kb: bool = False):
+        entries = [e for e in entries if len(e[1])]
+        if not entries:
+            return
+        with self._lock:
+            for doc_id, *_ in entries:
+                if doc_id in self.doc_ids:
+                    self.remove(doc_id)
+            m = sum(len(e[1]) for e in entries)
+            n = len(self.chunks)
+            provs = [
+                e[3] if e[3] is not None else np.zeros((len(e[1]), 4), dtype="int64")  # page 0: no provenance
+                for e in entries
+            ]
+            self._grow_prov(np.concatenate(provs) if len(provs) > 1 else provs[0], n, m)
+            for doc_id, chunks, _, _ in entries:
+                self.chunks.extend(chunks)
+                self._seg_ids.append(doc_id)
+                self.doc_ids.append(doc_id)
+                if from_kb:
+                    self._kb_docs.add(doc_id)
+            ends = n + np.cumsum([len(e[1]) for e in entries])
+            self._doc_ends = ends if self._doc_ends is None else np.concatenate([self._doc_ends, ends])
+            vecs = entries[0][2] if len(entries) == 1 else np.concatenate([e[2] for e in entries])
+            if self.index is None:
+                # first document: a single knowledge-base document stays a zero-copy view
+                self._set_vectors(vecs)
+                return
+            self.index.add(vecs)
+            self.vecs = self.index.vecs
+            if self.bm25 is not None:
+                self.bm25.add(self.chunks[n:])
+
+    def _grow_prov(self, prov: np.ndarray, n: int, m: int):
+        """Append provenance rows into a doubling buffer (like the vector buffer)."""
+        prov = np.asarray(prov, dtype="int64")
+        if not n:
+            self.prov, self._prov_buf = prov, None
+            return
+        if self._prov_buf is None or self._prov_buf.shape[0] < n + m:
+            buf = np.empty((max(n + m, 2 * n, 64), 4), dtype="int64")
+            buf[:n] = self.prov
+            self._prov_buf = buf
+        self._prov_buf[n:n + m] = prov
+        self.prov = self._prov_buf[:n + m]
+
+    def _rows(self, j: int) -> Tuple[int, int]:
+        return (int(self._doc_ends[j - 1]) if j else 0), int(self._doc_ends[j])
+
+    def remove(self, doc_id: str) -> bool:
+        """Drop a document's rows (tombstoned; compacted once most rows are dead)."""
+        with self._lock:
+            if doc_id not in self.doc_ids:
+                return False
+            j = self._seg_ids.index(doc_id)
+            start, end = self._rows(j)
+            self.index.remove(np.arange(start, end))
+            if self.bm25 is not None:
+                self.bm25.remove(np.arange(start, end), self.chunks[start:end])
+            self.chunks[start:end] = [""] * (end - start)
+            self._seg_ids[j] = None
+            self.doc_ids.remove(doc_id)
+            self._kb_docs.discard(doc_id)
+            if not self.doc_ids:
+                self._clear()
+            elif self.index.live * RAG_COMPACT_RATIO < len(self.index) - self.index.live:
+                self._compact()
+            return True
+
+    def _live_segments(self) -> List[Tuple[str, int, int]]:
+        return [(d, *self._rows(j)) for j, d in enumerate(self._seg_ids) if d is not None]
+
+    def _live_rows(self) -> np.ndarray:
+        runs = [np.arange(s, e) for _, s, e in self._live_segments()]
+        return np.concatenate(runs) if runs else np.zeros(0, dtype="int64")
+
+    def _compact(self):
+        """Rebuild from the live rows only (row ids change)."""
+        live = self._live_segments()
+        keep = self._live_rows()
+        self.chunks = [self.chunks[i] for i in keep.tolist()]
+        self.prov, self._prov_buf = (np.ascontiguousarray(self.prov[keep]) if self.prov is not None else None), None
+        self._seg_ids = [d for d, _, _ in live]
+        self._doc_ends = np.cumsum([e - s for _, s, e in live])
+        self._set_vectors(np.ascontiguousarray(self.vecs[keep]))
+        metrics.incr("rag.compactions")
+
+    @classmethod
+    def from_kb(cls, kb, doc_ids: List[str], backend: str | None = None) -> "RagIndex":
+        """
+        Index over knowledge-base documents without re-embedding. For a single
+        document the vectors are a zero-copy view of the shared memory map.
+        """
+        idx = cls(kb.model_name, backend=backend)
+        idx.add_kb(kb, doc_ids)
+        return idx
+
+    def citation(self, i: int) -> Dict:
+        """Provenance of chunk i: pages, char offsets and (knowledge-base backed) doc_id."""
+        out: Dict = {"chunk": int(i)}
+        if self.prov is not None and int(self.prov[i][0]) > 0:
+            p0, p1, c0, c1 = (int(x) for x in self.prov[i])
+            out.update({"page": p0, "pages": [p0, p1], "chars": [c0, c1]})
+        if self._doc_ends is not None:
+            out["doc_id"] = self._seg_ids[int(np.searchsorted(self._doc_ends, i, side="right"))]
+        return out
+
+    # ---------- Footprint / spill ----------
+    def nbytes(self) -> int:
+        vec_bytes = self.index.nbytes() if self.index is not None else 0
+        if self.bm25 is not None:
+            vec_bytes += self.bm25.nbytes()
+        if self._mapped and self.index is not None and not self.index.owns_vectors:
+            vec_bytes -= int(self.vecs.nbytes)  # page cache, shared across sessions/workers
+        if self._prov_buf is not None:
+            vec_bytes += int(self._prov_buf.nbytes)
+        return vec_bytes + sum(len(c) for c in self.chunks)
+
+    def save(self, path: str):
+        """Persist chunks + vectors to a directory (used to spill idle sessions)."""
+        os.makedirs(path, exist_ok=True)
+        if self.doc_ids and self._kb_docs.issuperset(self.doc_ids):
+            # knowledge-base backed: the documents are already on disk
+            with open(os.path.join(path, "chunks.json"), "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "kb_docs": self.doc_ids}, f)
             return
-        embs = self.model.encode(
-            self.chunks,
+        # live rows only; "docs" keeps the per-document row runs
+        live = self._live_segments()
+        keep = self._live_rows() if len(self._seg_ids) != len(self.doc_ids) else None
+        with open(os.path.join(path, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "model": self.model_name,
+                "chunks": self.chunks if keep is None else [self.chunks[i] for i in keep.tolist()],
+                "docs": [[d, e - s] for d, s, e in live],
+            }, f)
+        if self.vecs is not None:
+            np.save(os.path.join(path, "vecs.npy"), self.vecs if keep is None else self.vecs[keep])
+        if self.prov is not None:
+            np.save(os.path.join(path, "prov.npy"), self.prov if keep is None else self.prov[keep])
+
+    @classmethod
+    def load(cls, path: str) -> "RagIndex":
+        with open(os.path.join(path, "chunks.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("kb_docs"):
+            from app.core.knowledge_base import get_kb
+            return cls.from_kb(get_kb(), meta["kb_docs"])
+        idx = cls(meta.get("model") or DEFAULT_EMBED_MODEL)
+        chunks = meta.get("chunks") or []
+        vec_path = os.path.join(path, "vecs.npy")
+        if not chunks or not os.path.exists(vec_path):
+            return idx
+        vecs = np.load(vec_path)
+        prov_path = os.path.join(path, "prov.npy")
+        prov = np.load(prov_path) if os.path.exists(prov_path) else None
+        entries, s = [], 0
+        for doc_id, n in meta.get("docs") or [[uuid.uuid4().hex[:12], len(chunks)]]:
+            entries.append((doc_id, chunks[s:s + n], vecs[s:s + n], None if prov is None else prov[s:s + n]))
+            s += n
+        idx._add(entries)
+        return idx
+
+    def _fuse(self, query: str, q: np.ndarray, idx: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """
+        RRF of the dense candidates idx with BM25's; scores stay dense cosine
+        (so rag_knows' margin gate keeps its meaning), order is the fused rank.
+        """
+        sparse, _ = self.bm25.search(query, max(k, RAG_HYBRID_CANDIDATES))
+        order = rrf_fuse([idx, sparse], k=RAG_RRF_K)[:k]
+        sims = np.asarray(self.vecs[order]) @ q
+        return [(i, float(s)) for i, s in zip(order, sims)]
+
+    def _encode(self, queries: List[str]) -> np.ndarray:
+        return self.model.encode(
+            list(queries),
             normalize_embeddings=True,
             convert_to_numpy=True
-        )
-        self.vecs = embs.astype("float32")
+        ).astype("float32")
+
+    def _search(self, query: str, q: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Caller holds self._lock (row ids are only valid until the next add / remove)."""
+        if self.index is None or not self.chunks:
+            return []
+        if self.bm25 is not None:
+            idx, _ = self.index.search(q, max(k, RAG_HYBRID_CANDIDATES))
+            return self._fuse(query, q, idx, k)
+        idx, sims = self.index.search(q, k)
+        return [(int(i), float(s)) for i, s in zip(idx, sims)]
 
     def retrieve(self, query: str, k: int = 8) -> List[Tuple[str, float]]:
-        if self.vecs is None or not self.chunks:
+        return [(c, s) for c, s, _ in self.retrieve_cited(query, k)]
+
+    def retrieve_cited(self, query: str, k: int = 8) -> List[Tuple[str, float, Dict]]:
+        """[(chunk, score, citation)] best first, all read under one lock (consistent with add / remove)."""
+        if self.index is None:
             return []
-        q = self.model.encode(
-            [query],
-            normalize_embeddings=True,
-            convert_to_numpy=True
-        )[0].astype("float32")
-        sims = self.vecs @ q  # cosine similarity (vecs normalized)
-        idx = np.argsort(sims)[-k:][::-1]
-        return [(self.chunks[i], float(sims[i])) for i in idx]
+        q = self._encode([query])[0]
+        with self._lock:
+            return [(self.chunks[i], s, self.citation(i)) for i, s in self._search(query, q, k)]
+
+    def retrieve_many(self, queries: List[str], k: int = 8) -> List[List[Tuple[str, float]]]:
+        """
+        Batched retrieve: all queries encoded in one model call and scored with
+        one matrix product (comparison mode, eval runs, query expansion).
+        """
+        if self.index is None or not queries:
+            return [[] for _ in queries]
+        Q = self._encode(queries)
+        with self._lock:
+            if self.index is None or not self.chunks:
+                return [[] for _ in queries]
+            if self.bm25 is not None:
+                dense = self.index.search_many(Q, max(k, RAG_HYBRID_CANDIDATES))
+                return [
+                    [(self.chunks[i], s) for i, s in self._fuse(query, q, idx, k)]
+                    for query, q, (idx, _) in zip(queries, Q, dense)
+                ]
+            return [
+                [(self.chunks[i], float(s)) for i, s in zip(idx, sims)]
+                for idx, sims in self.index.search_many(Q, k)
+            ]
 
 
 def rag_knows(retrieved: List[Tuple[str, float]]) -> bool:
@@ -81,14 +374,7 @@ def rag_knows(retrieved: List[Tuple[str, float]]) -> bool:
     return True
 
 
-def synthesize_from_chunks(question: str, chunks: List[str]) -> str:
-    """
-    Synthesize a cautious, doc-grounded answer using the LLM.
-    This calls the project's Groq wrapper for consistency.
-    """
-    # Local import to avoid circulars
-    from app.core.groq_service import groq_complete
-
+def _synthesis_prompt(question: str, chunks: List[str]) -> Tuple[str, str]:
     # Always suggest competitors as a sales-focused assistant - AT THE END
     competitor_guidance = " Structure your response: 1) Answer from documents first, 2) LAST: Add 'Competitor Alternatives' section with positive points about alternatives to help customers make informed decisions."
     
@@ -99,4 +385,24 @@ def synthesize_from_chunks(question: str, chunks: List[str]) -> str:
     )
     joined = "\n\n".join(f"[Doc {i+1}] {c}" for i, c in enumerate(chunks))
     user = f"Question: {question}\n\nUse only this context:\n{joined}"
+    return system, user
+
+
+def synthesize_from_chunks(question: str, chunks: List[str]) -> str:
+    """
+    Synthesize a cautious, doc-grounded answer using the LLM.
+    This calls the project's Groq wrapper for consistency.
+    """
+    # Local import to avoid circulars
+    from app.core.groq_service import groq_complete
+
+    system, user = _synthesis_prompt(question, chunks)
     return groq_complete(system, user)
+
+
+async def synthesize_from_chunks_async(question: str, chunks: List[str]) -> str:
+    """Non-blocking synthesize_from_chunks (pooled async Groq client)."""
+    from app.core.groq_service import groq_complete_async
+
+    system, user = _synthesis_prompt(question, chunks)
+    return await groq_complete_async(system, user)
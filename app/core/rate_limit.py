@@ -0,0 +1,243 @@
+# app/core/rate_limit.py
+"""
+Client-side rate limiting for the Groq API.
+
+Two token buckets refill continuously: requests per minute (GROQ_RPM) and
+tokens per minute (GROQ_TPM). A call reserves one request plus its estimated
+size (prompt chars / 4 + max_tokens). Once the response arrives, the
+reservation is settled against the real usage. Levels may go negative after
+an underestimate, which delays the next callers accordingly.
+
+- Fair queueing: waiters are queued per session (current_session, set by the
+  HTTP middleware) and served round-robin. One chatty session can't starve
+  the others, and a large request waits its turn instead of being overtaken
+  forever by small ones.
+- Server feedback: on 429, retry-after / x-ratelimit-reset-* pauses every
+  caller until the reset. On success, x-ratelimit-remaining-tokens clamps the
+  TPM bucket and x-ratelimit-limit-tokens adopts the real quota, so several
+  workers sharing one key converge on it.
+
+Works from both async code (acquire) and worker threads (acquire_sync).
+
+Env:
+- GROQ_RPM  requests per minute (default 30; 0 = unlimited)
+- GROQ_TPM  tokens per minute (default 6000; 0 = unlimited)
+"""
+from __future__ import annotations
+from typing import Dict, Mapping, Optional
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+import asyncio
+import os
+import re
+import threading
+import time
+
+from app.core import metrics
+
+GROQ_RPM = float(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = float(os.getenv("GROQ_TPM", "6000"))
+
+# Session of the current request (fair queueing key); "-" outside requests.
+current_session: ContextVar[str] = ContextVar("current_session", default="-")
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIT = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+_POLL = 0.02  # re-check interval for waiters behind the head of the queue
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds from '7.66s', '2m59.56s', '120ms' or a bare number (retry-after)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    return sum(float(n) * _UNIT[u] for n, u in parts) if parts else None
+
+
+def estimate_tokens(messages, max_tokens: int) -> int:
+    """Prompt tokens (~4 chars each, plus per-message overhead) + completion budget."""
+    chars = sum(len(m.get("content") or "") for m in messages)
+    return chars // 4 + 4 * len(messages) + int(max_tokens)
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self._t = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def refill(self, now: float):
+        if self.enabled:
+            self.level = min(self.capacity, self.level + (now - self._t) * self.capacity / 60.0)
+        self._t = now
+
+    def wait(self, amount: float) -> float:
+        """Seconds until `amount` is available (after refill)."""
+        if not self.enabled or self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.capacity
+
+
+class _Ticket:
+    __slots__ = ("session", "tokens")
+
+    def __init__(self, session: str, tokens: int):
+        self.session = session
+        self.tokens = tokens
+
+
+class RateLimiter:
+    def __init__(self, rpm: float = GROQ_RPM, tpm: float = GROQ_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = threading.Lock()
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()  # session -> tickets, round-robin order
+        self._blocked_until = 0.0
+        self.granted = 0
+        self.throttled = 0
+
+    # ---------- Admission ----------
+    def _enqueue(self, tokens: int) -> _Ticket:
+        ticket = _Ticket(current_session.get(), int(tokens))
+        with self._lock:
+            self._queues.setdefault(ticket.session, deque()).append(ticket)
+        return ticket
+
+    def _try(self, ticket: _Ticket) -> float:
+        """Grant ticket now (returns 0) or return how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            session, queue = next(iter(self._queues.items()))
+            head = queue[0]
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            need = min(head.tokens, self.tokens.capacity) if self.tokens.enabled else 0
+            wait = max(self._blocked_until - now, self.requests.wait(1), self.tokens.wait(need))
+            if head is not ticket:
+                return max(wait, _POLL)
+            if wait > 0:
+                return wait
+            self.requests.level -= 1
+            self.tokens.level -= need
+            ticket.tokens = int(need)
+            queue.popleft()
+            del self._queues[session]
+            if queue:
+                self._queues[session] = queue  # rotate: this session goes to the back
+            self.granted += 1
+            return 0.0
+
+    def _abandon(self, ticket: _Ticket):
+        with self._lock:
+            queue = self._queues.get(ticket.session)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[ticket.session]
+
+    async def acquire(self, tokens: int) -> int:
+        """Wait for this session's turn and the budget; returns the tokens reserved."""
+        if not (self.requests.enabled or self.tokens.enabled):
+            return 0
+        ticket = self._enqueue(tokens)
+        t0 = time.perf_counter()
+        try:
+            while True:
+                wait = self._try(ticket)
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        self._record_wait(t0)
+        return ticket.tokens
+
+    def acquire_sync(self, tokens: int) -> int:
+        """acquire() for worker threads (blocking sleep)."""
+        if not (self.requests.enabled or self.tokens.enabled):
+            return 0
+        ticket = self._enqueue(tokens)
+        t0 = time.perf_counter()
+        try:
+            while True:
+                wait = self._try(ticket)
+                if not wait:
+                    break
+                time.sleep(wait)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        self._record_wait(t0)
+        return ticket.tokens
+
+    def _record_wait(self, t0: float):
+        waited = (time.perf_counter() - t0) * 1000.0
+        metrics.observe("groq.limiter.wait_ms", waited)
+        if waited > 1:
+            self.throttled += 1
+
+    # ---------- Feedback ----------
+    def settle(self, reserved: int, used: int):
+        """Return the unused part of a reservation (or charge the overrun); used=0 refunds it all."""
+        if not reserved or not self.tokens.enabled:
+            return
+        with self._lock:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + reserved - int(used))
+
+    def observe(self, status: int, headers: Mapping[str, str]):
+        """Fold Groq's rate-limit headers into the buckets."""
+        now = time.monotonic()
+        get = lambda k: headers.get(k) if headers is not None else None
+        with self._lock:
+            limit = get("x-ratelimit-limit-tokens")
+            if limit and self.tokens.enabled:
+                try:
+                    self.tokens.capacity = float(limit)
+                except ValueError:
+                    pass
+            remaining = get("x-ratelimit-remaining-tokens")
+            if remaining and self.tokens.enabled:
+                try:
+                    self.tokens.level = min(self.tokens.level, float(remaining))
+                except ValueError:
+                    pass
+            pause = None
+            if status == 429:
+                metrics.incr("groq.rate_limited")
+                pause = parse_duration(get("retry-after")) or parse_duration(get("x-ratelimit-reset-tokens")) or 1.0
+                self.tokens.level = min(self.tokens.level, 0.0)
+            elif (get("x-ratelimit-remaining-requests") or "").strip() == "0":
+                pause = parse_duration(get("x-ratelimit-reset-requests"))  # daily request quota exhausted
+            if pause:
+                self._blocked_until = max(self._blocked_until, now + pause)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            return {
+                "rpm": self.requests.capacity,
+                "tpm": self.tokens.capacity,
+                "requests_available": round(self.requests.level, 2),
+                "tokens_available": round(self.tokens.level, 1),
+                "waiting": sum(len(q) for q in self._queues.values()),
+                "waiting_sessions": len(self._queues),
+                "blocked_seconds": round(max(0.0, self._blocked_until - now), 2),
+                "granted": self.granted,
+                "throttled": self.throttled,
+            }
+
+
+groq_limiter = RateLimiter()
+metrics.register("groq_limiter", groq_limiter.stats)
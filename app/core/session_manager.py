@@ -0,0 +1,315 @@
+# app/core/session_manager.py
+"""
+Per-session Orchestrator state.
+
+Each visitor gets their own Orchestrator (topic, doc_ids, rag_index, history,
+compare), keyed by the `sid` cookie or an `X-Session-Id` header.
+
+- Idle sessions are dropped after SESSION_TTL_SECONDS.
+- At most SESSION_MAX sessions are kept (least recently used dropped first).
+- When the estimated footprint of all sessions exceeds SESSION_MEMORY_MB,
+  RagIndex objects of the least recently used sessions are spilled to disk and
+  transparently reloaded on that session's next request. Sessions with a
+  request in flight (see acquire()/use()/use_async()) or a background ingest
+  job (pin()) are never spilled or dropped, and
+  both the spill and the reload touch disk outside the manager lock.
+- Documents a session uploaded belong to it in the knowledge base (owner =
+  sid) and are deleted from it when the session is dropped.
+"""
+from __future__ import annotations
+from typing import Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import functools
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+from app.core import metrics
+from app.core.async_io import run_in_thread
+from app.core.knowledge_base import get_kb
+from app.core.orchestrator import Orchestrator
+from app.core.rag_service import RagIndex
+from app.core.utils import CACHE_DIR
+
+SESSION_COOKIE = "sid"
+SESSION_HEADER = "X-Session-Id"
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+SESSION_MEMORY_MB = float(os.getenv("SESSION_MEMORY_MB", "512"))
+SESSION_SPILL_DIR = os.getenv("SESSION_SPILL_DIR", os.path.join(CACHE_DIR, "sessions"))
+
+_SID_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def valid_session_id(sid: Optional[str]) -> bool:
+    return bool(sid and _SID_RE.match(sid))
+
+
+def footprint(orch: Orchestrator) -> int:
+    """Rough bytes held by one session (index + chunk text + history)."""
+    size = sum(len(h.get("text") or "") for h in orch.history)
+    if orch.rag_index is not None:
+        size += orch.rag_index.nbytes()
+    return size
+
+
+class _Session:
+    __slots__ = ("orch", "last_seen", "spill_path", "active", "io", "nbytes")
+
+    def __init__(self, orch: Orchestrator):
+        self.orch = orch
+        self.last_seen = time.time()
+        self.spill_path: Optional[str] = None
+        self.active = 0  # requests in flight; never spilled or dropped while > 0
+        self.io: Optional[threading.Event] = None  # set once a spill / reload on disk finished
+        self.nbytes = 0  # footprint() as of the last checkout / release
+
+
+class SessionManager:
+    def __init__(
+        self,
+        ttl_seconds: int = SESSION_TTL_SECONDS,
+        max_sessions: int = SESSION_MAX,
+        memory_mb: float = SESSION_MEMORY_MB,
+        spill_dir: str = SESSION_SPILL_DIR,
+    ):
+        self.ttl = ttl_seconds
+        self.max_sessions = max_sessions
+        self.budget = int(memory_mb * 1024 * 1024)
+        self.spill_dir = spill_dir
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0  # sum of _Session.nbytes
+        self._ended: List[Tuple[str, Optional[str]]] = []  # dropped (sid, spill_path) still to clean up
+        self.spills = 0
+        self.restores = 0
+        self.expired = 0
+
+    # ---------- Lookup ----------
+    def acquire(self, sid: str) -> Orchestrator:
+        """The session's Orchestrator, held in memory (not spilled or dropped) until release(sid)."""
+        sess, path, victims = self._checkout(sid)
+        try:
+            self._cleanup()
+            if path is not None:
+                self._restore(sess, path)
+            self._spill_all(victims)
+            ev = sess.io
+            if ev is not None:
+                ev.wait()
+        except BaseException:
+            self.release(sid)
+            raise
+        return sess.orch
+
+    def release(self, sid: str):
+        self._spill_all(self._unhold(sid, spill=True))
+
+    def pin(self, sid: str) -> Callable[[], None]:
+        """Keep a session from being dropped or spilled (without reloading it) until the returned callable runs.
+
+        For background work that outlives the request (ingest jobs); cheap, no disk I/O.
+        """
+        with self._lock:
+            sess = self._sessions.get(sid)
+            if sess is None:
+                return lambda: None
+            sess.active += 1
+        return functools.partial(self._unhold, sid, spill=False)
+
+    def _unhold(self, sid: str, spill: bool) -> List[Tuple[str, _Session, RagIndex]]:
+        with self._lock:
+            sess = self._sessions.get(sid)
+            if sess is None or not sess.active:
+                return []
+            sess.active -= 1
+            sess.last_seen = time.time()
+            self._resize(sess)  # the request / job may have built or grown the index
+            return self._pick_spills(keep=None) if spill else []
+
+    @contextmanager
+    def use(self, sid: str):
+        orch = self.acquire(sid)
+        try:
+            yield orch
+        finally:
+            self.release(sid)
+
+    @asynccontextmanager
+    async def use_async(self, sid: str):
+        """use() for async code that outlives the route handler (streaming bodies); cancellation-safe."""
+        acquiring = asyncio.ensure_future(run_in_thread(self.acquire, sid))
+        try:
+            orch = await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # the acquire still completes in its thread; hand the hold back when it does
+            acquiring.add_done_callback(
+                lambda t: None if t.cancelled() or t.exception() else self.release(sid))
+            raise
+        try:
+            yield orch
+        finally:
+            await asyncio.shield(run_in_thread(self.release, sid))
+
+    def _checkout(self, sid: str) -> Tuple[_Session, Optional[str], List[Tuple[str, _Session, RagIndex]]]:
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            sess = self._sessions.get(sid)
+            if sess is None:
+                sess = _Session(Orchestrator(owner=sid, keep_alive=functools.partial(self.pin, sid)))
+                self._sessions[sid] = sess
+                metrics.incr("sessions.created")
+                self._evict_lru(keep=sid)
+            self._sessions.move_to_end(sid)
+            sess.last_seen = now
+            sess.active += 1
+            path = None
+            if sess.spill_path and sess.io is None:
+                sess.io = threading.Event()  # this caller reloads; others wait on it
+                path, sess.spill_path = sess.spill_path, None
+            self._resize(sess)
+            victims = self._pick_spills(keep=sid)
+        return sess, path, victims
+
+    def drop(self, sid: str) -> bool:
+        """Drop an idle session; sessions with a request in flight are left alone."""
+        with self._lock:
+            sess = self._sessions.get(sid)
+            dropped = sess is not None and self._idle(sess)
+            if dropped:
+                self._drop(sid)
+        self._cleanup()
+        return dropped
+
+    # ---------- Eviction / spill ----------
+    @staticmethod
+    def _idle(sess: _Session) -> bool:
+        return not sess.active and sess.io is None
+
+    def _resize(self, sess: _Session):
+        size = footprint(sess.orch)
+        self._bytes += size - sess.nbytes
+        sess.nbytes = size
+
+    def _drop(self, sid: str):
+        sess = self._sessions.pop(sid)
+        self._bytes -= sess.nbytes
+        self._ended.append((sid, sess.spill_path))
+
+    def _cleanup(self):
+        """Delete spill files and knowledge-base uploads of dropped sessions (outside the manager lock)."""
+        with self._lock:
+            ended, self._ended = self._ended, []
+        if not ended:
+            return
+        kb = get_kb()
+        for sid, spill_path in ended:
+            if spill_path:
+                shutil.rmtree(spill_path, ignore_errors=True)
+            try:
+                kb.delete_owner(sid)
+            except Exception:
+                metrics.incr("sessions.release_error")
+
+    def _sweep(self, now: float):
+        for sid in [s for s, sess in self._sessions.items() if now - sess.last_seen > self.ttl and self._idle(sess)]:
+            self._drop(sid)
+            self.expired += 1
+            metrics.incr("sessions.expired")
+
+    def _evict_lru(self, keep: str):
+        excess = len(self._sessions) - self.max_sessions
+        if excess <= 0:
+            return
+        for sid in [s for s, sess in self._sessions.items() if s != keep and self._idle(sess)][:excess]:
+            self._drop(sid)
+
+    def _pick_spills(self, keep: Optional[str]) -> List[Tuple[str, _Session, RagIndex]]:
+        """Mark least recently used idle sessions for spilling until the budget would hold (caller holds lock)."""
+        excess = self._bytes - self.budget
+        victims = []
+        for sid, sess in self._sessions.items():  # oldest first
+            if excess <= 0:
+                break
+            if sid == keep or not self._idle(sess) or sess.orch.rag_index is None:
+                continue
+            sess.io = threading.Event()
+            victims.append((sid, sess, sess.orch.rag_index))
+            excess -= sess.nbytes
+        return victims
+
+    def _spill_all(self, victims: List[Tuple[str, _Session, RagIndex]]):
+        for sid, sess, index in victims:
+            self._spill(sid, sess, index)
+
+    def _spill(self, sid: str, sess: _Session, index: RagIndex):
+        """Save a marked session's index (disk I/O outside the manager lock), then drop it from memory."""
+        path = os.path.join(self.spill_dir, sid)
+        try:
+            index.save(path)
+            saved = True
+        except Exception:
+            saved = False
+            metrics.incr("sessions.spill_error")
+        with self._lock:
+            # a request may have checked the session out (or swapped its index) meanwhile
+            keep = not saved or sess.active or sess.orch.rag_index is not index
+            if not keep:
+                sess.orch.rag_index = None
+                sess.spill_path = path
+                self._resize(sess)
+                self.spills += 1
+                metrics.incr("sessions.spill")
+            ev, sess.io = sess.io, None
+        if keep:
+            shutil.rmtree(path, ignore_errors=True)
+        if ev is not None:
+            ev.set()
+
+    def _restore(self, sess: _Session, path: str):
+        """Reload a spilled index (disk I/O outside the manager lock)."""
+        try:
+            # rag may have been turned off while spilled; only reload if still wanted
+            index = RagIndex.load(path) if sess.orch.rag_enabled else None
+        except Exception:
+            index = None
+            metrics.incr("sessions.restore_error")
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+        with self._lock:
+            if index is not None and sess.orch.rag_enabled and sess.orch.rag_index is None:
+                sess.orch.rag_index = index
+                self.restores += 1
+                metrics.incr("sessions.restore")
+            self._resize(sess)
+            ev, sess.io = sess.io, None
+        if ev is not None:
+            ev.set()
+
+    # ---------- Introspection ----------
+    def stats(self) -> Dict:
+        with self._lock:
+            live = list(self._sessions.values())
+            return {
+                "sessions": len(live),
+                "spilled": sum(1 for s in live if s.spill_path),
+                "bytes_in_memory": self._bytes,
+                "budget_bytes": self.budget,
+                "spills": self.spills,
+                "restores": self.restores,
+                "expired": self.expired,
+            }
+
+
+sessions = SessionManager()
+metrics.register("sessions", sessions.stats)
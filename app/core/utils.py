@@ -1,3 +1,8 @@
+import os
+
+# Root for on-disk caches / spill files (embeddings, sessions, ...)
+CACHE_DIR = os.getenv("RAG_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "rag_chatbot"))
+
 def ok(data):
     return {"status":"ok","data":data}
 
@@ -0,0 +1,351 @@
+# app/core/vector_index.py
+"""
+Vector index backends behind RagIndex. All vectors are L2-normalized float32,
+so inner product == cosine similarity.
+
+- ExactIndex  brute-force matrix product (default; exact, fine up to ~10^4)
+- IVFIndex    pure NumPy inverted-file index: spherical k-means coarse
+              quantizer, search scans the `nprobe` closest lists
+- HNSWIndex   graph index via the optional hnswlib package (`ef` at query time)
+
+Indexes grow in place: add() appends rows to a preallocated buffer (capacity
+doubles, so appends are amortized O(rows added)) and remove() tombstones row
+ids, which search then skips. Row ids never change; callers compact by
+rebuilding when too many rows are dead.
+
+make_index() picks one from RAG_INDEX_BACKEND:
+- "exact" | "ivf" | "hnsw"
+- "auto" (default): exact below RAG_ANN_MIN_VECTORS, else hnsw if installed, else ivf
+
+Recall/latency knobs: RAG_IVF_NLIST (0 = ~4*sqrt(n)), RAG_IVF_NPROBE,
+RAG_HNSW_M, RAG_HNSW_EF_CONSTRUCTION, RAG_HNSW_EF.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+import os
+
+import numpy as np
+
+try:
+    import hnswlib  # optional: pip install hnswlib
+except Exception:
+    hnswlib = None
+
+RAG_INDEX_BACKEND = os.getenv("RAG_INDEX_BACKEND", "auto").strip().lower()
+RAG_ANN_MIN_VECTORS = int(os.getenv("RAG_ANN_MIN_VECTORS", "20000"))
+RAG_IVF_NLIST = int(os.getenv("RAG_IVF_NLIST", "0"))
+RAG_IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "8"))
+RAG_HNSW_M = int(os.getenv("RAG_HNSW_M", "16"))
+RAG_HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "200"))
+RAG_HNSW_EF = int(os.getenv("RAG_HNSW_EF", "64"))
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, best first (O(n) select + O(k log k) sort)."""
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(0, dtype="int64")
+    part = np.argpartition(scores, n - k)[n - k:] if k < n else np.arange(n)
+    return part[np.argsort(scores[part])[::-1]]
+
+
+def _top_k_rows(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Row-wise _top_k for a [m, n] score matrix -> ([m, k] ids, [m, k] scores)."""
+    n = scores.shape[1]
+    k = min(k, n)
+    if k < n:
+        part = np.argpartition(scores, n - k, axis=1)[:, n - k:]
+    else:
+        part = np.broadcast_to(np.arange(n), scores.shape).copy()
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+_EMPTY = (np.zeros(0, dtype="int64"), np.zeros(0, dtype="float32"))
+
+
+class VectorIndex:
+    """
+    Backend interface: build() replaces the contents, add() appends rows,
+    remove() tombstones rows, search() returns (live row ids, scores).
+    """
+    name = "base"
+
+    def __init__(self):
+        self.vecs: Optional[np.ndarray] = None  # [n, d] rows (a prefix view of _buf once grown)
+        self._buf: Optional[np.ndarray] = None  # preallocated storage; None while vecs is external (e.g. a memmap)
+        self._dead: set = set()
+        self.dead_ids = np.zeros(0, dtype="int64")
+
+    def __len__(self) -> int:
+        return 0 if self.vecs is None else int(self.vecs.shape[0])
+
+    @property
+    def live(self) -> int:
+        return len(self) - len(self._dead)
+
+    @property
+    def owns_vectors(self) -> bool:
+        """False while vecs is the caller's array (e.g. a knowledge-base memmap view)."""
+        return self._buf is not None
+
+    def build(self, vecs: np.ndarray):
+        raise NotImplementedError
+
+    def _reset(self, vecs: np.ndarray):
+        self.vecs = np.ascontiguousarray(vecs, dtype="float32")
+        self._buf = None
+        self._dead = set()
+        self.dead_ids = np.zeros(0, dtype="int64")
+
+    def _append(self, new: np.ndarray) -> np.ndarray:
+        """Copy new rows into the buffer (growing it by doubling); returns their row ids."""
+        new = np.ascontiguousarray(new, dtype="float32")
+        n, m = len(self), int(new.shape[0])
+        if self._buf is None or self._buf.shape[0] < n + m:
+            buf = np.empty((max(n + m, 2 * n, 64), new.shape[1]), dtype="float32")
+            if n:
+                buf[:n] = self.vecs
+            self._buf = buf
+        self._buf[n:n + m] = new
+        self.vecs = self._buf[:n + m]
+        return np.arange(n, n + m, dtype="int64")
+
+    def add(self, vecs: np.ndarray) -> np.ndarray:
+        """Append rows; returns their row ids (len(self) before the call onwards)."""
+        if not len(self):
+            self.build(vecs)
+            return np.arange(len(self), dtype="int64")
+        return self._append(vecs)
+
+    def remove(self, ids) -> int:
+        """Tombstone row ids; returns how many were newly removed."""
+        before = len(self._dead)
+        self._dead.update(int(i) for i in np.asarray(ids).ravel() if 0 <= int(i) < len(self))
+        if len(self._dead) != before:
+            self.dead_ids = np.fromiter(sorted(self._dead), dtype="int64", count=len(self._dead))
+        return len(self._dead) - before
+
+    def _drop_dead(self, idx: np.ndarray, sims: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Filter tombstoned ids out of a best-first candidate list and keep k."""
+        if self._dead:
+            keep = ~np.isin(idx, self.dead_ids)
+            idx, sims = idx[keep], sims[keep]
+        return idx[:k], sims[:k]
+
+    def search(self, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def search_many(self, Q: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """search() for each row of Q; backends override with a batched path."""
+        return [self.search(q, k) for q in Q]
+
+    def nbytes(self) -> int:
+        if self._buf is not None:
+            return int(self._buf.nbytes)
+        return 0 if self.vecs is None else int(self.vecs.nbytes)
+
+    def describe(self) -> Dict:
+        return {"backend": self.name, "size": len(self), "dead": len(self._dead)}
+
+
+class ExactIndex(VectorIndex):
+    name = "exact"
+
+    def build(self, vecs: np.ndarray):
+        self._reset(vecs)
+
+    def search(self, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.live:
+            return _EMPTY
+        sims = self.vecs @ q  # cosine similarity (vecs normalized)
+        if self._dead:
+            sims[self.dead_ids] = -np.inf
+        idx = _top_k(sims, min(k, self.live))
+        return idx, sims[idx]
+
+    def search_many(self, Q: np.ndarray, k: int, batch: int = 64) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """One matrix product per batch of queries (batch bounds the [batch, n] score matrix)."""
+        if not self.live:
+            return [_EMPTY for _ in range(len(Q))]
+        out = []
+        for s in range(0, len(Q), batch):
+            scores = Q[s:s + batch] @ self.vecs.T
+            if self._dead:
+                scores[:, self.dead_ids] = -np.inf
+            ids, scores = _top_k_rows(scores, min(k, self.live))
+            out.extend(zip(ids, scores))
+        return out
+
+
+class IVFIndex(VectorIndex):
+    name = "ivf"
+
+    def __init__(self, nlist: int = RAG_IVF_NLIST, nprobe: int = RAG_IVF_NPROBE, iters: int = 10, seed: int = 0):
+        super().__init__()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iters = iters
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.order: Optional[np.ndarray] = None    # row ids grouped by list
+        self.offsets: Optional[np.ndarray] = None  # list c = order[offsets[c]:offsets[c+1]]
+        self.assign: Optional[np.ndarray] = None   # list of each row in order/offsets
+        self._pending: List[np.ndarray] = []       # (row ids, lists) appended since the last merge
+        self._n_pending = 0
+
+    @staticmethod
+    def _assign(x: np.ndarray, centroids: np.ndarray, batch: int = 8192) -> np.ndarray:
+        out = np.empty(x.shape[0], dtype="int32")
+        for s in range(0, x.shape[0], batch):
+            out[s:s + batch] = np.argmax(x[s:s + batch] @ centroids.T, axis=1)
+        return out
+
+    def _train(self, vecs: np.ndarray, nlist: int) -> np.ndarray:
+        rng = np.random.default_rng(self.seed)
+        n = vecs.shape[0]
+        sample = vecs[rng.choice(n, size=min(n, 256 * nlist), replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+        for _ in range(self.iters):
+            assign = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0
+            if empty.any():  # re-seed empty lists from random points
+                sums[empty] = sample[rng.choice(sample.shape[0], size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = (sums / np.maximum(norms, 1e-12)).astype("float32")
+        return centroids
+
+    def build(self, vecs: np.ndarray):
+        self._reset(vecs)
+        self._pending, self._n_pending = [], 0
+        n = len(self)
+        if not n:
+            self.centroids = self.order = self.offsets = self.assign = None
+            return
+        nlist = self.nlist or int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+        self.centroids = self._train(self.vecs, nlist)
+        self.assign = self._assign(self.vecs, self.centroids)
+        self._lists()
+
+    def _lists(self):
+        nlist = self.centroids.shape[0]
+        self.order = np.argsort(self.assign, kind="stable").astype("int64")
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(self.assign, minlength=nlist))]).astype("int64")
+
+    def add(self, vecs: np.ndarray) -> np.ndarray:
+        """
+        New rows go to their nearest existing list but stay in a pending set
+        (searched for every query) until they reach 1/8 of the index, then
+        the inverted lists are regrouped. Centroids are not retrained.
+        """
+        if self.centroids is None:
+            return super().add(vecs)
+        ids = self._append(vecs)
+        self._pending.append(self._assign(self.vecs[ids[0]:], self.centroids))
+        self._n_pending += len(ids)
+        if self._n_pending * 8 > len(self):
+            self.assign = np.concatenate([self.assign, *self._pending])
+            self._pending, self._n_pending = [], 0
+            self._lists()
+        return ids
+
+    def search(self, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.live:
+            return _EMPTY
+        nlist = self.centroids.shape[0]
+        nprobe = max(1, min(self.nprobe, nlist))
+        probe = np.argpartition(self.centroids @ q, nlist - nprobe)[nlist - nprobe:]
+        parts = [self.order[self.offsets[c]:self.offsets[c + 1]] for c in probe]
+        if self._n_pending:
+            parts.append(np.arange(len(self.assign), len(self), dtype="int64"))
+        cand = np.concatenate(parts)
+        sims = self.vecs[cand] @ q
+        top = _top_k(sims, k + len(self._dead))
+        return self._drop_dead(cand[top], sims[top], k)
+
+    def nbytes(self) -> int:
+        extra = sum(int(a.nbytes) for a in (self.centroids, self.order, self.offsets, self.assign) if a is not None)
+        return super().nbytes() + extra
+
+    def describe(self) -> Dict:
+        nlist = 0 if self.centroids is None else int(self.centroids.shape[0])
+        return {**super().describe(), "nlist": nlist, "nprobe": self.nprobe}
+
+
+class HNSWIndex(VectorIndex):
+    name = "hnsw"
+
+    def __init__(self, M: int = RAG_HNSW_M, ef_construction: int = RAG_HNSW_EF_CONSTRUCTION, ef: int = RAG_HNSW_EF):
+        if hnswlib is None:
+            raise RuntimeError("hnswlib is not installed. Run: pip install hnswlib")
+        super().__init__()
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self._graph = None
+
+    def build(self, vecs: np.ndarray):
+        self._reset(vecs)
+        self._graph = None
+        if not len(self):
+            return
+        graph = hnswlib.Index(space="ip", dim=int(self.vecs.shape[1]))
+        graph.init_index(max_elements=len(self), ef_construction=self.ef_construction, M=self.M)
+        graph.add_items(self.vecs, np.arange(len(self)))
+        self._graph = graph
+
+    def add(self, vecs: np.ndarray) -> np.ndarray:
+        if self._graph is None:
+            return super().add(vecs)
+        ids = self._append(vecs)
+        if self._graph.get_max_elements() < len(self):
+            self._graph.resize_index(self._buf.shape[0])  # same doubling as the vector buffer
+        self._graph.add_items(self.vecs[ids[0]:], ids)
+        return ids
+
+    def remove(self, ids) -> int:
+        before = set(self._dead)
+        removed = super().remove(ids)
+        if self._graph is not None:
+            for i in self._dead - before:
+                self._graph.mark_deleted(i)  # skipped by knn_query
+        return removed
+
+    def search(self, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self._graph is None or not self.live:
+            return _EMPTY
+        k = min(k, self.live)
+        self._graph.set_ef(max(self.ef, k))
+        labels, dists = self._graph.knn_query(q.reshape(1, -1), k=k)
+        return labels[0].astype("int64"), (1.0 - dists[0]).astype("float32")  # ip distance = 1 - dot
+
+    def search_many(self, Q: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        if self._graph is None or not self.live:
+            return [_EMPTY for _ in range(len(Q))]
+        k = min(k, self.live)
+        self._graph.set_ef(max(self.ef, k))
+        labels, dists = self._graph.knn_query(np.ascontiguousarray(Q, dtype="float32"), k=k)
+        return list(zip(labels.astype("int64"), (1.0 - dists).astype("float32")))
+
+    def describe(self) -> Dict:
+        return {**super().describe(), "M": self.M, "ef": self.ef}
+
+
+def make_index(n_vectors: int = 0, backend: Optional[str] = None, **params) -> VectorIndex:
+    backend = (backend or RAG_INDEX_BACKEND).lower()
+    if backend == "auto":
+        if n_vectors < RAG_ANN_MIN_VECTORS:
+            backend = "exact"
+        else:
+            backend = "hnsw" if hnswlib is not None else "ivf"
+    if backend == "hnsw":
+        return HNSWIndex(**params)
+    if backend == "ivf":
+        return IVFIndex(**params)
+    return ExactIndex()
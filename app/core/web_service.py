@@ -1,30 +1,16 @@
 # app/core/web_service.py
 import os, asyncio, requests
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
+from urllib.parse import urlsplit
 try:
     import trafilatura
 except Exception:
     trafilatura = None
 from bs4 import BeautifulSoup
 from app.core.utils import sanitize_text
-
-# ------------------------
-# Helpers for token budget
-# ------------------------
-def _approx_tokens(s: str) -> int:
-    # crude: ~4 chars per token
-    return max(1, len(s) // 4)
-
-def _compress_text(text: str, hard_limit_chars: int = 1800) -> str:
-    # keep it tight; end at a sentence if possible
-    t = " ".join((text or "").split())
-    if len(t) <= hard_limit_chars:
-        return t
-    cut = t[:hard_limit_chars]
-    last = cut.rfind(". ")
-    if last > 400:
-        cut = cut[:last+1]
-    return cut
+from app.core.async_io import get_http_client, run_in_thread
+from app.core.page_cache import get_page_cache
+from app.core.passages import select_passages, WEB_SOURCE_TOKENS
 
 # ------------------------
 # Internal utils
@@ -38,7 +24,17 @@ async def _google_search(query: str, num: int = 5) -> List[Dict]:
     """
     Try your google_service first. Fall back to direct CSE HTTP if needed.
     Returns: [{"title": "...", "link": "https://..."}, ...]
+    Results are cached by normalized query (shared with google_service).
     """
+    from app.core.google_service import cached_search, store_search
+    hit = cached_search(query, num)
+    if hit is not None:
+        return hit
+    res = await _google_search_uncached(query, num)
+    store_search(query, num, res)
+    return res
+
+async def _google_search_uncached(query: str, num: int) -> List[Dict]:
     # Prefer your google_service wrapper
     try:
         from app.core.google_service import google_cse_search
@@ -48,15 +44,18 @@ async def _google_search(query: str, num: int = 5) -> List[Dict]:
     except Exception:
         pass
 
-    # Secondary wrapper name
+    # Secondary wrapper name (async variant; returns (title, link) tuples)
     try:
-        from app.core.google_service import google_search
-        res = await _maybe_await(google_search(query, num=num))
+        from app.core.google_service import google_search_async
+        res = await google_search_async(query, num=num, use_cache=False)
         if res:
             out = []
             for it in res:
-                link = it.get("link") or it.get("url")
-                title = it.get("title") or it.get("name") or ""
+                if isinstance(it, dict):
+                    link = it.get("link") or it.get("url")
+                    title = it.get("title") or it.get("name") or ""
+                else:
+                    title, link = it[0], it[1]
                 if link:
                     out.append({"title": title, "link": link})
             if out:
@@ -70,7 +69,7 @@ async def _google_search(query: str, num: int = 5) -> List[Dict]:
     if not api_key or not cx_id:
         return []
     try:
-        r = requests.get(
+        r = await get_http_client().get(
             "https://www.googleapis.com/customsearch/v1",
             params={"key": api_key, "cx": cx_id, "q": query, "num": min(num, 10)},
             timeout=12,
@@ -83,6 +82,17 @@ async def _google_search(query: str, num: int = 5) -> List[Dict]:
 
 def extract_main_text(url: str) -> str:
     """Extract readable text from a URL (Trafilatura first, then BeautifulSoup)."""
+    page_cache = get_page_cache()
+    if page_cache:
+        cached = page_cache.get_fresh(url)
+        if cached is not None:
+            return cached
+    txt = _extract_main_text_uncached(url)
+    if page_cache and txt:
+        page_cache.put(url, txt)
+    return txt
+
+def _extract_main_text_uncached(url: str) -> str:
     if trafilatura:
         try:
             downloaded = trafilatura.fetch_url(url, timeout=10)
@@ -96,30 +106,135 @@ def extract_main_text(url: str) -> str:
     try:
         resp = requests.get(url, timeout=12, headers={"User-Agent": "Mozilla/5.0"})
         resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, "html.parser")
-        for tag in soup(["script", "style", "noscript"]):
-            tag.extract()
-        txt = " ".join(soup.get_text(separator=" ").split())
-        return sanitize_text(txt[:120000])
+        return _soup_text(resp.text)
     except Exception:
         return ""
 
+def _soup_text(html: str) -> str:
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "noscript"]):
+        tag.extract()
+    txt = " ".join(soup.get_text(separator=" ").split())
+    return sanitize_text(txt[:120000])
+
+def _extract_from_html(html: str) -> str:
+    """Same extraction as extract_main_text, on already-downloaded HTML."""
+    if not html:
+        return ""
+    if trafilatura:
+        try:
+            txt = trafilatura.extract(html) or ""
+            if txt and len(txt) > 200:
+                return sanitize_text(txt)
+        except Exception:
+            pass
+    try:
+        return _soup_text(html)
+    except Exception:
+        return ""
+
+async def extract_main_text_async(url: str) -> str:
+    """
+    Non-blocking extract_main_text: one download over the pooled httpx client,
+    parsing (trafilatura / BeautifulSoup) in the worker thread pool.
+    Fresh cached pages skip the network; stale ones are revalidated with a
+    conditional GET and reused as-is on 304. Cache file I/O and zlib run in
+    the thread pool too.
+    """
+    page_cache = await run_in_thread(get_page_cache)
+    meta = None
+    if page_cache:
+        meta, cached = await run_in_thread(page_cache.probe, url)
+        if cached is not None:
+            return cached
+    try:
+        headers = page_cache.conditional_headers(meta) if page_cache else {}
+        resp = await get_http_client().get(url, timeout=12, headers=headers)
+        if resp.status_code == 304 and meta:
+            cached = await run_in_thread(page_cache.revalidated_text, url)
+            if cached is not None:
+                return cached
+            resp = await get_http_client().get(url, timeout=12)
+        resp.raise_for_status()
+        html = resp.text
+    except Exception:
+        return ""
+    txt = await run_in_thread(_extract_from_html, html)
+    if page_cache and txt:
+        await run_in_thread(page_cache.put, url, txt, resp.headers.get("etag"), resp.headers.get("last-modified"))
+    return txt
+
+# ------------------------
+# Concurrent page fetching
+# ------------------------
+WEB_FETCH_DEADLINE = float(os.getenv("WEB_FETCH_DEADLINE", "8"))
+WEB_PER_HOST_LIMIT = int(os.getenv("WEB_PER_HOST_LIMIT", "2"))
+WEB_SPARE_CANDIDATES = int(os.getenv("WEB_SPARE_CANDIDATES", "2"))
+
+_host_semaphores: Dict[Tuple[int, str], asyncio.Semaphore] = {}
+
+def _host_semaphore(url: str) -> asyncio.Semaphore:
+    key = (id(asyncio.get_running_loop()), (urlsplit(url).hostname or "").lower())
+    sem = _host_semaphores.get(key)
+    if sem is None:
+        if len(_host_semaphores) > 4096:  # bound the map; worst case a host briefly gets 2x the limit
+            _host_semaphores.clear()
+        sem = _host_semaphores[key] = asyncio.Semaphore(WEB_PER_HOST_LIMIT)
+    return sem
+
+async def _fetch_pages(
+    urls: List[str],
+    want: int = 3,
+    min_chars: int = 400,
+    deadline: float = WEB_FETCH_DEADLINE,
+) -> List[Tuple[str, str]]:
+    """
+    Fetch + extract all candidate URLs concurrently (per-host limit), stop as
+    soon as `want` pages with > min_chars arrived or the global deadline hits,
+    and cancel whatever is still in flight. Result keeps search-rank order.
+    """
+    if not urls:
+        return []
+
+    async def one(rank: int, url: str):
+        async with _host_semaphore(url):
+            return rank, url, await extract_main_text_async(url)
+
+    tasks = [asyncio.create_task(one(i, u)) for i, u in enumerate(urls)]
+    got: Dict[int, Tuple[str, str]] = {}
+    try:
+        for fut in asyncio.as_completed(tasks, timeout=deadline):
+            try:
+                rank, url, txt = await fut
+            except asyncio.TimeoutError:
+                break
+            except Exception:
+                continue
+            if txt and len(txt) > min_chars:
+                got[rank] = (url, txt)
+                if len(got) >= want:
+                    break
+    finally:
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+    return [got[r] for r in sorted(got)]
+
 async def _groq_complete(system: str, user: str) -> str:
     """
     Call your Groq wrapper, but surface real errors instead of a vague string.
     """
-    # Try primary
+    # Try primary (async, pooled connection)
     try:
-        from app.core.groq_service import groq_complete
-        res = groq_complete(system, user)
-        return await _maybe_await(res)
+        from app.core.groq_service import groq_complete_async
+        return await groq_complete_async(system, user)
     except Exception as e:
         err1 = f"{type(e).__name__}: {e}"
 
     # Try alias
     try:
         from app.core.groq_service import chat_complete
-        res = chat_complete(system=system, user=user)
+        res = await run_in_thread(chat_complete, system=system, user=user)
         return await _maybe_await(res)
     except Exception as e:
         err2 = f"{type(e).__name__}: {e}"
@@ -130,36 +245,39 @@ async def _groq_complete(system: str, user: str) -> str:
 # ------------------------
 # Public: web_fallback_answer
 # ------------------------
-async def web_fallback_answer(question: str, topics: Dict, k: int = 3) -> Tuple[str, List[str]]:
+async def gather_web_sources(question: str, topics: Optional[Dict], k: int = 3, budget: int = WEB_SOURCE_TOKENS) -> List[Tuple[str, str]]:
     """
-    1) Google search for the topic+question
-    2) Extract & compress a few sources
-    3) Summarize with Groq (token-budgeted)
-    4) If no sources, still answer (estimated)
+    Search for topic + question, fetch the pages and keep the passages most
+    relevant to the question within `budget` tokens: [(url, passages)].
     """
+    topics = topics or {}  # no topic set yet: search the question alone
     primary = (topics.get("primary") or "").strip()
     aliases = topics.get("aliases", []) or []
     alias_str = " ".join([a for a in aliases[:3] if isinstance(a, str)])
     query = " ".join([s for s in [primary, alias_str, question] if s]).strip() or question.strip()
 
-    # 1) Search
-    results = await _google_search(query, num=k)
-    raw_pages, urls = [], []
-    for it in results:
-        url = (it.get("link") or "").strip()
-        if not url:
-            continue
-        txt = extract_main_text(url)
-        if txt and len(txt) > 400:
-            raw_pages.append((url, txt))
-            urls.append(url)
-        if len(raw_pages) >= 3:
-            break
-
-    # 2) If sources found → compress and send to Groq (stay under TPM)
-    if raw_pages:
-        pages = [(u, _compress_text(t, hard_limit_chars=1800)) for (u, t) in raw_pages]
-        source_block = "\n\n".join([f"URL: {u}\nTEXT:\n{t}" for (u, t) in pages])
+    # 1) Search (a couple of spare candidates so slow pages can be dropped)
+    results = await _google_search(query, num=min(10, k + WEB_SPARE_CANDIDATES))
+    candidates = [(it.get("link") or "").strip() for it in results]
+    raw_pages = await _fetch_pages([u for u in candidates if u], want=k)
+    if not raw_pages:
+        return []
+    # 2) Passage selection (sentence passages ranked against the question)
+    return await run_in_thread(select_passages, question, raw_pages, budget=budget, query=f"{primary} {question}".strip())
+
+async def prepare_web_answer(question: str, topics: Optional[Dict], k: int = 3) -> Dict:
+    """
+    Steps 1-2 of web_fallback_answer without the LLM call, so callers can
+    stream the synthesis. Returns {"system", "user", "urls", "suffix"}; the
+    answer is completion(system, user) + suffix.
+    """
+    topics = topics or {}
+    pages = await gather_web_sources(question, topics, k=k)
+    urls = [u for (u, _) in pages]
+
+    # If sources found → send their relevant passages to Groq
+    if pages:
+        source_block = "\n\n".join([f"[{i}] URL: {u}\nTEXT:\n{t}" for i, (u, t) in enumerate(pages, 1)])
 
         system = "You are an expert sales agent who synthesizes accurate, sales-ready answers from multiple web sources with inline [n] citations. Always suggest competitor alternatives with their positive benefits and advantages. Act in the customer's best interest by presenting multiple product options and helping them make informed decisions."
         # Always suggest competitor alternatives for sales agent behavior - AT THE END
@@ -174,17 +292,7 @@ Sources:
 Rules:{competitor_instruction}
 """
 
-        # Ensure total prompt stays under ~4000 tokens
-        final_user = user
-        while _approx_tokens(system + final_user) > 4000:
-            last_pos = final_user.rfind("\n\nURL:")
-            if last_pos > final_user.find("Sources:"):
-                final_user = final_user[:last_pos].rstrip()
-            else:
-                break
-
-        web_ans = await _groq_complete(system, final_user)
-        return (web_ans, urls)
+        return {"system": system, "user": user, "urls": urls, "suffix": ""}
 
     # 3) Always-answer fallback (no sources)
     system = "You are an expert sales agent and consultant. Always suggest competitor alternatives with positive points and advantages for any product inquiry. Act in the customer's best interest by presenting multiple product options to help them make informed decisions. Even without sources, try to answer based on general knowledge and reasoning."
@@ -196,5 +304,20 @@ Product/Topic JSON: {topics}
 
 Note: No reliable sources were found. Please give your best possible answer.
 If you are estimating, clearly mark it as (estimated).{competitor_instruction}"""
-    fallback_ans = await _groq_complete(system, user)
-    return (fallback_ans + "\n(This answer is estimated, since no reliable sources were found)", [])
+    return {
+        "system": system,
+        "user": user,
+        "urls": [],
+        "suffix": "\n(This answer is estimated, since no reliable sources were found)",
+    }
+
+async def web_fallback_answer(question: str, topics: Dict, k: int = 3) -> Tuple[str, List[str]]:
+    """
+    1) Google search for the topic+question
+    2) Extract a few sources, keep their passages most relevant to the question
+    3) Summarize with Groq (token-budgeted)
+    4) If no sources, still answer (estimated)
+    """
+    prep = await prepare_web_answer(question, topics, k=k)
+    web_ans = await _groq_complete(prep["system"], prep["user"])
+    return (web_ans + prep["suffix"], prep["urls"])
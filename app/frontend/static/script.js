@@ -124,6 +124,9 @@ topicForm.addEventListener('submit', async (e) => {
       if (data.data && data.data.primary) {
         window.currentProductRef = data.data.primary;
       }
+      if (data.data && data.data.job_id) {
+        pollIngestJob(data.data.job_id, from);
+      }
     } else {
       topicStatus.textContent = '❌ Failed to initialize topic';
     }
@@ -132,6 +135,35 @@ topicForm.addEventListener('submit', async (e) => {
   }
 });
 
+// PDF indexing runs in the background; answers are web-only until it is ready.
+async function pollIngestJob(jobId, from) {
+  while (true) {
+    let job;
+    try {
+      const res = await fetch(`/api/jobs/${jobId}`);
+      if (!res.ok) return;
+      job = (await res.json()).data;
+    } catch (err) {
+      return;
+    }
+    if (job.stage === 'done') {
+      const primary = (job.result && job.result.primary) || window.currentProductRef || 'Unknown';
+      if (job.result && job.result.applied === false) return;
+      window.currentProductRef = primary;
+      topicStatus.textContent = `✅ Topic: ${primary}${from} — document indexed`;
+      return;
+    }
+    if (job.stage === 'failed' || job.stage === 'cancelled') {
+      topicStatus.textContent = `⚠️ Indexing failed (${job.error || job.stage}); answers use the web only`;
+      return;
+    }
+    const pages = job.pages_total ? ` ${job.pages_done}/${job.pages_total} pages` : '';
+    const eta = job.eta_seconds != null ? `, ~${Math.ceil(job.eta_seconds)}s left` : '';
+    topicStatus.textContent = `⏳ Indexing PDF (${job.stage}${pages}${eta}) — answers use the web until ready`;
+    await new Promise((r) => setTimeout(r, 1000));
+  }
+}
+
 // -------- Comparison Pair Setup --------
 pdfB.addEventListener('change', (e) => {
   attachedPdfBFile = e.target.files[0] || null;
@@ -143,18 +175,23 @@ compareForm.addEventListener('submit', async (e) => {
     return;
   }
   const fd = new FormData();
-  const rawB = (productB.value || '').trim();
+  const addProduct = (label, raw) => {
+    if (raw.startsWith('http')) fd.append(`${label}_url`, raw);
+    else fd.append(`${label}_name`, raw);
+  };
   if (attachedPdfFile) fd.append('a_pdf', attachedPdfFile);
   const rawA = (productInput.value || '').trim();
-  if (rawA) {
-    if (rawA.startsWith('http')) fd.append('a_url', rawA);
-    else fd.append('a_name', rawA);
-  }
-  if (attachedPdfBFile) fd.append('b_pdf', attachedPdfBFile);
-  if (rawB) {
-    if (rawB.startsWith('http')) fd.append('b_url', rawB);
-    else fd.append('b_name', rawB);
+  if (rawA) addProduct('a', rawA);
+  // several competitors separated by ';' → B, C, D, ...
+  const others = (productB.value || '').split(';').map(s => s.trim()).filter(Boolean);
+  const labels = 'bcdefghijkl';
+  let next = 0;
+  if (attachedPdfBFile) {
+    fd.append('b_pdf', attachedPdfBFile);
+    if (others.length) addProduct('b', others.shift());
+    next = 1;
   }
+  others.forEach((raw, i) => addProduct(labels[next + i], raw));
   compareStatus.textContent = '⏳ Pairing topics…';
   try {
     const res = await fetch('/api/compare/init-topic', { method: 'POST', body: fd });
@@ -171,6 +208,84 @@ compareForm.addEventListener('submit', async (e) => {
 });
 
 // -------- Ask --------
+function renderAnswer(payload, answer, sources) {
+  // Standard mode: show Dual-Engine results
+  if (payload && payload.rag && payload.rag.status === 'known') {
+    addMessage('ai', `RAG Answer (From your document):\n${payload.rag.summary}`);
+    addMessage('ai', `Web Answer (CSE):\n${payload.cse.summary}`, payload.cse.sources || []);
+    if (payload.fused?.summary) {
+      addMessage('ai', `Fused Summary:\n${payload.fused.summary}`);
+    }
+    addMessage('ai', payload.final_answer, (payload.final_citations || []).map(c => c.ref));
+  } else {
+    // Web-only fallback
+    addMessage('ai', answer || 'No answer returned.', sources || []);
+  }
+}
+
+// Streams /api/ask/stream (Server-Sent Events): final-answer tokens are shown
+// as they arrive, then the 'done' payload is rendered like /api/ask's.
+// Returns false if nothing was received (caller falls back to /api/ask).
+async function askStream(fd, typingNode) {
+  const res = await fetch('/api/ask/stream', { method: 'POST', body: fd });
+  if (!res.ok || !res.body) return false;
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let live = null;
+  let streamed = '';
+  let received = false;
+
+  const handle = (event, data) => {
+    received = true;
+    if (event === 'token') {
+      if (!live) {
+        hideTyping(typingNode);
+        live = addMessage('ai', '');
+        live.querySelector('.controls').hidden = true;
+      }
+      streamed += data.text || '';
+      live.querySelector('.content').textContent = streamed;
+      messagesEl.scrollTop = messagesEl.scrollHeight;
+    } else if (event === 'done') {
+      hideTyping(typingNode);
+      if (live) live.remove();
+      renderAnswer(data, data.final_answer, (data.final_citations || []).map(c => c.ref));
+    } else if (event === 'error') {
+      hideTyping(typingNode);
+      if (live) live.remove();
+      addMessage('ai', 'Error: ' + (data.detail || 'unknown'));
+    }
+  };
+
+  try {
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let sep;
+      while ((sep = buffer.indexOf('\n\n')) >= 0) {
+        const block = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+        let event = 'message';
+        const dataLines = [];
+        block.split('\n').forEach(line => {
+          if (line.startsWith('event:')) event = line.slice(6).trim();
+          else if (line.startsWith('data:')) dataLines.push(line.slice(5).trimStart());
+        });
+        if (dataLines.length) handle(event, JSON.parse(dataLines.join('\n')));
+      }
+    }
+  } catch (err) {
+    if (!received) throw err;
+    // connection dropped mid-answer: keep what arrived, don't ask again
+    hideTyping(typingNode);
+    addMessage('ai', 'Error: the answer stream was interrupted (' + (err?.message || 'unknown') + ')');
+  }
+  return received;
+}
+
 form.addEventListener('submit', async (e) => {
   e.preventDefault();
   const text = questionInput.value.trim();
@@ -192,6 +307,16 @@ form.addEventListener('submit', async (e) => {
     const compareMode = compareToggle.checked && comparePairReady;
     if (compareMode) url = '/api/compare/ask';
 
+    if (!compareMode) {
+      let streamed = false;
+      try {
+        streamed = await askStream(fd, typingNode);
+      } catch (err) {
+        streamed = false;
+      }
+      if (streamed) return;
+    }
+
     const res = await fetch(url, { method: 'POST', body: fd });
     const data = await res.json();
 
@@ -205,33 +330,24 @@ form.addEventListener('submit', async (e) => {
     if (compareMode) {
       // Render Comparison Mode payload
       const p = data.data;
-      addMessage('ai', `Summary — A (Web):\n${p.A.summary}`, p.A.sources || []);
-      addMessage('ai', `Summary — B (Web):\n${p.B.summary}`, p.B.sources || []);
+      const products = p.products || ['A', 'B'].map(label => ({ label, name: label, ...p[label] }));
+      products.forEach(prod => {
+        addMessage('ai', `Summary — ${prod.label}: ${prod.name} (Web):\n${prod.summary}`, prod.sources || []);
+      });
 
-      // Simple matrix render: first row only (kept compact)
+      // Matrix: one line per dimension, one value per product
       if (Array.isArray(p.matrix) && p.matrix.length) {
-        const row = p.matrix[0];
-        addMessage('ai', `Comparison Matrix → ${row.dimension}\nA: ${row.a_value}\nB: ${row.b_value}`);
+        const lines = p.matrix.map(row => {
+          const values = row.values || { A: row.a_value, B: row.b_value };
+          return `• ${row.dimension}\n` + products.map(prod => `   ${prod.label}: ${values[prod.label] ?? '-'}`).join('\n');
+        });
+        addMessage('ai', `Comparison Matrix\n${lines.join('\n')}`);
       }
       addMessage('ai', `Recommendation:\n${p.recommendation || '-'}`);
       return;
     }
 
-    // Standard mode: show Dual-Engine results
-    const payload = data.data.raw || null;
-    if (payload && payload.rag && payload.rag.status === 'known') {
-      addMessage('ai', `RAG Answer (From your document):\n${payload.rag.summary}`);
-      addMessage('ai', `Web Answer (CSE):\n${payload.cse.summary}`, payload.cse.sources || []);
-      if (payload.fused?.summary) {
-        addMessage('ai', `Fused Summary:\n${payload.fused.summary}`);
-      }
-      addMessage('ai', payload.final_answer, (payload.final_citations || []).map(c => c.ref));
-    } else {
-      // Web-only fallback
-      const ans = data.data.answer || 'No answer returned.';
-      const src = data.data.sources || [];
-      addMessage('ai', ans, src);
-    }
+    renderAnswer(data.data.raw || null, data.data.answer, data.data.sources);
 
   } catch (err) {
     hideTyping(typingNode);
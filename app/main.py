@@ -1,16 +1,71 @@
 # app/main.py
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, RedirectResponse
 from app.api.routes import router as api_router
+from app.core.session_manager import (
+    new_session_id,
+    valid_session_id,
+    SESSION_COOKIE,
+    SESSION_HEADER,
+    SESSION_TTL_SECONDS,
+)
+from app.core.rate_limit import current_session
 import os
+import asyncio
+import logging
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
 app = FastAPI(title="AI Sales Agent")
+logger = logging.getLogger(__name__)
+
+
+# Optional: load the embedding model once before serving (EMBED_WARMUP=1),
+# so the first /api/init-topic doesn't pay the cold start.
+@app.on_event("startup")
+async def warmup_models():
+    if os.getenv("EMBED_WARMUP", "0").lower() in ("1", "true", "yes", "on"):
+        from app.core.embedding_service import warmup
+        stats = await asyncio.to_thread(warmup)
+        logger.info("embedding warmup: %s", stats)
+
+
+# Map the persistent knowledge base (milliseconds: just mmaps), then, in the
+# background, drop expired / over-budget session uploads and ingest any new
+# PDFs under app/data as shared documents (KB_INGEST_ON_STARTUP=0 to skip).
+@app.on_event("startup")
+async def open_knowledge_base():
+    from app.core.knowledge_base import get_kb, ingest_directory, KB_INGEST_ON_STARTUP, KB_INGEST_DIR
+    kb = get_kb()
+    logger.info("knowledge base: %s", kb.stats())
+
+    async def maintain():
+        try:
+            removed = await asyncio.to_thread(kb.enforce_limits)
+            if removed:
+                logger.info("knowledge base: removed %d expired session documents", removed)
+            if KB_INGEST_ON_STARTUP and os.path.isdir(KB_INGEST_DIR):
+                added = await asyncio.to_thread(ingest_directory, KB_INGEST_DIR)
+                if added:
+                    logger.info("knowledge base: ingested %s", [d["title"] for d in added])
+        except Exception as e:
+            logger.warning("knowledge base maintenance failed: %s", e)
+    app.state.kb_ingest = asyncio.create_task(maintain())  # keep a reference
+
+
+@app.on_event("shutdown")
+async def close_pools():
+    from app.core.async_io import aclose, run_in_thread
+    from app.core.cache import flush_all
+    from app.core.page_cache import flush_page_cache
+    # before aclose(), which shuts the thread pool down
+    await run_in_thread(flush_all)
+    await run_in_thread(flush_page_cache)
+    await aclose()
 
 # CORS (keep it simple during dev; tighten later)
 app.add_middleware(
@@ -21,6 +76,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Session id per visitor: X-Session-Id header wins, else the sid cookie, else a new one.
+@app.middleware("http")
+async def session_cookie(request: Request, call_next):
+    if not request.url.path.startswith("/api/"):
+        return await call_next(request)
+    sid = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if not valid_session_id(sid):
+        sid = new_session_id()
+    request.state.session_id = sid
+    token = current_session.set(sid)  # fair queueing key for the Groq rate limiter
+    try:
+        response = await call_next(request)
+    finally:
+        current_session.reset(token)
+    response.headers[SESSION_HEADER] = sid
+    if request.cookies.get(SESSION_COOKIE) != sid:
+        response.set_cookie(SESSION_COOKIE, sid, max_age=SESSION_TTL_SECONDS, httponly=True, samesite="lax")
+    return response
+
 # ✅ API router – assume routes.py uses APIRouter(prefix="/api")
 #    If your routes.py has NO prefix, then change this line to:
 #    app.include_router(api_router, prefix="/api")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Semantic answer cache: paraphrases of a cached question hit within the same
+topic + documents scope, unrelated questions and other scopes miss, and
+re-ingesting a topic's document drops its answers.
+
+    python test/test_answer_cache.py            # synthetic question vectors
+    python test/test_answer_cache.py --model    # also embed real paraphrases with MiniLM
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the repo root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.answer_cache import SemanticAnswerCache, scope_key, embed_question
+
+PARAPHRASES = [
+    ("What is the battery life?", "How long does the battery last?"),
+    ("Is it waterproof?", "Can it get wet, is it water resistant?"),
+    ("How much does it cost?", "What is the price?"),
+]
+UNRELATED = ("What is the battery life?", "Does it ship with a charger in the box?")
+
+
+def unit(v):
+    return (v / np.linalg.norm(v)).astype("float32")
+
+
+def payload(text):
+    return {"final_answer": text, "final_citations": [{"type": "pdf", "ref": "manual p. 3"}]}
+
+
+def test_synthetic(dim=384, entries=256):
+    rng = np.random.default_rng(0)
+    cache = SemanticAnswerCache(threshold=0.9, ttl=60, per_scope=entries)
+    edx = scope_key({"primary": "EDX Pro"}, ["doc1"])
+    other = scope_key({"primary": "EDX Pro"}, ["doc1", "doc2"])
+
+    questions = [unit(rng.normal(size=dim)) for _ in range(entries)]
+    for i, q in enumerate(questions):
+        cache.store(edx, f"q{i}", q, payload(f"answer {i}"))
+
+    paraphrase = unit(questions[7] + 0.2 * unit(rng.normal(size=dim)))  # cosine ~0.98
+    hit = cache.lookup(edx, paraphrase)
+    assert hit is not None and hit["final_answer"] == "answer 7" and hit["cached"]["question"] == "q7", "paraphrase hit"
+    assert cache.lookup(edx, unit(rng.normal(size=dim))) is None, "unrelated miss"
+    assert cache.lookup(other, paraphrase) is None, "scope isolation"
+
+    cache.store(edx, "q7 again", questions[7], payload("newer answer 7"))
+    assert cache.lookup(edx, questions[7])["final_answer"] == "newer answer 7", "newer answer replaces"
+    assert cache.stats()["entries"] == entries
+
+    assert cache.invalidate("edx pro") == 1, "invalidate on re-ingest"
+    assert cache.lookup(edx, paraphrase) is None
+
+    cache = SemanticAnswerCache(threshold=0.9, ttl=0.05)
+    cache.store(edx, "q", questions[0], payload("a"))
+    time.sleep(0.1)
+    assert cache.lookup(edx, questions[0]) is None, "ttl expiry"
+
+
+def lookup_benchmark(dim=384, entries=256, lookups=200):
+    rng = np.random.default_rng(1)
+    cache = SemanticAnswerCache(threshold=0.9, ttl=60, per_scope=entries)
+    scope = scope_key({"primary": "EDX Pro"}, ["doc1"])
+    for i in range(entries):
+        cache.store(scope, f"q{i}", unit(rng.normal(size=dim)), payload(f"answer {i}"))
+    probes = [unit(rng.normal(size=dim)) for _ in range(lookups)]
+    t0 = time.perf_counter()
+    for q in probes:
+        cache.lookup(scope, q)
+    print(f"📊 lookup over {entries} cached questions: {(time.perf_counter() - t0) * 1000.0 / lookups:.3f} ms")
+
+
+def model_paraphrases(threshold=0.9):
+    """Print MiniLM similarities so ANSWER_CACHE_THRESHOLD can be tuned; only checks the ordering.
+
+    Loads the real embedding model, so it runs only from the command line (--model).
+    """
+    print(f"\n🔎 MiniLM question similarities (threshold {threshold})\n" + "=" * 60)
+    sims = []
+    for a, b in PARAPHRASES + [UNRELATED]:
+        s = float(embed_question(a) @ embed_question(b))
+        sims.append(s)
+        print(f"{s:5.3f} {'hit ' if s >= threshold else 'miss'}  {a!r} ~ {b!r}")
+    assert min(sims[:-1]) > sims[-1], "an unrelated question scored higher than a paraphrase"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", action="store_true", help="also embed real paraphrases (loads MiniLM)")
+    args = parser.parse_args()
+    test_synthetic()
+    lookup_benchmark()
+    if args.model:
+        model_paraphrases()
+    print("\n🎉 Answer cache checks passed")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+N-way comparison (no network): per-product web research runs concurrently
+under the COMPARE_CONCURRENCY cap, the matrix costs a bounded number of LLM
+calls whatever the number of products, and two-product payload keys
+(A / B, a_value / b_value) are still there.
+
+    python test/test_compare_nway.py --latency 0.3
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+# Add the repo root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app.core.compare_service as cs
+import app.core.groq_service as gs
+
+
+class FakeWeb:
+    def __init__(self, latency):
+        self.latency = latency
+        self.running = 0
+        self.peak = 0
+
+    async def sources(self, question, topic, k=3, budget=0):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(self.latency)
+        self.running -= 1
+        name = topic["primary"]
+        return [(f"https://{name.lower()}.example/specs", f"The {name} battery lasts {len(name) * 3} hours.")]
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = 0
+
+    async def complete_json(self, system, user, max_tokens=800):
+        self.calls += 1
+        labels = [line.split(":")[0].split()[-1] for line in user.splitlines() if line.startswith("Product ")]
+        return {
+            "summaries": {l: f"Summary of {l}" for l in labels},
+            "matrix": [{"dimension": d, "values": {l: f"{d} {l}" for l in labels}, "cites": {l: [f"{l}1"] for l in labels}}
+                       for d in ("Battery", "Price", "Weight")],
+            "recommendation": f"{labels[0]} fits best.",
+        }
+
+    async def complete(self, system, user):
+        self.calls += 1
+        return "fallback recommendation"
+
+
+def fakes(web_sources, complete_json, complete) -> ExitStack:
+    """Fake web research and LLM calls; the real functions are restored when the block exits."""
+    stack = ExitStack()
+    stack.enter_context(patch.object(cs, "gather_web_sources", web_sources))
+    stack.enter_context(patch.object(gs, "groq_complete_json_async", complete_json))
+    stack.enter_context(patch.object(gs, "groq_complete_async", complete))
+    return stack
+
+
+def test_fan_out(latency=0.05, sizes=(2, 3, 4, 6)):
+    print(f"📊 per-product research {latency:.2f}s, concurrency cap {cs.COMPARE_CONCURRENCY}\n" + "=" * 60)
+    for n in sizes:
+        web, llm = FakeWeb(latency), FakeLLM()
+        topics = cs.label_topics([{"primary": f"Phone{i}"} for i in range(n)])
+        with fakes(web.sources, llm.complete_json, llm.complete):
+            t0 = time.perf_counter()
+            out = asyncio.run(cs.compare_products("Which has the best battery?", topics))
+            wall = time.perf_counter() - t0
+        print(f"N={n}  wall {wall:.2f}s (serial {n * latency:.2f}s)  peak concurrency {web.peak}  LLM calls {llm.calls}")
+        assert web.peak <= cs.COMPARE_CONCURRENCY
+        assert llm.calls == 1
+        assert len(out["products"]) == n
+        assert len(out["matrix"]) == 3 and all(len(r["values"]) == n for r in out["matrix"])
+        # two-product clients read these
+        assert out["matrix"][0]["a_value"] == "Battery A" and out["matrix"][0]["b_cites"] == [0]
+        assert out["A"]["sources"] and out["B"]["summary"].startswith("Summary of B")
+
+
+def test_fallback():
+    llm = FakeLLM()
+
+    async def broken(system, user, max_tokens=800):
+        llm.calls += 1
+        return {"error": "Groq error: bad JSON"}
+
+    with fakes(FakeWeb(0.0).sources, broken, llm.complete):
+        out = asyncio.run(cs.compare_products("q", cs.label_topics([{"primary": f"P{i}"} for i in range(5)])))
+    assert llm.calls == 2, f"fallback made {llm.calls} calls"
+    assert out["comparator"] == "partial" and out["recommendation"] == "fallback recommendation"
+
+
+def test_labels():
+    try:
+        cs.label_topics([{"primary": "only one"}])
+        assert False, "one product accepted"
+    except ValueError:
+        pass
+    topics = cs.label_topics([{"primary": str(i)} for i in range(cs.COMPARE_MAX_PRODUCTS)])
+    assert list(topics) == list(cs.LABELS[:cs.COMPARE_MAX_PRODUCTS])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.3)
+    args = parser.parse_args()
+    test_labels()
+    test_fan_out(args.latency)
+    test_fallback()
+    print("\n🎉 Comparison checks passed")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Groq completion cache (no network): N concurrent identical prompts should
+cost one upstream call, repeats should be served from the cache, and
+failures must never be cached.
+
+    python test/test_completion_cache.py --callers 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+# Add the repo root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault("GROQ_CACHE_PERSIST", "0")
+
+from app.core import groq_service as gs
+
+MESSAGES = [{"role": "system", "content": "You are concise."}, {"role": "user", "content": "Battery life?"}]
+
+
+class FakeUpstream:
+    def __init__(self, latency=0.2, fail=False):
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+
+    async def chat_async(self, messages, model, temperature, max_tokens, response_format=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.fail:
+            raise gs.GroqRateLimited("Rate limit (429): slow down")
+        return f"answer #{self.calls}"
+
+    def chat(self, messages, model, temperature, max_tokens):
+        self.calls += 1
+        time.sleep(self.latency)
+        return f"answer #{self.calls}"
+
+
+def test_single_flight(callers=20):
+    gs.completion_cache.clear()
+    up = FakeUpstream()
+
+    async def burst():
+        t0 = time.perf_counter()
+        answers = await asyncio.gather(*(gs._post_chat_async(MESSAGES) for _ in range(callers)))
+        return answers, time.perf_counter() - t0
+
+    with patch.object(gs, "_request_chat_async", up.chat_async):
+        answers, wall = asyncio.run(burst())
+        t0 = time.perf_counter()
+        again = asyncio.run(gs._post_chat_async(MESSAGES))
+        hit_ms = (time.perf_counter() - t0) * 1000.0
+    print(f"📊 {callers} concurrent identical calls: upstream={up.calls}  wall={wall:.2f}s  cached repeat={hit_ms:.2f} ms")
+    assert up.calls == 1, f"{up.calls} upstream calls"
+    assert len(set(answers)) == 1 and again == answers[0]
+
+
+def test_sync_single_flight(callers=8):
+    gs.completion_cache.clear()
+    up = FakeUpstream()
+    out = []
+    threads = [threading.Thread(target=lambda: out.append(gs._post_chat(MESSAGES))) for _ in range(callers)]
+    with patch.object(gs, "_request_chat", up.chat):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert up.calls == 1, f"threaded callers made {up.calls} upstream calls"
+    assert len(out) == callers and len(set(out)) == 1
+
+
+def test_errors_not_cached():
+    gs.completion_cache.clear()
+    up = FakeUpstream(latency=0.01, fail=True)
+    with patch.object(gs, "_request_chat_async", up.chat_async):
+        msg = asyncio.run(gs.groq_complete_async("sys", "user"))
+    key = gs.completion_key([{"role": "system", "content": "sys"}, {"role": "user", "content": "user"}],
+                            gs.DEFAULT_MODEL, 0.3, 500)
+    assert msg.startswith("Groq error"), msg
+    assert gs.completion_cache.get(key) is None and len(gs.completion_cache) == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--callers", type=int, default=20)
+    args = parser.parse_args()
+    gs.groq_limiter.requests.capacity = gs.groq_limiter.tokens.capacity = 0  # no client-side throttling here
+    os.environ.setdefault("GROQ_API_KEY", "test")
+    test_single_flight(args.callers)
+    test_sync_single_flight()
+    test_errors_not_cached()
+    print("\n🎉 Completion cache checks passed")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Groq rate limiting against a simulated TPM quota (no network): the old
+"sleep 3 s, retry once" policy vs the token-bucket limiter, plus fairness
+between a chatty session and a light one sharing the quota.
+
+    python test/test_groq_rate_limit.py --tpm 60000 --tokens 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Add the repo root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.rate_limit import RateLimiter, TokenBucket, current_session, parse_duration
+
+
+class FakeGroq:
+    """Server-side TPM bucket (starts empty, i.e. mid-minute under load); 429 + retry-after when over."""
+
+    def __init__(self, tpm):
+        self.bucket = TokenBucket(tpm)
+        self.bucket.level = 0.0
+        self.rejected = 0
+        self.served = 0
+
+    async def call(self, tokens):
+        await asyncio.sleep(0.05)  # network + generation
+        self.bucket.refill(time.monotonic())
+        if self.bucket.level < tokens:
+            self.rejected += 1
+            wait = (tokens - self.bucket.level) * 60.0 / self.bucket.capacity
+            return 429, {"retry-after": f"{wait:.2f}", "x-ratelimit-remaining-tokens": str(int(self.bucket.level))}
+        self.bucket.level -= tokens
+        self.served += 1
+        return 200, {"x-ratelimit-remaining-tokens": str(int(self.bucket.level))}
+
+
+async def old_policy(server, tokens):
+    status, _ = await server.call(tokens)
+    if status == 429:
+        await asyncio.sleep(3)
+        status, _ = await server.call(tokens)
+    return status == 200
+
+
+async def limited(server, limiter, tokens, retries=2):
+    for _ in range(retries + 1):
+        reserved = await limiter.acquire(tokens)
+        status, headers = await server.call(tokens)
+        limiter.observe(status, headers)
+        if status == 200:
+            limiter.settle(reserved, tokens)
+            return True
+    return False
+
+
+async def run(policy, tpm, tokens, heavy, light):
+    server = FakeGroq(tpm)
+    limiter = RateLimiter(rpm=0, tpm=tpm)
+    limiter.tokens.level = 0.0  # same starting point as the server
+    done_at = {"heavy": [], "light": []}
+    t0 = time.perf_counter()
+
+    async def one(session):
+        current_session.set(session)
+        ok = await (old_policy(server, tokens) if policy == "old" else limited(server, limiter, tokens))
+        if ok:
+            done_at[session].append(time.perf_counter() - t0)
+
+    async def burst(session, n, delay):
+        await asyncio.sleep(delay)
+        await asyncio.gather(*(asyncio.create_task(one(session)) for _ in range(n)))
+
+    await asyncio.gather(burst("heavy", heavy, 0.0), burst("light", light, 0.2))
+    wall = time.perf_counter() - t0
+    return server, done_at, wall
+
+
+def test_limiter(tpm=240000, tokens=100, heavy=40, light=5):
+    quota_rps = tpm / 60.0 / tokens
+    print(f"📊 {heavy}+{light} calls x {tokens} tokens, quota {quota_rps:.0f} calls/s\n" + "=" * 60)
+    results = {}
+    for policy in ("old", "limiter"):
+        server, done_at, wall = asyncio.run(run(policy, tpm, tokens, heavy, light))
+        ok = len(done_at["heavy"]) + len(done_at["light"])
+        light_p50 = sorted(done_at["light"])[len(done_at["light"]) // 2] if done_at["light"] else float("nan")
+        results[policy] = (server.rejected, ok, light_p50)
+        print(f"{policy:<8} ok={ok:3d}/{heavy + light}  429s={server.rejected:3d}  "
+              f"{ok / wall:5.1f} calls/s  light session p50 done at {light_p50:5.2f}s")
+
+    rejected, ok, light_p50 = results["limiter"]
+    assert ok == heavy + light, f"limiter dropped {heavy + light - ok} calls"
+    assert rejected <= 1, f"limiter hit {rejected} 429s"
+    # round-robin: the light session is served long before the heavy backlog drains
+    assert light_p50 < (heavy + light) / quota_rps / 2, "light session waited behind the heavy backlog"
+
+
+def test_parse_duration():
+    cases = {"7.66s": 7.66, "2m59.56s": 179.56, "120ms": 0.12, "3": 3.0, "1h2m": 3720.0}
+    for text, seconds in cases.items():
+        assert abs(parse_duration(text) - seconds) < 1e-6, text
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tpm", type=float, default=60000)
+    parser.add_argument("--tokens", type=int, default=100)
+    args = parser.parse_args()
+    test_parse_duration()
+    test_limiter(args.tpm, args.tokens)
+    print("\n🎉 Rate limiter checks passed")
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+BM25 + RRF: pytest checks exact-term retrieval and fusion on a small catalog
+of near-identical product spec sheets; run as a script for hybrid vs
+dense-only hit rates (needs the embedding model) and BM25 query latency on a
+large corpus:
+
+    python test/test_hybrid_retrieval.py --products 300 --latency-chunks 50000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+# Add the repo root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.bm25 import BM25Index, rrf_fuse
+
+BRANDS = ["EDX", "Nova", "Zenith", "Orbit", "Pulse", "Vertex", "Lumen", "Aero"]
+LINES = ["Pro", "Max", "Lite", "Ultra", "Neo", "Plus"]
+FILLER = (
+    "Designed for everyday use, it offers a smooth experience, reliable connectivity "
+    "and a premium build. Customers appreciate the long software support and the "
+    "comfortable grip. The package includes a charger, a cable and a protective case."
+)
+
+
+def make_catalog(n, seed=0):
+    """[(chunk, questions)] — one spec chunk per product, each with labelled questions."""
+    rng = random.Random(seed)
+    seen, items = set(), []
+    while len(items) < n:
+        name = f"{rng.choice(BRANDS)} {rng.choice(LINES)} {rng.randint(2, 99)}"
+        if name in seen:
+            continue
+        seen.add(name)
+        battery = rng.choice(range(3000, 6500, 50))
+        sku = f"{name.split()[0][:2].upper()}-{rng.randint(1000, 9999)}"
+        screen = rng.choice(["6.1", "6.4", "6.7", "6.9"])
+        ram = rng.choice([4, 6, 8, 12, 16])
+        chunk = (
+            f"The {name} (model {sku}) smartphone features a {battery}mAh battery, "
+            f"a {screen}-inch display and {ram}GB RAM. {FILLER}"
+        )
+        questions = [
+            f"What is the battery capacity of the {name}?",
+            f"Which phone is model {sku}?",
+            f"Which phone has a {battery}mAh battery and {ram}GB RAM?",
+        ]
+        items.append((chunk, questions))
+    return items
+
+
+def hit_rates(retrieve, chunks, labelled, ks=(1, 5)):
+    hits = {k: 0 for k in ks}
+    for gold, q in labelled:
+        got = [c for c, _ in retrieve(q, max(ks))]
+        for k in ks:
+            hits[k] += chunks[gold] in got[:k]
+    return {k: hits[k] / len(labelled) for k in ks}
+
+
+def hybrid_benchmark(n_products=300):
+    try:
+        from app.core.rag_service import RagIndex
+        from app.core.embedding_service import get_model, DEFAULT_EMBED_MODEL
+        model = get_model(DEFAULT_EMBED_MODEL)
+    except Exception as e:
+        print(f"⚠️ Dense comparison skipped (embedding model unavailable: {e})")
+        return
+
+    catalog = make_catalog(n_products)
+    chunks = [c for c, _ in catalog]
+    labelled = [(i, q) for i, (_, qs) in enumerate(catalog) for q in qs]
+    vecs = model.encode(chunks, normalize_embeddings=True, convert_to_numpy=True).astype("float32")
+
+    print(f"📊 Hit rate — {len(chunks)} spec chunks, {len(labelled)} labelled questions\n" + "=" * 60)
+    results = {}
+    for label, hybrid in (("dense", False), ("hybrid", True)):
+        idx = RagIndex(hybrid=hybrid)
+        idx.chunks = chunks
+        idx._set_vectors(vecs)
+        t0 = time.perf_counter()
+        results[label] = hit_rates(idx.retrieve, chunks, labelled)
+        ms = (time.perf_counter() - t0) * 1000.0 / len(labelled)
+        print(f"{label:<8} hit@1={results[label][1]:.3f}  hit@5={results[label][5]:.3f}  {ms:6.2f} ms/query")
+
+    better = results["hybrid"][5] >= results["dense"][5]
+    print("✅ Hybrid matches or beats dense-only" if better else "❌ Hybrid underperforms dense-only")
+
+
+def latency_benchmark(n_chunks=50000, words=200, n_queries=200, budget_ms=5.0):
+    rng = np.random.default_rng(0)
+    vocab = np.array([f"w{i}" for i in range(30000)])
+    # Zipf-ish term frequencies, like real text
+    probs = 1.0 / np.arange(1, len(vocab) + 1)
+    probs /= probs.sum()
+    chunks = [" ".join(vocab[rng.choice(len(vocab), size=words, p=probs)]) for _ in range(n_chunks)]
+    queries = [" ".join(vocab[rng.choice(len(vocab), size=6, p=probs)]) + " EDX Pro 5000mAh" for _ in range(n_queries)]
+
+    bm25 = BM25Index()
+    t0 = time.perf_counter()
+    bm25.build(chunks)
+    build_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for q in queries:
+        bm25.search(q, 50)
+    ms = (time.perf_counter() - t0) * 1000.0 / n_queries
+    print(f"\n⏱️ BM25 on {n_chunks} chunks: build {build_s:.1f}s, {bm25.nbytes() / 1e6:.1f} MB, {ms:.2f} ms/query")
+    print(f"✅ Under {budget_ms} ms/query" if ms < budget_ms else f"❌ Over {budget_ms} ms/query")
+
+
+def bm25_retrieve(bm25, chunks):
+    def retrieve(q, k):
+        idx, scores = bm25.search(q, k)
+        return [(chunks[i], float(s)) for i, s in zip(idx, scores)]
+    return retrieve
+
+
+def test_bm25_exact_terms():
+    catalog = make_catalog(60)
+    chunks = [c for c, _ in catalog]
+    bm25 = BM25Index()
+    bm25.build(chunks)
+    retrieve = bm25_retrieve(bm25, chunks)
+    # model numbers are rare terms: BM25 puts the right sheet first
+    by_sku = [(i, qs[1]) for i, (_, qs) in enumerate(catalog)]
+    assert hit_rates(retrieve, chunks, by_sku, ks=(1,))[1] == 1.0
+    by_specs = [(i, qs[2]) for i, (_, qs) in enumerate(catalog)]
+    assert hit_rates(retrieve, chunks, by_specs, ks=(5,))[5] >= 0.9
+
+
+def test_bm25_search_matches_scores():
+    chunks = [c for c, _ in make_catalog(40, seed=1)]
+    bm25 = BM25Index()
+    bm25.build(chunks)
+    for q in ("Nova Pro battery", "6.7-inch display 8GB RAM", "no such words"):
+        scores = bm25.scores(q)
+        idx, got = bm25.search(q, 5)
+        assert np.all(got > 0)
+        assert np.allclose(got, np.sort(scores[scores > 0])[::-1][:5])
+        assert np.allclose(scores[idx], got)
+
+
+def test_rrf_fuse():
+    assert rrf_fuse([[0, 1, 2], [2, 0, 1]]) == [0, 2, 1]
+    # an id ranked by one list only still makes it in, behind consistent ones
+    assert rrf_fuse([[3, 4], [4, 5]]) == [4, 3, 5]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=300)
+    parser.add_argument("--latency-chunks", type=int, default=50000)
+    args = parser.parse_args()
+    hybrid_benchmark(args.products)
+    latency_benchmark(args.latency_chunks)
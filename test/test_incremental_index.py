@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Incremental index updates vs full rebuilds: appending a small document to a
+large index and removing it again should give the same results as
+rebuilding from scratch (vector backends and BM25), and retrieval running while documents come and go
+should always return matching chunk text and citations. Run as a script for
+the cost benchmark (time proportional to the document, not the index),
+including BM25 over synthetic chunk text for the hybrid path:
+
+    python test/test_incremental_index.py --base 200000 --doc 200 --bm25-base 50000
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+# Add the repo root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.bm25 import BM25Index
+from app.core.vector_index import ExactIndex, IVFIndex
+import app.core.rag_service as rag_service
+
+
+def unit_rows(rng, n, dim):
+    x = rng.normal(size=(n, dim)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def test_same_results_as_rebuild(n=2000, m=100, dim=32, queries=20):
+    rng = np.random.default_rng(0)
+    base, doc = unit_rows(rng, n, dim), unit_rows(rng, m, dim)
+    Q = unit_rows(rng, queries, dim)
+
+    inc = ExactIndex()
+    inc.build(base)
+    inc.add(doc)
+    full = ExactIndex()
+    full.build(np.concatenate([base, doc]))
+    for q in Q:
+        assert np.array_equal(inc.search(q, 10)[0], full.search(q, 10)[0])
+
+    inc.remove(np.arange(n, n + m))
+    only_base = ExactIndex()
+    only_base.build(base)
+    for q in Q:
+        assert np.array_equal(inc.search(q, 10)[0], only_base.search(q, 10)[0])
+
+
+def make_chunks(rng, n, words=120, vocab=20000):
+    """Zipf-ish synthetic chunk text, like real documents."""
+    terms = np.array([f"w{i}" for i in range(vocab)])
+    probs = 1.0 / np.arange(1, vocab + 1)
+    probs /= probs.sum()
+    return [" ".join(terms[rng.choice(vocab, size=words, p=probs)]) for _ in range(n)]
+
+
+def test_bm25_same_scores_as_rebuild(n=600, m=40):
+    rng = np.random.default_rng(2)
+    base, docs = make_chunks(rng, n, 40, 2000), [make_chunks(rng, m, 40, 2000) for _ in range(6)]
+    inc = BM25Index()
+    inc.build(base)
+    rows, live = n, list(range(n))
+    for j, doc in enumerate(docs):
+        inc.add(doc)
+        live += list(range(rows, rows + m))
+        if j % 2:  # drop every other document again
+            inc.remove(np.arange(rows, rows + m), doc)
+            live = live[:-m]
+        rows += m
+    inc.remove(np.arange(0, 50), base[:50])
+    live = live[50:]
+
+    texts = base + [c for doc in docs for c in doc]
+    full = BM25Index()
+    full.build([texts[i] for i in live])
+    for q in ("w1 w5 w300", "w7 w1999", "w42"):
+        got, want = inc.scores(q), full.scores(q)
+        assert np.allclose(got[live], want, rtol=1e-4, atol=1e-5)
+        assert not np.any(np.delete(got, live)), "removed rows still score"
+    assert len(inc.segments) < 6  # small segments were merged
+
+
+class _WordHashModel:
+    """Bag-of-words hashing encoder, so RagIndex runs without the embedding model."""
+    dim = 64
+
+    def encode(self, texts, normalize_embeddings=True, convert_to_numpy=True, **kw):
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for r, t in enumerate(texts):
+            for w in t.lower().split():
+                out[r, sum(map(ord, w)) * 2654435761 % self.dim] += 1.0
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-9)
+
+
+def test_retrieve_during_updates(monkeypatch):
+    model = _WordHashModel()
+    monkeypatch.setattr(rag_service, "get_model", lambda name=None: model)
+    idx = rag_service.RagIndex(hybrid=True)
+
+    def add(d):
+        chunks = [f"doc{d} part{j} battery screen warranty" for j in range(30)]
+        idx.add(f"doc{d}", chunks, model.encode(chunks))
+
+    for d in range(3):
+        add(d)
+    stop, errors = threading.Event(), []
+
+    def churn():
+        d = 3
+        while not stop.is_set():
+            add(d)
+            idx.remove(f"doc{d - 2}")  # tombstones, and compacts now and then
+            d += 1
+
+    writer = threading.Thread(target=churn)
+    writer.start()
+    try:
+        for _ in range(300):
+            for chunk, _, cite in idx.retrieve_cited("battery warranty", k=5):
+                if not chunk.startswith(f"{cite['doc_id']} "):
+                    errors.append((chunk, cite))
+    finally:
+        stop.set()
+        writer.join()
+    assert not errors, errors[:3]
+
+
+def benchmark(n=200000, m=200, dim=384, docs=20):
+    """Average time to append `docs` documents of m rows, incremental vs rebuild per document."""
+    rng = np.random.default_rng(1)
+    base = unit_rows(rng, n, dim)
+    new_docs = [unit_rows(rng, m, dim) for _ in range(docs)]
+
+    print(f"\n⏱️ Appending {docs} docs x {m} rows to {n} rows (dim {dim})\n" + "=" * 60)
+    for label, make in (("exact", ExactIndex), ("ivf", IVFIndex)):
+        idx = make()
+        idx.build(base)
+        t0 = time.perf_counter()
+        for d in new_docs:
+            idx.add(d)
+        add_ms = (time.perf_counter() - t0) * 1000.0 / docs
+
+        t0 = time.perf_counter()
+        for j in range(docs):
+            idx.remove(np.arange(n + j * m, n + (j + 1) * m))
+        rm_ms = (time.perf_counter() - t0) * 1000.0 / docs
+
+        # the old path: concatenate everything and rebuild (one document's worth)
+        t0 = time.perf_counter()
+        rebuilt = make()
+        rebuilt.build(np.concatenate([base, new_docs[0]]))
+        rebuild_ms = (time.perf_counter() - t0) * 1000.0
+
+        faster = add_ms * 5 < rebuild_ms
+        print(f"{label:<6} add {add_ms:8.2f} ms  remove {rm_ms:6.2f} ms  rebuild {rebuild_ms:9.1f} ms  "
+              f"{'✅' if faster else '❌'} {rebuild_ms / max(add_ms, 1e-6):.0f}x")
+
+
+def bm25_benchmark(n=50000, m=200, docs=20):
+    """Same for the BM25 half of hybrid retrieval: add / remove a document vs a rebuild, and query latency."""
+    rng = np.random.default_rng(3)
+    base = make_chunks(rng, n)
+    new_docs = [make_chunks(rng, m) for _ in range(docs)]
+    queries = [" ".join(c.split()[:6]) for c in make_chunks(rng, 100)]
+
+    print(f"\n⏱️ BM25: appending {docs} docs x {m} chunks to {n} chunks\n" + "=" * 60)
+    bm25 = BM25Index()
+    t0 = time.perf_counter()
+    bm25.build(base)
+    rebuild_ms = (time.perf_counter() - t0) * 1000.0 * (n + m) / n  # one document's worth on top
+
+    t0 = time.perf_counter()
+    for d in new_docs:
+        bm25.add(d)
+    add_ms = (time.perf_counter() - t0) * 1000.0 / docs
+    t0 = time.perf_counter()
+    for q in queries:
+        bm25.search(q, 50)
+    query_ms = (time.perf_counter() - t0) * 1000.0 / len(queries)
+    t0 = time.perf_counter()
+    for j, d in enumerate(new_docs):
+        bm25.remove(np.arange(n + j * m, n + (j + 1) * m), d)
+    rm_ms = (time.perf_counter() - t0) * 1000.0 / docs
+
+    faster = add_ms * 5 < rebuild_ms
+    print(f"bm25   add {add_ms:8.2f} ms  remove {rm_ms:6.2f} ms  rebuild {rebuild_ms:9.1f} ms  "
+          f"{'✅' if faster else '❌'} {rebuild_ms / max(add_ms, 1e-6):.0f}x")
+    print(f"bm25   {len(bm25.segments)} segments, {query_ms:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base", type=int, default=200000)
+    parser.add_argument("--doc", type=int, default=200)
+    parser.add_argument("--bm25-base", type=int, default=50000)
+    args = parser.parse_args()
+    test_same_results_as_rebuild()
+    test_bm25_same_scores_as_rebuild()
+    print("✅ add/remove match a full rebuild")
+    benchmark(args.base, args.doc)
+    bm25_benchmark(args.bm25_base, args.doc)
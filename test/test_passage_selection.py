@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Extractive compression of scraped pages: the old "first 1800 characters of
+each page" vs relevance-ranked passages packed into a token budget. Pages
+open with navigation/boilerplate and bury the answer further down, like
+real product pages.
+
+    python test/test_passage_selection.py --budget 900
+    python test/test_passage_selection.py --model     # BM25 + MiniLM ranking
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+# Add the repo root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.passages import select_passages, count_tokens
+
+BOILERPLATE = [
+    "Home Shop Deals Support Account Cart Sign in",
+    "We use cookies to improve your experience on our site. By continuing to browse you agree to our cookie policy.",
+    "Free shipping on orders over $50. Sign up for our newsletter and get 10% off your first order today.",
+    "Customers who viewed this item also viewed these related products from our catalog of accessories.",
+    "Our team is available around the clock to help with orders, returns and warranty questions.",
+]
+FILLER = [
+    "The {p} comes in three colors and ships with a quick start guide and a USB-C cable.",
+    "Reviewers praised the design of the {p} and its lightweight aluminium frame.",
+    "The {p} display is bright enough for outdoor use and supports high refresh rates.",
+    "Setup of the {p} takes a few minutes using the companion app on iOS or Android.",
+    "The speakers on the {p} are loud and clear, with a dedicated bass port.",
+]
+QUESTIONS = [
+    ("How long does the battery last?", "The {p} battery lasts up to {v} hours on a single charge.", "hours"),
+    ("What is the weight?", "The {p} weighs {v} grams including the battery.", "grams"),
+    ("How long is the warranty?", "The {p} includes a {v} month limited warranty from the manufacturer.", "month"),
+]
+
+
+def make_page(rng, product, fact, filler_lines=30):
+    lines = [rng.choice(BOILERPLATE) for _ in range(12)]
+    body = [rng.choice(FILLER).format(p=product) for _ in range(filler_lines)]
+    body.insert(rng.randrange(filler_lines // 2, filler_lines), fact)
+    return "\n".join(lines + body + [rng.choice(BOILERPLATE) for _ in range(6)])
+
+
+def first_chars(pages, limit=1800):
+    """The previous behaviour: first `limit` characters of each page, cut at a sentence."""
+    out = []
+    for url, text in pages:
+        t = " ".join(text.split())
+        if len(t) > limit:
+            cut = t[:limit]
+            last = cut.rfind(". ")
+            t = cut[:last + 1] if last > 400 else cut
+        out.append((url, t))
+    return out
+
+
+def test_selection(budget=900, use_embeddings=False, trials=30):
+    rng = random.Random(0)
+    stats = {"old": [0, 0], "new": [0, 0]}  # [answers found, tokens]
+    ms = 0.0
+    for t in range(trials):
+        question, fact, unit = QUESTIONS[t % len(QUESTIONS)]
+        value = str(rng.randint(10, 99))
+        pages = [(f"https://shop{i}.example/edx", make_page(rng, "EDX Pro", fact.format(p="EDX Pro", v=value)))
+                 for i in range(3)]
+        old = first_chars(pages)
+        t0 = time.perf_counter()
+        new = select_passages(question, pages, budget=budget, query=f"EDX Pro {question}", use_embeddings=use_embeddings)
+        ms += (time.perf_counter() - t0) * 1000.0
+        for label, got in (("old", old), ("new", new)):
+            text = " ".join(x for _, x in got)
+            stats[label][0] += f"{value} {unit}" in text
+            stats[label][1] += int(count_tokens([text])[0])
+
+    print(f"📊 {trials} questions x 3 pages, budget {budget} tokens\n" + "=" * 60)
+    for label in ("old", "new"):
+        found, tokens = stats[label]
+        print(f"{label:<4} answer in prompt {found:3d}/{trials}   avg source tokens {tokens / trials:7.1f}")
+    print(f"⏱️ selection {ms / trials:.1f} ms per question")
+    assert stats["new"][0] == trials, f"answer lost in {trials - stats['new'][0]} of {trials} prompts"
+    assert stats["new"][1] <= stats["old"][1], "selected sources are larger than the first-1800-chars cut"
+
+
+def test_budget_and_sources(budget=200):
+    rng = random.Random(1)
+    names = ["EDX Pro", "EDX Lite", "EDX Max"]
+    pages = [(f"https://s{i}.example", make_page(rng, name, f"The {name} battery lasts up to {20 + i} hours."))
+             for i, name in enumerate(names)]
+    out = select_passages("battery life", pages, budget=budget, use_embeddings=False)
+    used = int(count_tokens([t for _, t in out]).sum())
+    assert [u for u, _ in out] == [u for u, _ in pages], [u for u, _ in out]
+    assert used <= budget + 8, f"{used} tokens"  # " ... " joins
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=int, default=900)
+    parser.add_argument("--model", action="store_true", help="rank with MiniLM embeddings too")
+    args = parser.parse_args()
+    test_selection(args.budget, use_embeddings=args.model)
+    test_budget_and_sources()
+    print("\n🎉 Passage selection checks passed")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Ingestion parse cost: the old path (is_scanned + extraction, two full parses)
+vs ParsedPdf.stream(), which extracts each page once for OCR routing, topics
+and chunking. The test checks both paths agree; run as a script for timings.
+
+    python test/test_pdf_parse.py [path/to/file.pdf]
+"""
+import asyncio
+import os
+import sys
+import time
+
+# Add the repo root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.pdf_service import ParsedPdf, iter_pdf_pages, extract_topics_heuristic, SCANNED_MIN_CHARS
+from app.core.ocr_service import is_scanned
+
+DEFAULT_PDF = os.path.join(os.path.dirname(__file__), "..", "app", "data", "data.pdf")
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def two_parses(data):
+    scanned = is_scanned(data)
+    pages = [p for _, batch in iter_pdf_pages(data) for p in batch]
+    return scanned, pages
+
+
+def shared_parse(data):
+    async def run():
+        with ParsedPdf(data) as parsed:
+            pages = [p async for _, batch in parsed.stream() for p in batch]
+            # is_scanned's rule, answered from the per-page counts the parse recorded
+            scanned = not parsed.n_pages or float(parsed.char_counts.mean()) < SCANNED_MIN_CHARS
+            return scanned, pages, extract_topics_heuristic(parsed.head(20000))
+    return asyncio.run(run())
+
+
+def test_shared_parse_matches_two_parses(path=DEFAULT_PDF):
+    data = read(path)
+    old_scanned, old_pages = two_parses(data)
+    new_scanned, new_pages, _ = shared_parse(data)
+    assert new_scanned == old_scanned, "OCR decision differs"
+    assert new_pages == old_pages, "page text differs"
+
+
+def benchmark(path=DEFAULT_PDF, repeat=3):
+    data = read(path)
+
+    def best(fn):
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            out = fn(data)
+            times.append(time.perf_counter() - t0)
+        return min(times), out
+
+    old_s, _ = best(two_parses)
+    new_s, (_, pages, topic) = best(shared_parse)
+    print(f"📄 {os.path.basename(path)}: {len(pages)} pages, topic={topic['primary']!r}")
+    print(f"two parses (is_scanned + extract): {old_s * 1000:8.1f} ms")
+    print(f"ParsedPdf.stream():                {new_s * 1000:8.1f} ms  ({old_s / max(new_s, 1e-9):.2f}x)")
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PDF
+    test_shared_parse_matches_two_parses(path)
+    benchmark(path)
+    print("\n🎉 Single-parse check passed")
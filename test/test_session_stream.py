@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Streaming answers vs session memory pressure: a session whose answer is
+still streaming must keep its RagIndex in memory while other visitors'
+requests push the manager over its budget, and must be released (spillable
+again) once the stream ends.
+
+    python test/test_session_stream.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+import numpy as np
+
+# Add the repo root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app.api.routes as routes
+import app.core.rag_service as rag_service
+from app.core.orchestrator import Orchestrator
+from app.core.session_manager import SessionManager
+
+
+class _WordHashModel:
+    """Bag-of-words hashing encoder, so RagIndex runs without the embedding model."""
+    dim = 64
+
+    def encode(self, texts, normalize_embeddings=True, convert_to_numpy=True, **kw):
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for r, t in enumerate(texts):
+            for w in t.lower().split():
+                out[r, sum(map(ord, w)) * 2654435761 % self.dim] += 1.0
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-9)
+
+
+def _give_index(orch, name):
+    orch.rag_enabled = True
+    orch.rag_index = rag_service.RagIndex()
+    orch.rag_index.build(f"{name} battery lasts ten hours. " * 200)
+
+
+async def _fake_stream(self, question):
+    for i in range(4):
+        await asyncio.sleep(0)
+        yield "token", {"text": f"t{i}", "indexed": self.rag_index is not None}
+
+
+def test_stream_keeps_session_under_budget_pressure():
+    manager = SessionManager(memory_mb=0.0001, spill_dir=tempfile.mkdtemp())  # any index is over budget
+    sid = "streaming-session"
+    with patch.object(rag_service, "get_model", lambda name=None: _WordHashModel()), \
+            patch.object(routes, "sessions", manager), \
+            patch.object(Orchestrator, "answer_dual_stream", _fake_stream):
+        with manager.use(sid) as orch:
+            _give_index(orch, sid)
+
+        async def run():
+            events = []
+            async for chunk in routes._ask_stream_response(sid, "battery?").body_iterator:
+                events.append(chunk)
+                # another visitor's request lands mid-stream and forces the budget check
+                with manager.use(f"other-session-{len(events)}") as other:
+                    _give_index(other, "other")
+            return events
+
+        events = asyncio.run(run())
+
+    assert len(events) == 4
+    assert all('"indexed": true' in e for e in events), events
+    assert manager.spills >= len(events)  # the other sessions were spilled instead
+    sess = manager._sessions[sid]
+    assert sess.active == 0
+    assert sess.spill_path is not None  # released after the stream, so spilled by the final release
+
+
+if __name__ == "__main__":
+    test_stream_keeps_session_under_budget_pressure()
+    print("✅ Streaming session held in memory under budget pressure")
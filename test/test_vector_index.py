@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+ANN backends vs exact search: pytest checks exact results and IVF recall on
+a small corpus; run as a script for the Recall@k / latency benchmark
+(IVF, HNSW if installed):
+
+    python test/test_vector_index.py --n 50000 --dim 384 --k 8
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the repo root to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.vector_index import ExactIndex, IVFIndex, HNSWIndex, hnswlib
+
+
+def make_corpus(n, dim, n_queries, clusters=200, seed=0):
+    """Clustered unit vectors (closer to real chunk embeddings than uniform noise)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype("float32")
+    vecs = centers[rng.integers(0, clusters, n)] + 0.6 * rng.normal(size=(n, dim)).astype("float32")
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    queries = centers[rng.integers(0, clusters, n_queries)] + 0.6 * rng.normal(size=(n_queries, dim)).astype("float32")
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vecs.astype("float32"), queries.astype("float32")
+
+
+def run(index, queries, k, truth=None):
+    t0 = time.perf_counter()
+    results = [index.search(q, k)[0] for q in queries]
+    ms = (time.perf_counter() - t0) * 1000.0 / len(queries)
+    if truth is None:
+        return results, ms, 1.0
+    recall = np.mean([len(set(r.tolist()) & set(t.tolist())) / k for r, t in zip(results, truth)])
+    return results, ms, recall
+
+
+def benchmark(n=20000, dim=384, k=8, n_queries=200):
+    vecs, queries = make_corpus(n, dim, n_queries)
+    print(f"📊 Recall@{k} vs exact — n={n}, dim={dim}, queries={n_queries}\n" + "=" * 60)
+
+    exact = ExactIndex()
+    exact.build(vecs)
+    truth, exact_ms, _ = run(exact, queries, k)
+    print(f"exact                 recall=1.000  {exact_ms:7.3f} ms/query")
+
+    ivf = IVFIndex()
+    t0 = time.perf_counter()
+    ivf.build(vecs)
+    print(f"ivf build: {time.perf_counter() - t0:.2f}s, nlist={ivf.centroids.shape[0]}")
+    for nprobe in (1, 4, 8, 16, 32):
+        ivf.nprobe = nprobe
+        _, ms, recall = run(ivf, queries, k, truth)
+        print(f"ivf nprobe={nprobe:<3}        recall={recall:.3f}  {ms:7.3f} ms/query")
+
+    if hnswlib is None:
+        print("hnsw                  skipped (pip install hnswlib)")
+    else:
+        hnsw = HNSWIndex()
+        t0 = time.perf_counter()
+        hnsw.build(vecs)
+        print(f"hnsw build: {time.perf_counter() - t0:.2f}s")
+        for ef in (16, 32, 64, 128):
+            hnsw.ef = ef
+            _, ms, recall = run(hnsw, queries, k, truth)
+            print(f"hnsw ef={ef:<4}          recall={recall:.3f}  {ms:7.3f} ms/query")
+
+
+def test_exact_matches_brute_force():
+    vecs, queries = make_corpus(500, 32, 10)
+    exact = ExactIndex()
+    exact.build(vecs)
+    for q in queries:
+        idx, sims = exact.search(q, 5)
+        want = np.argsort(-(vecs @ q), kind="stable")[:5]
+        assert set(idx.tolist()) == set(want.tolist())
+        assert np.all(np.diff(sims) <= 1e-6)  # best first
+
+
+def test_ivf_recall():
+    vecs, queries = make_corpus(3000, 64, 50, clusters=40)
+    exact = ExactIndex()
+    exact.build(vecs)
+    truth, _, _ = run(exact, queries, 8)
+    ivf = IVFIndex()
+    ivf.build(vecs)
+    ivf.nprobe = 16
+    _, _, recall = run(ivf, queries, 8, truth)
+    assert recall >= 0.8, f"IVF recall low: {recall:.3f}"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--k", type=int, default=8)
+    ap.add_argument("--queries", type=int, default=200)
+    args = ap.parse_args()
+    benchmark(args.n, args.dim, args.k, args.queries)